@@ -0,0 +1,151 @@
+'''
+Max-min fair split of slice bandwidth. In the default
+consume phase every client takes min(equal share, usage
+left) in client order, and a request that no longer fits
+the slice level gets nothing. FairAllocation instead
+water-fills the level of every slice over all of its
+consuming clients at once, so bandwidth a client cannot
+use goes to the others and the result does not depend
+on the order of the clients
+'''
+import numpy as np
+
+from ClientPopulation import group_cumsum
+
+
+def water_fill(groups, demand, capacity, lower=None, upper=None, weights=None):
+    '''
+    Weighted max-min fair allocation of capacity[g] among
+    the entries of each group g. Entry i gets
+        clip(weights[i]*level, lower[i], min(demand[i], upper[i]))
+    where the water level of each group is the one that uses
+    up its capacity, or fills every demand when the capacity
+    is more than enough. When the capacity does not even cover
+    the lower bounds they are scaled down to fit. Entries of
+    weight 0 keep their lower bound until every other entry
+    of the group is full, then share what is left equally.
+
+    The level is found from the sorted breakpoints of the
+    piecewise linear total, O(n log n) over all the groups.
+    The running sums use ClientPopulation.group_cumsum(), so a
+    group's allocation does not depend on the other groups
+    '''
+    groups = np.asarray(groups, dtype=np.int64)
+    capacity = np.asarray(capacity, dtype=np.float64)
+    n_groups = capacity.size
+    high = np.maximum(np.asarray(demand, dtype=np.float64), 0)
+    if upper is not None:
+        high = np.minimum(high, upper)
+    low = np.zeros(groups.size) if lower is None else np.minimum(lower, high)
+    weights = np.ones(groups.size) if weights is None else np.asarray(weights, dtype=np.float64)
+    if groups.size == 0:
+        return np.zeros(0)
+    zero = weights == 0
+    if zero.any():
+        return water_fill_zero_weights(groups, high, capacity, low, weights, zero)
+
+    low_total = np.bincount(groups, weights=low, minlength=n_groups)
+    high_total = np.bincount(groups, weights=high, minlength=n_groups)
+
+    ## Raising the level past low/w turns an entry from its
+    ## lower bound to w*level, past high/w to its upper bound
+    breakpoints = np.concatenate((low / weights, high / weights))
+    event_groups = np.concatenate((groups, groups))
+    order = np.lexsort((breakpoints, event_groups))
+    breakpoints, event_groups = breakpoints[order], event_groups[order]
+    constant = group_cumsum(event_groups, np.concatenate((-low, high))[order])
+    constant += low_total[event_groups]
+    slope = group_cumsum(event_groups, np.concatenate((weights, -weights))[order])
+
+    ## The total is continuous, so its value at a breakpoint
+    ## can be taken with the events up to that one applied
+    total = constant + slope * breakpoints
+    reached = np.flatnonzero(total >= capacity[event_groups])
+    crossing, first = np.unique(event_groups[reached], return_index=True)
+    at = reached[first]
+    previous = np.maximum(at - 1, 0)
+    level = np.full(n_groups, np.inf)
+    ## Crossing at the first breakpoint of a group means the
+    ## lower bounds alone use up the capacity
+    level[crossing] = breakpoints[at]
+    inside = (at > 0) & (event_groups[previous] == crossing)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        level[crossing[inside]] = ((capacity[crossing[inside]] - constant[previous[inside]])
+                                   / slope[previous[inside]])
+
+    allocation = np.clip(weights * level[groups], low, high)
+    ## Lower bounds that do not fit are scaled down
+    short = low_total > capacity
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(short, capacity / low_total, 1.0)
+    allocation = np.where(short[groups], low * scale[groups], allocation)
+    ## Rounding of the running sums must not take more than
+    ## the capacity
+    used = np.bincount(groups, weights=allocation, minlength=n_groups)
+    over = used > capacity
+    if over.any():
+        shrink = np.ones(n_groups)
+        shrink[over] = capacity[over] / used[over]
+        allocation *= shrink[groups]
+    return allocation
+
+
+def water_fill_zero_weights(groups, high, capacity, low, weights, zero):
+    '''
+    water_fill() in two passes: the weighted entries over the
+    capacity left by the lower bounds of the zero-weight ones,
+    then the zero-weight entries with equal weights over what
+    the weighted entries leave
+    '''
+    n_groups = capacity.size
+    zero_low = np.bincount(groups[zero], weights=low[zero], minlength=n_groups)
+    allocation = np.empty(groups.size)
+    weighted = ~zero
+    allocation[weighted] = water_fill(groups[weighted], high[weighted], np.maximum(capacity - zero_low, 0),
+                                      lower=low[weighted], weights=weights[weighted])
+    left = capacity - np.bincount(groups[weighted], weights=allocation[weighted], minlength=n_groups)
+    allocation[zero] = water_fill(groups[zero], high[zero], np.maximum(left, 0), lower=low[zero])
+    ## Lower bounds that do not fit are scaled down together
+    low_total = np.bincount(groups, weights=low, minlength=n_groups)
+    short = low_total > capacity
+    if short.any():
+        scale = np.ones(n_groups)
+        scale[short] = capacity[short] / low_total[short]
+        allocation = np.where(short[groups], low * scale[groups], allocation)
+    return allocation
+
+
+class FairAllocation:
+    '''
+    Consume phase of ClientPopulation that water-fills every
+    slice level over its consuming clients. A client is never
+    given more than bandwidth_max or its remaining usage, and
+    gets at least bandwidth_guaranteed (or its remaining usage)
+    while the slice can afford it.
+
+    qos_weights maps a qos_class to the weight of the clients
+    of the slices of that class, per-client weights can be
+    given as an array instead
+    '''
+    def __init__(self, qos_weights=None, weights=None):
+        self.qos_weights = qos_weights
+        self.weights = weights
+
+    def client_weights(self, population, indices):
+        if self.weights is not None:
+            return np.asarray(self.weights, dtype=np.float64)[indices]
+        if self.qos_weights is None:
+            return None
+        slice_weights = np.array([self.qos_weights.get(s.qos_class, 1.0)
+                                  for s in population.base_stations[0].slices], dtype=np.float64)
+        return slice_weights[population.subscribed_slice_index[indices]]
+
+    def allocate(self, population, indices, ids, table):
+        '''
+        Bandwidth granted to each of the consuming clients,
+        ids are their slice_ids()
+        '''
+        return water_fill(ids, population.usage_remaining[indices], table['level'],
+                          lower=table['bandwidth_guaranteed'][ids],
+                          upper=table['bandwidth_max'][ids],
+                          weights=self.client_weights(population, indices))
@@ -1,4 +1,6 @@
 class BaseStation:
+    __slots__ = ('pk', 'coverage', 'capacity_bandwidth', 'slices')
+
     def __init__(self, pk, coverage, capacity_bandwidth, slices=None):
         self.pk = pk
         self.coverage = coverage
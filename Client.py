@@ -5,10 +5,16 @@ from utils import distance
 
 
 class Client:
+    __slots__ = ('id', 'x', 'y', 'usage_freq', 'base_station', 'stat_collector',
+                 'subscribed_slice_index', 'mobility_pattern', 'usage_remaining',
+                 'last_usage', 'closest_base_stations', 'connected',
+                 'total_connected_time', 'total_unconnected_time',
+                 'total_request_count', 'total_consume_time', 'total_usage')
+
     def __init__(self, id, x, y,
                  usage_freq,
                  subscribed_slice_index, stat_collector,
-                 base_station=None):
+                 base_station=None, mobility_pattern=None):
         self.id = id
         self.x = x
         self.y = y
@@ -17,6 +23,7 @@ class Client:
         self.base_station = base_station
         self.stat_collector = stat_collector
         self.subscribed_slice_index = subscribed_slice_index
+        self.mobility_pattern = mobility_pattern
         self.usage_remaining = 0
         self.last_usage = 0
         self.closest_base_stations = []
@@ -86,7 +93,7 @@ class Client:
             # print(f'[{int(self.env.now)}] Client_{self.id} [{self.x}, {self.y}] connected to slice={self.get_slice()} @ {self.base_station}')
             return True
         else:
-            self.assign_closest_base_station(exclude=[self.base_station.id])
+            self.assign_closest_base_station(exclude=[self.base_station.pk])
             if self.base_station is not None and self.get_slice().is_avaliable():
                 # handover
                 self.stat_collector.incr_handover_count(self)
@@ -98,6 +105,22 @@ class Client:
             # print(f'[{int(self.env.now)}] Client_{self.id} [{self.x}, {self.y}] connection refused to slice={self.get_slice()} @ {self.base_station}')
             return False
 
+    def assign_closest_base_station(self, exclude=None):
+        '''
+        Hands the client over to the closest base station that
+        covers it and whose slice still accepts a connection.
+        Only the sorted closest_base_stations list is walked,
+        the client stays where it is if no candidate fits
+        '''
+        exclude = exclude or []
+        for d, bs in self.closest_base_stations:
+            if bs.pk in exclude or d > bs.coverage.radius:
+                continue
+            if bs.slices[self.subscribed_slice_index].is_avaliable():
+                self.base_station = bs
+                return bs
+        return None
+
     def disconnect(self):
         if self.connected == False:
             pass
@@ -0,0 +1,634 @@
+'''
+This module keeps the whole client population as
+a struct of arrays. Every per-client attribute of
+Client lives in one contiguous NumPy column, so that
+the Lock/Consume/Release cycle of Client.iter() can
+run as masked vector operations over the active
+subset of clients instead of one Python call per client
+'''
+import copy
+
+import numpy as np
+
+
+class ClientPopulation:
+    def __init__(self, x, y, usage_freq, subscribed_slice_index,
+                 base_stations, stat_collector=None, rng=None,
+                 mobility_index=None, mobility_patterns=()):
+        n_clients = len(x)
+        self.n_clients = n_clients
+        self.base_stations = base_stations
+        self.n_slices = len(base_stations[0].slices) if base_stations else 0
+        self.stat_collector = stat_collector
+        self.association = None
+        self.profiler = None
+        ## Consume phase, see Allocation.FairAllocation
+        self.allocation = None
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.usage_freq = np.asarray(usage_freq, dtype=np.float64)
+        self.subscribed_slice_index = np.asarray(subscribed_slice_index, dtype=np.int64)
+        self.base_station_index = np.full(n_clients, -1, dtype=np.int64)
+        self.usage_remaining = np.zeros(n_clients, dtype=np.float64)
+        self.last_usage = np.zeros(n_clients, dtype=np.float64)
+        self.connected = np.zeros(n_clients, dtype=bool)
+        ## Index into mobility_patterns, -1 for static clients
+        self.mobility_patterns = list(mobility_patterns)
+        self.mobility_index = (np.full(n_clients, -1, dtype=np.int64) if mobility_index is None
+                               else np.asarray(mobility_index, dtype=np.int64))
+
+        # Stats
+        self.total_connected_time = np.zeros(n_clients, dtype=np.int64)
+        self.total_unconnected_time = np.zeros(n_clients, dtype=np.int64)
+        self.total_request_count = np.zeros(n_clients, dtype=np.int64)
+        self.total_consume_time = np.zeros(n_clients, dtype=np.int64)
+        self.total_usage = np.zeros(n_clients, dtype=np.float64)
+
+        self._views = None
+        self._slice_members = None
+        ## Set by a RequestScheduler, see select_requests()
+        self.due = None
+        ## Request decisions and sizes of a Workload for the
+        ## current round, see iter() and use_workload()
+        self.workload_arrivals = None
+        self.workload_usage = None
+
+    @property
+    def views(self):
+        if self._views is None:
+            self._views = [ClientView(self, i) for i in range(self.n_clients)]
+        return self._views
+
+    @classmethod
+    def from_clients(cls, clients, base_stations, stat_collector=None, rng=None):
+        mobility_patterns = []
+        mobility_index = []
+        for c in clients:
+            pattern = getattr(c, 'mobility_pattern', None)
+            if pattern is not None and not any(pattern is p for p in mobility_patterns):
+                mobility_patterns.append(pattern)
+            mobility_index.append(-1 if pattern is None else
+                                  next(i for i, p in enumerate(mobility_patterns) if p is pattern))
+        population = cls([c.x for c in clients], [c.y for c in clients],
+                         [c.usage_freq for c in clients],
+                         [c.subscribed_slice_index for c in clients],
+                         base_stations, stat_collector, rng,
+                         mobility_index, mobility_patterns)
+        for i, c in enumerate(clients):
+            if c.base_station is not None:
+                population.base_station_index[i] = c.base_station.pk
+            population.usage_remaining[i] = c.usage_remaining
+            population.last_usage[i] = c.last_usage
+            population.connected[i] = c.connected
+            population.total_connected_time[i] = c.total_connected_time
+            population.total_unconnected_time[i] = c.total_unconnected_time
+            population.total_request_count[i] = c.total_request_count
+            population.total_consume_time[i] = c.total_consume_time
+            population.total_usage[i] = c.total_usage
+        return population
+
+    def slice_ids(self, indices):
+        '''
+        Flat index of the subscribed slice of each client
+        in the (base station, slice) table
+        '''
+        return self.base_station_index[indices] * self.n_slices + self.subscribed_slice_index[indices]
+
+    STATE_COLUMNS = ('base_station_index', 'usage_remaining', 'last_usage', 'connected',
+                     'total_connected_time', 'total_unconnected_time', 'total_request_count',
+                     'total_consume_time', 'total_usage')
+
+    def state_columns(self):
+        '''
+        Columns that change while stepping. Positions only
+        change when some clients are mobile
+        '''
+        if self.mobility_patterns:
+            return ('x', 'y') + self.STATE_COLUMNS
+        return self.STATE_COLUMNS
+
+    def snapshot(self):
+        state = {name: getattr(self, name).copy() for name in self.state_columns()}
+        state['due'] = None if self.due is None else self.due.copy()
+        state['rng'] = self.rng.bit_generator.state
+        state['mobility_patterns'] = [p.get_state() for p in self.mobility_patterns]
+        return state
+
+    def restore(self, state):
+        '''
+        Copies a snapshot() back into the existing columns
+        '''
+        for name in self.state_columns():
+            np.copyto(getattr(self, name), state[name])
+        if state['due'] is None:
+            self.due = None
+        elif self.due is None:
+            self.due = state['due'].copy()
+        else:
+            np.copyto(self.due, state['due'])
+        self.rng.bit_generator.state = state['rng']
+        for pattern, pattern_state in zip(self.mobility_patterns, state['mobility_patterns']):
+            pattern.set_state(pattern_state)
+        self._slice_members = None
+
+    def fork(self, base_stations, stat_collector):
+        '''
+        Copy with its own state columns that shares the static
+        columns (read-only) with this population
+        '''
+        population = copy.copy(self)
+        for name in ('x', 'y', 'usage_freq', 'subscribed_slice_index', 'mobility_index'):
+            if name not in self.state_columns():
+                column = getattr(self, name).view()
+                column.flags.writeable = False
+                setattr(population, name, column)
+        for name in self.state_columns():
+            setattr(population, name, getattr(self, name).copy())
+        population.base_stations = base_stations
+        population.stat_collector = stat_collector
+        population.rng = copy.deepcopy(self.rng)
+        population.mobility_patterns = [pattern.fork() for pattern in self.mobility_patterns]
+        population.due = None if self.due is None else self.due.copy()
+        population.use_workload(self.workload_arrivals is not None)
+        population._views = None
+        population._slice_members = None
+        return population
+
+    @property
+    def slice_members(self):
+        '''
+        Number of clients attached to each slice, indexed
+        by slice_ids() and kept up to date by record_coverage()
+        '''
+        if self._slice_members is None:
+            attached = np.flatnonzero(self.base_station_index >= 0)
+            self._slice_members = np.bincount(self.slice_ids(attached),
+                                              minlength=len(self.base_stations)*self.n_slices)
+        return self._slice_members
+
+    def _count_members(self, indices, base_station_index, delta):
+        attached = base_station_index >= 0
+        ids = base_station_index[attached]*self.n_slices + self.subscribed_slice_index[indices[attached]]
+        self._slice_members += delta*np.bincount(ids, minlength=self._slice_members.size)
+
+    def iter(self, indices, arrivals=None, usage=None):
+        '''
+        Vectorised Client.iter() over the given client indices.
+        A client that is picked k times takes part in k rounds,
+        exactly as k consecutive calls of Client.iter() would.
+        Inside a round the phases run in a fixed order:
+            1- Lock: disconnect finished clients, then connect
+               (new and pending requests), then consume
+            2- Release: put the consumed bandwidth back
+        Slices admit pending connections in client index order.
+
+        arrivals and usage, aligned with indices, are the request
+        decisions and sizes of each pick taken from a Workload
+        instead of drawing them
+        '''
+        indices = np.asarray(indices, dtype=np.int64)
+        if indices.size == 0:
+            return
+        table = self.gather_slices()
+        occurrence = rank_within(indices)
+        for r in range(occurrence.max() + 1):
+            in_round = occurrence == r
+            if arrivals is not None:
+                ## A client is picked at most once per round
+                self.workload_arrivals[indices[in_round]] = arrivals[in_round]
+                self.workload_usage[indices[in_round]] = usage[in_round]
+            self._iter_round(np.sort(indices[in_round]), table)
+
+    def use_workload(self, enabled=True):
+        '''
+        Allocates the per-client columns that iter() fills with
+        the arrivals and usage of a Workload, or drops them
+        '''
+        if enabled:
+            self.workload_arrivals = np.zeros(self.n_clients, dtype=bool)
+            self.workload_usage = np.zeros(self.n_clients, dtype=np.float64)
+        else:
+            self.workload_arrivals = None
+            self.workload_usage = None
+
+    def move(self, x_range, y_range, boundary='reflect'):
+        '''
+        Moves every mobile client by one generate_movement()
+        step of its mobility pattern, drawn in one batch per
+        pattern, and keeps it inside the area (see bound()).
+        Returns the indices of the clients that moved
+        '''
+        moved, dx, dy = [], [], []
+        for itr, pattern in enumerate(self.mobility_patterns):
+            selected = np.flatnonzero(self.mobility_index == itr)
+            steps = pattern.generate_batch(2 * selected.size).reshape(-1, 2) / pattern.divide_scale
+            moved.append(selected)
+            dx.append(steps[:, 0])
+            dy.append(steps[:, 1])
+        if not moved:
+            return np.empty(0, dtype=np.int64)
+        moved, dx, dy = np.concatenate(moved), np.concatenate(dx), np.concatenate(dy)
+        changed = (dx != 0) | (dy != 0)
+        moved, dx, dy = moved[changed], dx[changed], dy[changed]
+        old_x, old_y = self.x[moved], self.y[moved]
+        self.x[moved] = bound(old_x + dx, x_range, boundary)
+        self.y[moved] = bound(old_y + dy, y_range, boundary)
+        self.record_positions(moved, old_x, old_y)
+        return moved
+
+    def reassociate(self, indices, base_station_index):
+        '''
+        Attaches the clients to new base stations (-1 for none).
+        Connected clients drop their connection and connect to
+        the new base station on their next request
+        '''
+        changed = self.base_station_index[indices] != base_station_index
+        indices, base_station_index = indices[changed], base_station_index[changed]
+        connected = self.connected[indices]
+        if connected.any():
+            table = self.gather_slices()
+            self._disconnect(indices[connected], table)
+            handed_over = indices[connected & (base_station_index >= 0)]
+            self.count_handovers(handed_over)
+            self.count_events('handovers', handed_over.size)
+        old_index = self.base_station_index[indices]
+        self.base_station_index[indices] = base_station_index
+        self.record_coverage(indices, old_index)
+        return indices
+
+    def gather_slices(self):
+        '''
+        Flat arrays of the slice state indexed by slice_ids().
+        connected_users and level are views of the SliceTable
+        of the base stations, so updates land there directly
+        '''
+        return flat_slice_arrays(self.base_stations[0].slices[0].table)
+
+    def _iter_round(self, indices, table):
+        indices = indices[self.base_station_index[indices] >= 0]
+        if indices.size == 0:
+            return
+        has_usage = self.usage_remaining[indices] > 0
+        connected = self.connected[indices]
+
+        # .00: Lock
+        self._disconnect(indices[~has_usage & connected], table)
+        requesting = self.select_requests(indices[~has_usage & ~connected])
+        self._generate_usage(requesting)
+        self._connect(np.sort(np.concatenate((indices[has_usage & ~connected], requesting))), table)
+        consuming = indices[has_usage & connected]
+        self._start_consume(consuming, table)
+
+        # .50: Release
+        self._release_consume(consuming, table)
+
+    def select_requests(self, idle):
+        '''
+        Idle clients that start a new request. With a scheduler
+        the decision is already made, only the due clients request
+        '''
+        if self.workload_arrivals is not None:
+            return idle[self.workload_arrivals[idle]]
+        if self.due is None:
+            return idle[self.usage_freq[idle] < self.draw_random(idle)]
+        requesting = idle[self.due[idle]]
+        self.due[requesting] = False
+        return requesting
+
+    def draw_random(self, indices):
+        return self.rng.random(indices.size)
+
+    def draw_usage(self, indices, slice_index):
+        if self.workload_usage is not None:
+            return self.workload_usage[indices]
+        # usage patterns are shared by all the slices with the
+        # same name, see Network.base_stations_init()
+        usage_pattern = self.base_stations[0].slices[slice_index].usage_pattern
+        return usage_pattern.generate_batch(indices.size)
+
+    def count_connect_attempts(self, indices):
+        self.stat_collector.incr_connect_attempts(self.x[indices], self.y[indices])
+
+    def count_blocks(self, indices):
+        self.stat_collector.incr_block_counts(self.x[indices], self.y[indices])
+
+    def count_handovers(self, indices):
+        self.stat_collector.incr_handover_counts(self.x[indices], self.y[indices])
+
+    def count_events(self, name, n):
+        if self.profiler is not None:
+            self.profiler.count(name, n)
+
+    def record_connections(self, indices, ids, delta):
+        if self.stat_collector is not None and self.stat_collector.tracking:
+            self.stat_collector.update_connections(self.x[indices], self.y[indices], ids, delta)
+
+    def record_positions(self, indices, old_x, old_y):
+        if self.stat_collector is not None and self.stat_collector.tracking:
+            self.stat_collector.update_positions(old_x, old_y, self.x[indices], self.y[indices],
+                                                 self.base_station_index[indices], self.connected[indices])
+
+    def record_usage(self, ids, amounts):
+        if self.stat_collector is not None and self.stat_collector.tracking:
+            self.stat_collector.update_usage(ids, amounts)
+
+    def record_coverage(self, indices, old_index):
+        if self._slice_members is not None:
+            self._count_members(indices, old_index, -1)
+            self._count_members(indices, self.base_station_index[indices], 1)
+        if self.stat_collector is not None and self.stat_collector.tracking:
+            self.stat_collector.update_coverage(self.x[indices], self.y[indices],
+                                                old_index, self.base_station_index[indices])
+
+    def _generate_usage(self, indices):
+        if indices.size == 0:
+            return
+        slice_index = self.subscribed_slice_index[indices]
+        for itr in range(self.n_slices):
+            selected = indices[slice_index == itr]
+            self.usage_remaining[selected] = self.draw_usage(selected, itr)
+        self.total_request_count[indices] += 1
+
+    def _connect(self, indices, table):
+        if indices.size == 0:
+            return
+        self.count_connect_attempts(indices)
+        self.count_events('connect_attempts', indices.size)
+        ids = self.slice_ids(indices)
+        free = table['max_users'][ids] - table['connected_users'][ids]
+        admitted = rank_within(ids) < free
+        self.connected[indices[admitted]] = True
+        table['connected_users'] += np.bincount(ids[admitted], minlength=table['connected_users'].size)
+        self.record_connections(indices[admitted], ids[admitted], 1)
+        self._handover(indices[~admitted], table)
+
+    def _handover(self, indices, table):
+        '''
+        Batched Client.assign_closest_base_station() for the
+        clients blocked in this round. Handed over clients
+        connect to their new base station on their next request
+        '''
+        if indices.size == 0:
+            return
+        target = self.find_handover_targets(indices, table)
+        moved = target >= 0
+        old_index = self.base_station_index[indices[moved]]
+        self.base_station_index[indices[moved]] = target[moved]
+        self.record_coverage(indices[moved], old_index)
+        self.count_handovers(indices[moved])
+        self.count_blocks(indices[~moved])
+        n_moved = int(np.count_nonzero(moved))
+        self.count_events('handovers', n_moved)
+        self.count_events('blocks', indices.size - n_moved)
+
+    def find_handover_targets(self, indices, table):
+        '''
+        Closest other base station that covers each client and
+        whose slice passes Slice.is_avaliable(), -1 if none does.
+        The k cached neighbours of each client are tested first,
+        the coverage grid of the association only for the rest
+        '''
+        association = self.association
+        if association is None or association.k < 2:
+            return np.full(indices.size, -1, dtype=np.int64)
+        distances = association.neighbor_distances(indices)
+        neighbors = association.neighbors[indices]
+        ids = neighbors * self.n_slices + self.subscribed_slice_index[indices][:, None]
+        valid = ((neighbors != self.base_station_index[indices][:, None])
+                 & (distances <= association.radius[neighbors])
+                 & (table['connected_users'][ids] < table['max_users'][ids]))
+        first = valid.argmax(axis=1)
+        target = np.where(valid.any(axis=1), neighbors[np.arange(indices.size), first], -1)
+        if association.k < association.n_base_stations:
+            ## Farther base stations may still cover the clients
+            ## none of the k neighbours could take
+            ## Only clients whose k-th neighbour is within the
+            ## largest radius can be covered by a farther one
+            missing = np.flatnonzero((target < 0) & (distances[:, -1] <= association.max_radius))
+            rows, candidates, _ = association.covering(indices[missing])
+            blocked = indices[missing][rows]
+            ids = candidates * self.n_slices + self.subscribed_slice_index[blocked]
+            valid = ((candidates != self.base_station_index[blocked])
+                     & (table['connected_users'][ids] < table['max_users'][ids]))
+            rows, candidates = rows[valid], candidates[valid]
+            first = np.ones(rows.size, dtype=bool)
+            first[1:] = rows[1:] != rows[:-1]
+            target[missing[rows[first]]] = candidates[first]
+        return target
+
+    def _disconnect(self, indices, table):
+        if indices.size == 0:
+            return
+        ids = self.slice_ids(indices)
+        self.connected[indices] = False
+        table['connected_users'] -= np.bincount(ids, minlength=table['connected_users'].size)
+        self.record_connections(indices, ids, -1)
+
+    def _start_consume(self, indices, table):
+        if indices.size == 0:
+            return
+        ids = self.slice_ids(indices)
+        if self.allocation is not None:
+            amount = self.allocation.allocate(self, indices, ids, table)
+            table['level'] -= np.bincount(ids, weights=amount, minlength=table['level'].size)
+            self.count_events('get_failures', int(np.count_nonzero(amount <= 0)))
+            self.record_usage(ids, amount)
+            self.last_usage[indices] = amount
+            return
+        users = table['connected_users'][ids]
+        share = table['init_capacity'][ids] / np.maximum(users, 1)
+        share = np.minimum(share, table['bandwidth_max'][ids])
+        amount = np.minimum(share, self.usage_remaining[indices])
+        # Container.get() in client order: a request is granted
+        # while the slice level still covers everything locked so far
+        granted = group_cumsum(ids, amount) <= table['level'][ids]
+        self.count_events('get_failures', indices.size - int(np.count_nonzero(granted)))
+        amount = np.where(granted, amount, 0)
+        table['level'] -= np.bincount(ids, weights=amount, minlength=table['level'].size)
+        self.record_usage(ids, amount)
+        self.last_usage[indices] = amount
+
+    def _release_consume(self, indices, table):
+        indices = indices[self.last_usage[indices] > 0]
+        if indices.size == 0:
+            return
+        amount = self.last_usage[indices]
+        ids = self.slice_ids(indices)
+        table['level'] += np.bincount(ids, weights=amount, minlength=table['level'].size)
+        self.record_usage(ids, -amount)
+        self.total_consume_time[indices] += 1
+        self.total_usage[indices] += amount
+        self.usage_remaining[indices] -= amount
+        self.last_usage[indices] = 0
+        self._disconnect(indices[self.usage_remaining[indices] <= 0], table)
+
+
+class ClientView:
+    '''
+    Lightweight stand-in for a Client object. All
+    attributes are read from and written to the
+    columns of the owning ClientPopulation
+    '''
+    __slots__ = ('population', 'index')
+
+    def __init__(self, population, index):
+        self.population = population
+        self.index = index
+
+    def _column(name):
+        def fget(self):
+            return getattr(self.population, name)[self.index].item()
+
+        def fset(self, value):
+            getattr(self.population, name)[self.index] = value
+        return property(fget, fset)
+
+    x = _column('x')
+    y = _column('y')
+    usage_freq = _column('usage_freq')
+    subscribed_slice_index = _column('subscribed_slice_index')
+    usage_remaining = _column('usage_remaining')
+    last_usage = _column('last_usage')
+    connected = _column('connected')
+    total_connected_time = _column('total_connected_time')
+    total_unconnected_time = _column('total_unconnected_time')
+    total_request_count = _column('total_request_count')
+    total_consume_time = _column('total_consume_time')
+    total_usage = _column('total_usage')
+    del _column
+
+    @property
+    def id(self):
+        return self.index
+
+    @property
+    def base_station(self):
+        pk = self.population.base_station_index[self.index]
+        return self.population.base_stations[pk] if pk >= 0 else None
+
+    @base_station.setter
+    def base_station(self, base_station):
+        self.population.base_station_index[self.index] = -1 if base_station is None else base_station.pk
+        self.population._slice_members = None
+
+    @property
+    def closest_base_stations(self):
+        association = self.population.association
+        if association is None:
+            return []
+        return association.closest_base_stations(self.index)
+
+    @property
+    def mobility_pattern(self):
+        index = self.population.mobility_index[self.index]
+        return self.population.mobility_patterns[index] if index >= 0 else None
+
+    @property
+    def stat_collector(self):
+        return self.population.stat_collector
+
+    @stat_collector.setter
+    def stat_collector(self, stat_collector):
+        self.population.stat_collector = stat_collector
+
+    def get_slice(self):
+        if self.base_station is None:
+            return None
+        return self.base_station.slices[self.subscribed_slice_index]
+
+    def iter(self):
+        self.population.iter([self.index])
+
+    def __str__(self):
+        return f'Client_{self.id} [{self.x:<5}, {self.y:>5}] connected to: slice={self.get_slice()} @ {self.base_station}'
+
+
+def bound(values, value_range, boundary='reflect'):
+    '''
+    Brings coordinates back into value_range: 'reflect'
+    bounces them off the edges, 'wrap' makes the area a
+    torus and 'clip' stops them at the edge
+    '''
+    low, high = value_range
+    if boundary == 'clip':
+        return np.clip(values, low, high)
+    length = high - low
+    if boundary == 'wrap':
+        return low + np.mod(values - low, length)
+    if boundary == 'reflect':
+        folded = np.mod(values - low, 2 * length)
+        return low + np.where(folded > length, 2 * length - folded, folded)
+    raise ValueError(f'unknown boundary {boundary!r}')
+
+
+def flat_slice_arrays(slices):
+    '''
+    The flat arrays of gather_slices() from a SliceTable, or
+    anything with the same init_capacity, level and
+    connected_users arrays and per-slice bandwidth_max and
+    bandwidth_guaranteed. The state arrays are flat views
+    '''
+    shape = slices.init_capacity.shape
+    init_capacity = slices.init_capacity.reshape(-1)
+    bandwidth_max = np.broadcast_to(slices.bandwidth_max, shape).reshape(-1)
+    bandwidth_guaranteed = np.broadcast_to(slices.bandwidth_guaranteed, shape).reshape(-1)
+    return {
+        'init_capacity': init_capacity,
+        'bandwidth_max': bandwidth_max,
+        'bandwidth_guaranteed': bandwidth_guaranteed,
+        'max_users': max_admissible_users(init_capacity, bandwidth_max, bandwidth_guaranteed),
+        'connected_users': slices.connected_users.reshape(-1),
+        'level': slices.level.reshape(-1),
+    }
+
+
+def max_admissible_users(init_capacity, bandwidth_max, bandwidth_guaranteed):
+    '''
+    Largest connected_users count for which Slice.is_avaliable()
+    still holds, i.e. min(init_capacity, bandwidth_max)/users
+    stays above bandwidth_guaranteed. Unbounded slices get inf
+    '''
+    real_cap = np.minimum(init_capacity, bandwidth_max)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        users = np.floor(real_cap / bandwidth_guaranteed)
+    return np.where(bandwidth_guaranteed > 0, users, np.inf)
+
+
+def rank_within(keys):
+    '''
+    Position of every element among the earlier
+    elements with the same key, e.g. [3, 1, 3, 3] -> [0, 0, 1, 2]
+    '''
+    keys = np.asarray(keys)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    positions = np.arange(keys.size)
+    starts = np.ones(keys.size, dtype=bool)
+    starts[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    group_start = np.maximum.accumulate(np.where(starts, positions, 0))
+    rank = np.empty(keys.size, dtype=np.int64)
+    rank[order] = positions - group_start
+    return rank
+
+
+def group_cumsum(keys, values):
+    '''
+    Running total of values inside each key group, in array
+    order. The segmented scan only ever adds values of the
+    same group, so a group gets the same totals whatever
+    other groups share the array
+    '''
+    keys = np.asarray(keys)
+    order = np.argsort(keys, kind='stable')
+    totals = np.asarray(values, dtype=np.float64)[order]
+    rank = rank_within(keys)[order]
+    shift = 1
+    while keys.size and shift <= rank.max():
+        running = np.flatnonzero(rank >= shift)
+        totals[running] = totals[running] + totals[running - shift]
+        shift *= 2
+    result = np.empty(keys.size, dtype=np.float64)
+    result[order] = totals
+    return result
@@ -1,4 +1,6 @@
 class Container:
+    __slots__ = ('capacity', 'level')
+
     def __init__(self, init, capacity):
         self.capacity = capacity
         self.level = init
@@ -16,3 +18,31 @@ class Container:
             return True
         else:
             return False
+
+
+class ContainerView(Container):
+    '''
+    Container whose level and capacity are one cell
+    of the arrays of a SliceTable
+    '''
+    __slots__ = ('table', 'cell')
+
+    def __init__(self, table, cell):
+        self.table = table
+        self.cell = cell
+
+    @property
+    def capacity(self):
+        return self.table.capacity[self.cell].item()
+
+    @capacity.setter
+    def capacity(self, value):
+        self.table.capacity[self.cell] = value
+
+    @property
+    def level(self):
+        return self.table.level[self.cell].item()
+
+    @level.setter
+    def level(self, value):
+        self.table.level[self.cell] = value
@@ -1,7 +1,11 @@
 import math
 
+import numpy as np
+
 
 class Coverage:
+    __slots__ = ('center', 'radius')
+
     def __init__(self, center, radius):
         self.center = center
         self.radius = radius
@@ -12,6 +16,159 @@ class Coverage:
     def is_in_coverage(self, x, y):
         return self._get_gaussian_distance((x,y)) <= self.radius
 
+    def are_in_coverage(self, xs, ys):
+        '''
+        is_in_coverage() for arrays of coordinates
+        '''
+        return np.hypot(np.subtract(xs, self.center[0]), np.subtract(ys, self.center[1])) <= self.radius
+
     def __str__(self):
         x, y = self.center
-        return f'[c=({x:<4}, {y:>4}), r={self.radius:>4}]'
\ No newline at end of file
+        return f'[c=({x:<4}, {y:>4}), r={self.radius:>4}]'
+
+
+def distance_matrix(xs, ys, centers):
+    '''
+    Euclidean distance of every point to every
+    center, shape (n_points, n_centers)
+    '''
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    dx = np.subtract.outer(xs, centers[:, 0])
+    dy = np.subtract.outer(ys, centers[:, 1])
+    return np.sqrt(dx*dx + dy*dy)
+
+
+class CoverageGrid:
+    '''
+    Batch coverage tests over the disks of a base station
+    layout. A uniform grid is laid over the disks and every
+    cell lists the base stations whose disk overlaps it, so
+    a point is only tested against the base stations of the
+    cell it falls in instead of the whole layout
+    '''
+    def __init__(self, centers, radius, cell_size=None):
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        self.radius = np.asarray(radius, dtype=np.float64).reshape(-1)
+        ## Contiguous columns index much faster than rows of centers
+        self.center_x = self.centers[:, 0].copy()
+        self.center_y = self.centers[:, 1].copy()
+        n_base_stations = len(self.radius)
+        if n_base_stations == 0:
+            self.origin, self.cell_size, self.shape = np.zeros(2), 1.0, np.ones(2, dtype=np.int64)
+            self.cell_start = np.zeros(2, dtype=np.int64)
+            self.cell_members = np.empty(0, dtype=np.int64)
+            return
+
+        low = (self.centers - self.radius[:, None]).min(axis=0)
+        high = (self.centers + self.radius[:, None]).max(axis=0)
+        if cell_size is None:
+            ## About one disk per cell on regular layouts
+            cell_size = 2 * float(np.median(self.radius))
+        if cell_size <= 0:
+            cell_size = max(float((high - low).max()), 1.0)
+        self.origin = low
+        self.cell_size = cell_size
+        self.shape = np.maximum(np.ceil((high - low) / cell_size).astype(np.int64), 1)
+
+        ## Every cell of the bounding box of every disk
+        first = self._cell_coordinates(self.centers - self.radius[:, None])
+        last = self._cell_coordinates(self.centers + self.radius[:, None])
+        span = last - first + 1
+        n_cells = span[:, 0] * span[:, 1]
+        members = np.repeat(np.arange(n_base_stations), n_cells)
+        offset = np.arange(n_cells.sum()) - np.repeat(np.cumsum(n_cells) - n_cells, n_cells)
+        cell_x = first[members, 0] + offset % span[members, 0]
+        cell_y = first[members, 1] + offset // span[members, 0]
+        cells = cell_y * self.shape[0] + cell_x
+
+        order = np.argsort(cells, kind='stable')
+        self.cell_members = members[order]
+        self.cell_start = np.searchsorted(cells[order], np.arange(self.shape.prod() + 1))
+
+    @classmethod
+    def from_base_stations(cls, base_stations, cell_size=None):
+        return cls([bs.coverage.center for bs in base_stations],
+                   [bs.coverage.radius for bs in base_stations], cell_size)
+
+    def _cell_coordinates(self, points):
+        cells = np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, self.shape - 1)
+
+    def cells(self, xs, ys):
+        '''
+        Grid cell of each point, -1 outside the grid
+        '''
+        points = np.column_stack((xs, ys))
+        inside = np.all((points >= self.origin) & (points <= self.origin + self.shape * self.cell_size), axis=1)
+        cells = self._cell_coordinates(points)
+        return np.where(inside, cells[:, 1] * self.shape[0] + cells[:, 0], -1)
+
+    def pairs(self, xs, ys):
+        '''
+        Every (point, base station) pair where the base station
+        covers the point, as arrays of point indices, base
+        station indices and distances, sorted by point and then
+        by distance
+        '''
+        xs, ys = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+        cells = self.cells(xs, ys)
+        valid = np.flatnonzero(cells >= 0)
+        start = self.cell_start[cells[valid]]
+        counts = self.cell_start[cells[valid] + 1] - start
+        points = np.repeat(valid, counts)
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        base_stations = self.cell_members[np.repeat(start, counts) + offset]
+
+        distances = self.distances(xs[points], ys[points], base_stations)
+        covered = distances <= self.radius[base_stations]
+        points, base_stations, distances = points[covered], base_stations[covered], distances[covered]
+        order = np.lexsort((base_stations, distances, points))
+        return points[order], base_stations[order], distances[order]
+
+    def distances(self, xs, ys, base_station_index=None):
+        '''
+        Distance of each point to the given base station of
+        that point, or to every base station (a distance
+        matrix) when no index is given
+        '''
+        if base_station_index is None:
+            return distance_matrix(xs, ys, self.centers)
+        return np.sqrt(self._squared_distances(xs, ys, base_station_index))
+
+    def _squared_distances(self, xs, ys, base_station_index):
+        dx = xs - self.center_x[base_station_index]
+        dy = ys - self.center_y[base_station_index]
+        return dx*dx + dy*dy
+
+    def covers(self, xs, ys, base_station_index):
+        '''
+        Whether the given base station of each point covers
+        it, -1 stands for no base station
+        '''
+        attached = base_station_index >= 0
+        index = np.where(attached, base_station_index, 0)
+        radius = self.radius[index]
+        return attached & (self._squared_distances(xs, ys, index) <= radius*radius)
+
+    def coverage_mask(self, xs, ys):
+        '''
+        Dense (n_points, n_base_stations) in-coverage mask
+        '''
+        points, base_stations, _ = self.pairs(xs, ys)
+        mask = np.zeros((len(xs), len(self.radius)), dtype=bool)
+        mask[points, base_stations] = True
+        return mask
+
+    def count_covering(self, xs, ys):
+        return np.bincount(self.pairs(xs, ys)[0], minlength=len(xs))
+
+    def nearest(self, xs, ys):
+        '''
+        Closest base station covering each point, -1 if none does
+        '''
+        points, base_stations, _ = self.pairs(xs, ys)
+        first = np.ones(points.size, dtype=bool)
+        first[1:] = points[1:] != points[:-1]
+        nearest = np.full(len(xs), -1, dtype=np.int64)
+        nearest[points[first]] = base_stations[first]
+        return nearest
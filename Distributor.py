@@ -1,20 +1,138 @@
+import copy
+import math
+
+import numpy as np
+
+
 class Distributor:
-    def __init__(self, name, distribution, *dist_params, divide_scale=1):
+    '''
+    Draws samples of one distribution. By default every call
+    goes through the random module function. Once seeded
+    (see seed()), samples come from a numpy.random.Generator
+    that pre-draws block_size samples at a time into a buffer,
+    and scalar calls just pop the next buffered value
+    '''
+    def __init__(self, name, distribution, *dist_params, divide_scale=1, rng=None, block_size=4096):
         self.name = name
         self.distribution = distribution
         self.dist_params = dist_params
         self.divide_scale = divide_scale
+        self.block_size = block_size
+        self.rng = rng
+        self.buffer = np.empty(0)
+        self.position = 0
+
+    def seed(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.buffer = np.empty(0)
+        self.position = 0
+
+    @property
+    def buffered(self):
+        return self.rng is not None
+
+    def get_state(self):
+        '''
+        Generator state and buffered samples, for set_state()
+        '''
+        if self.rng is None:
+            return None
+        return self.rng.bit_generator.state, self.buffer[self.position:].copy()
+
+    def set_state(self, state):
+        if state is None:
+            self.rng = None
+            return
+        if self.rng is None:
+            self.rng = np.random.default_rng()
+        self.rng.bit_generator.state, buffer = state
+        self.buffer = buffer.copy()
+        self.position = 0
+
+    def fork(self):
+        '''
+        Copy with its own generator and buffer. The random
+        module function is shared, deepcopy would clone the
+        module's generator along with it
+        '''
+        distributor = copy.copy(self)
+        distributor.rng = copy.deepcopy(self.rng)
+        distributor.buffer = self.buffer.copy()
+        return distributor
 
     def generate(self):
-        return self.distribution(*self.dist_params)
+        if not self.buffered:
+            return self.distribution(*self.dist_params)
+        if self.position >= len(self.buffer):
+            self._refill(1)
+        value = self.buffer[self.position]
+        self.position += 1
+        return value.item()
 
     def generate_scaled(self):
-        return self.distribution(*self.dist_params) / self.divide_scale
+        return self.generate() / self.divide_scale
 
     def generate_movement(self):
-        x = self.distribution(*self.dist_params) / self.divide_scale
-        y = self.distribution(*self.dist_params) / self.divide_scale
+        x = self.generate() / self.divide_scale
+        y = self.generate() / self.divide_scale
         return x, y
 
+    def generate_batch(self, n):
+        '''
+        Returns the next n samples as an array. With a
+        generator the array is a view of the buffer
+        '''
+        if not self.buffered:
+            return np.array([self.distribution(*self.dist_params) for _ in range(n)])
+        if self.position + n > len(self.buffer):
+            self._refill(n)
+        batch = self.buffer[self.position:self.position + n]
+        self.position += n
+        return batch
+
+    def _refill(self, n):
+        remaining = self.buffer[self.position:]
+        block = self.sample(self.rng, max(self.block_size, n - len(remaining)))
+        self.buffer = np.concatenate((remaining, block)) if len(remaining) else block
+        self.position = 0
+
+    def sample(self, rng, size):
+        '''
+        Draws size samples of the same distribution
+        from a numpy.random.Generator in one call
+        '''
+        return get_np_dist(self.distribution.__name__)(rng, *self.dist_params, size=size)
+
     def __str__(self):
-        return f'[{self.name}: {self.distribution.__name__}: {self.dist_params}]'
\ No newline at end of file
+        return f'[{self.name}: {self.distribution.__name__}: {self.dist_params}]'
+
+
+def _randrange(rng, start, stop=None, step=1, size=None):
+    if stop is None:
+        start, stop = 0, start
+    return start + step * rng.integers(0, math.ceil((stop - start) / step), size=size)
+
+
+def get_np_dist(d):
+    '''
+    numpy.random.Generator counterparts of the random module
+    functions returned by Network.get_dist(), keyed by their
+    __name__ and taking the same parameters
+    '''
+    return {
+        'randrange': _randrange, # start, stop, step
+        'randint': lambda rng, a, b, size=None: rng.integers(a, b, endpoint=True, size=size),
+        'random': lambda rng, size=None: rng.random(size),
+        'uniform': lambda rng, a, b, size=None: rng.uniform(a, b, size),
+        'triangular': lambda rng, low=0.0, high=1.0, mode=None, size=None: rng.triangular(
+            low, (low + high) / 2 if mode is None else mode, high, size),
+        'betavariate': lambda rng, alpha, beta, size=None: rng.beta(alpha, beta, size),
+        'expovariate': lambda rng, lambd, size=None: rng.exponential(1 / lambd, size),
+        'gammavariate': lambda rng, alpha, beta, size=None: rng.gamma(alpha, beta, size),
+        'gauss': lambda rng, mu, sigma, size=None: rng.normal(mu, sigma, size),
+        'lognormvariate': lambda rng, mu, sigma, size=None: rng.lognormal(mu, sigma, size),
+        'normalvariate': lambda rng, mu, sigma, size=None: rng.normal(mu, sigma, size),
+        'vonmisesvariate': lambda rng, mu, kappa, size=None: rng.vonmises(mu, kappa, size) % (2 * math.pi),
+        'paretovariate': lambda rng, alpha, size=None: rng.pareto(alpha, size) + 1,
+        'weibullvariate': lambda rng, alpha, beta, size=None: alpha * rng.weibull(beta, size)
+    }.get(d)
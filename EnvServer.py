@@ -0,0 +1,315 @@
+'''
+Serves the environments of one VectorNetwork to many agent
+processes over a local socket (Unix or TCP on localhost).
+Every connection gets an environment of its own. Step
+requests that arrive within a short window are gathered
+and run as one VectorNetwork.step() over the requesting
+environments, so a batch costs about as much as one step.
+
+Messages are a 5 byte header, a command byte and the
+little-endian uint32 length of the payload, then the
+payload. From the agent:
+    RESET    no payload
+    STEP     int32 action index
+    METRICS  no payload
+    CLOSE    no payload
+From the server:
+    HELLO        on connect, uint32 environment index,
+                 observation dim and number of actions
+    OBSERVATION  float32 observation, after RESET
+    TRANSITION   float64 reward, uint8 done and float32
+                 observation, after STEP
+    METRICS      JSON of EnvServer.metrics()
+    ERROR        UTF-8 message
+
+EnvClient is the agent side, with a gym-style reset() and
+step()
+'''
+import argparse
+import asyncio
+import json
+import socket
+import struct
+import time
+
+import numpy as np
+
+from History import OnlineSummary, RingBuffer
+
+RESET, STEP, METRICS, CLOSE = b'r', b's', b'm', b'c'
+HELLO, OBSERVATION, TRANSITION, ERROR = b'h', b'o', b't', b'e'
+HEADER = struct.Struct('<cI')
+HELLO_PAYLOAD = struct.Struct('<III')
+ACTION = struct.Struct('<i')
+TRANSITION_HEAD = struct.Struct('<dB')
+
+
+def pack(command, payload=b''):
+    return HEADER.pack(command, len(payload)) + payload
+
+
+class EnvServer:
+    '''
+    Runs in an asyncio event loop, see start(). window is
+    how long (in seconds) a batch waits for more requests
+    after the first one, max_batch caps its size
+    '''
+    def __init__(self, vector_network, window=0.001, max_batch=None, latency_history=10000):
+        self.vector_network = vector_network
+        self.vector_network.auto_reset = False
+        self.window = window
+        self.max_batch = max_batch or vector_network.n_envs
+        self.free_envs = list(range(vector_network.n_envs))
+        self.queue = None
+        self.server = None
+        self._batcher = None
+        self.queue_depth = OnlineSummary()
+        self.batch_size = OnlineSummary()
+        self.latency = OnlineSummary()
+        self.recent_latencies = RingBuffer(latency_history)
+        self.n_connections = 0
+
+    async def start(self, path=None, host='127.0.0.1', port=0):
+        '''
+        Listens on the Unix socket path, or on host:port
+        (port 0 picks a free one, see address)
+        '''
+        self.queue = asyncio.Queue()
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._handle, path)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port)
+        self._batcher = asyncio.ensure_future(self._batch_loop())
+        return self.server
+
+    @property
+    def address(self):
+        return self.server.sockets[0].getsockname()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self._batcher.cancel()
+
+    def metrics(self):
+        '''
+        Queue depth when each batch is formed, batch sizes and
+        the latency of step requests (seconds from arrival to
+        reply), with percentiles of the most recent latencies
+        '''
+        latencies = self.recent_latencies.values()
+        percentiles = dict(zip(('p50', 'p90', 'p99'), np.percentile(latencies, (50, 90, 99)).tolist()
+                               if len(latencies) else (0.0, 0.0, 0.0)))
+        return {
+            'connections': self.n_connections,
+            'free_envs': len(self.free_envs),
+            'queue_depth': summary_dict(self.queue_depth),
+            'batch_size': summary_dict(self.batch_size),
+            'latency': dict(summary_dict(self.latency), **percentiles),
+        }
+
+    async def _handle(self, reader, writer):
+        if not self.free_envs:
+            writer.write(pack(ERROR, b'no free environment'))
+            await writer.drain()
+            writer.close()
+            return
+        env = self.free_envs.pop(0)
+        self.n_connections += 1
+        network = self.vector_network
+        writer.write(pack(HELLO, HELLO_PAYLOAD.pack(env, network.observation_dim, len(network.action_list))))
+        try:
+            while True:
+                command, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+                payload = await reader.readexactly(length) if length else b''
+                if command == STEP:
+                    action = ACTION.unpack(payload)[0]
+                    ## A bad action would fail the whole batch
+                    if not 0 <= action < len(network.action_list):
+                        writer.write(pack(ERROR, f'action {action} out of range'.encode()))
+                        await writer.drain()
+                        continue
+                    future = asyncio.get_running_loop().create_future()
+                    self.queue.put_nowait((env, action, future, time.perf_counter()))
+                    try:
+                        reward, done, observation = await future
+                    except Exception as error:
+                        writer.write(pack(ERROR, str(error).encode()))
+                    else:
+                        writer.write(pack(TRANSITION, TRANSITION_HEAD.pack(reward, done)
+                                          + observation.astype(np.float32).tobytes()))
+                elif command == RESET:
+                    network.reset_env(env)
+                    writer.write(pack(OBSERVATION, network.state[env].astype(np.float32).tobytes()))
+                elif command == METRICS:
+                    writer.write(pack(METRICS, json.dumps(self.metrics()).encode()))
+                elif command == CLOSE:
+                    break
+                else:
+                    writer.write(pack(ERROR, f'unknown command {command!r}'.encode()))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            ## The next connection starts from a fresh episode
+            network.reset_env(env)
+            self.free_envs.append(env)
+            self.n_connections -= 1
+            writer.close()
+
+    async def _batch_loop(self):
+        while True:
+            batch = [await self.queue.get()]
+            if self.window > 0:
+                await asyncio.sleep(self.window)
+            self.queue_depth.update(len(batch) + self.queue.qsize())
+            ## Agents wait for their reply, so an environment
+            ## has at most one request in the queue
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        ## Requests of agents that went away while queued
+        batch = [request for request in batch if not request[2].done()]
+        if not batch:
+            return
+        batch.sort(key=lambda request: request[0])
+        envs = np.array([request[0] for request in batch], dtype=np.int64)
+        actions = np.array([request[1] for request in batch], dtype=np.int64)
+        try:
+            states, _, rewards, dones, _ = self.vector_network.step(actions, envs)
+        except Exception as error:
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        self.batch_size.update(len(batch))
+        now = time.perf_counter()
+        for itr, (_, _, future, received) in enumerate(batch):
+            self.latency.update(now - received)
+            self.recent_latencies.append(now - received)
+            if not future.done():
+                future.set_result((float(rewards[itr]), bool(dones[itr]), states[itr]))
+
+
+def summary_dict(summary):
+    return {name: float(value) if name != 'count' else value
+            for name, value in summary.as_dict().items()}
+
+
+class EnvClient:
+    '''
+    Agent side of an EnvServer connection, with gym-style
+    step() and reset(). address is the Unix socket path or a
+    (host, port) pair. Observations come as float32
+    '''
+    def __init__(self, address):
+        if isinstance(address, str):
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.connect(address)
+        self.env, observation_dim, self.n_actions = HELLO_PAYLOAD.unpack(self._receive(HELLO))
+        self.observation_shape = (observation_dim, )
+        self._action_space = None
+        self._observation_space = None
+
+    @property
+    def action_space(self):
+        if self._action_space is None:
+            from gym import spaces
+            self._action_space = spaces.Discrete(self.n_actions)
+        return self._action_space
+
+    @property
+    def observation_space(self):
+        if self._observation_space is None:
+            from gym import spaces
+            high = np.ones(shape=self.observation_shape)
+            self._observation_space = spaces.Box(-high, high, dtype=np.float32)
+        return self._observation_space
+
+    def reset(self):
+        self.socket.sendall(pack(RESET))
+        return np.frombuffer(self._receive(OBSERVATION), dtype=np.float32)
+
+    def step(self, action):
+        '''
+        Returns observation, reward, done and info like a
+        gym.Env, not the five values of Network.step(): the
+        selected action tuple is not sent back
+        '''
+        self.socket.sendall(pack(STEP, ACTION.pack(int(action))))
+        payload = self._receive(TRANSITION)
+        reward, done = TRANSITION_HEAD.unpack_from(payload)
+        observation = np.frombuffer(payload, dtype=np.float32, offset=TRANSITION_HEAD.size)
+        return observation, reward, bool(done), {}
+
+    def metrics(self):
+        self.socket.sendall(pack(METRICS))
+        return json.loads(self._receive(METRICS))
+
+    def close(self):
+        try:
+            self.socket.sendall(pack(CLOSE))
+        except OSError:
+            pass
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _receive(self, expected):
+        command, length = HEADER.unpack(self._read(HEADER.size))
+        payload = self._read(length)
+        if command == ERROR:
+            raise RuntimeError(payload.decode())
+        if command != expected:
+            raise RuntimeError(f'expected {expected!r}, got {command!r}')
+        return payload
+
+    def _read(self, n):
+        data = bytearray()
+        while len(data) < n:
+            chunk = self.socket.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError('server closed the connection')
+            data += chunk
+        return bytes(data)
+
+
+def main(argv=None):
+    from VectorNetwork import VectorNetwork
+    from benchmark import make_scenario
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--envs', type=int, default=16)
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--base-stations', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--window', type=float, default=0.001)
+    parser.add_argument('--socket', help='Unix socket path, TCP on localhost otherwise')
+    parser.add_argument('--port', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    bs_params, slice_params, client_params = make_scenario(args.base_stations)
+    vector_network = VectorNetwork.make(args.envs, bs_params, slice_params, client_params,
+                                        seed=args.seed, n_clients=args.clients)
+    vector_network.reset()
+
+    async def serve():
+        server = EnvServer(vector_network, window=args.window)
+        await server.start(path=args.socket, port=args.port)
+        print(f'serving {args.envs} environments on {server.address}', flush=True)
+        await server.server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == '__main__':
+    main()
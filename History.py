@@ -0,0 +1,90 @@
+'''
+Fixed-capacity metric histories for Stats. A RingBuffer
+keeps only the newest values of a series in a preallocated
+NumPy array, and an OnlineSummary keeps the mean, variance,
+min and max of everything ever recorded, so memory stays
+flat however long a run lasts
+'''
+import copy
+
+import numpy as np
+
+
+class RingBuffer:
+    '''
+    Drop-in for the list histories of Stats: supports
+    append(), len() and indexing from the end, e.g. [-1].
+    Per-slice series use a structured dtype with one field
+    per slice and accept dicts keyed by slice name
+    '''
+    def __init__(self, capacity, dtype=np.float64):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.count = 0
+
+    def append(self, value):
+        if isinstance(value, dict):
+            value = tuple(value[name] for name in self.data.dtype.names)
+        self.data[self.count % self.capacity] = value
+        self.count += 1
+
+    def values(self):
+        '''
+        Stored values, oldest first
+        '''
+        if self.count <= self.capacity:
+            return self.data[:self.count].copy()
+        start = self.count % self.capacity
+        return np.concatenate((self.data[start:], self.data[:start]))
+
+    def _position(self, index):
+        size = len(self)
+        if not -size <= index < size:
+            raise IndexError('RingBuffer index out of range')
+        if index < 0:
+            index += size
+        return (self.count - size + index) % self.capacity
+
+    def __getitem__(self, index):
+        return self.data[self._position(index)]
+
+    def __setitem__(self, index, value):
+        self.data[self._position(index)] = value
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def copy(self):
+        buffer = copy.copy(self)
+        buffer.data = self.data.copy()
+        return buffer
+
+
+class OnlineSummary:
+    '''
+    Running count, mean, variance, min and max of a
+    scalar or fixed-shape series (Welford's algorithm)
+    '''
+    def __init__(self, shape=()):
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+
+    def update(self, value):
+        value = np.asarray(value, dtype=np.float64)
+        self.count += 1
+        delta = value - self.mean
+        self.mean = self.mean + delta/self.count
+        self.m2 = self.m2 + delta*(value - self.mean)
+        self.min = np.minimum(self.min, value)
+        self.max = np.maximum(self.max, value)
+
+    @property
+    def variance(self):
+        return self.m2/self.count if self.count != 0 else np.zeros_like(self.m2)
+
+    def as_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'variance': self.variance,
+                'min': self.min, 'max': self.max}
@@ -1,34 +1,35 @@
 '''
-This module defines the wrapper for the 
-open AI gym. This will describe the basestation
-which allocates bandwidth to the network slices
-dynamically depending on the number of requests
-at each interval
+This module defines the environment behind the
+open AI gym wrapper of NetworkEnv. This will describe
+the basestation which allocates bandwidth to the
+network slices dynamically depending on the number
+of requests at each interval. It only imports NumPy,
+gym is loaded by NetworkEnv or on the first use of
+the action and observation spaces
 '''
 from BaseStation import BaseStation
 from Client import Client
-from Slice import Slice
+from ClientPopulation import ClientPopulation
+from Slice import Slice, SliceTable, SliceType
 from Container import Container
 from Coverage import Coverage
 from Distributor import Distributor
+from TraceDistributor import TraceDistributor
 from Stats import Stats 
-from utils import kdtree
+from Profiler import StepProfiler
+from Scheduler import RequestScheduler
+from Allocation import FairAllocation
+from utils import AssociationIndex
 
 
 
 import numpy as np
 import random
-import os 
-import math
-import gym
-from gym import Env
-from gym import spaces, logger
-from gym.utils import seeding
-from queue import Queue
-from collections import defaultdict
+import copy
+import warnings
 
 
-class Network(Env):
+class Network:
     """
     Description:
         A base station has some maximum allocated bandwidth
@@ -63,37 +64,110 @@ class Network(Env):
     
       
 
-    def __init__(self, bs_params, slice_params, client_params):
-        self.n_clients = 100
-        self.clients = self.clients_init(self.n_clients, client_params) 
+    def __init__(self, bs_params, slice_params, client_params, n_clients=100, profile=False, client_rng=None,
+                 history_size=None):
+        self.n_clients = n_clients
+        columns = self.client_columns(self.n_clients, client_params, client_rng)
         self.base_stations = self.base_stations_init(bs_params, slice_params)
         self.x_range = (0, 1000)
         self.y_range = (0, 1000)
-        self.stats = Stats(self.base_stations, None, (self.x_range, self.y_range))
-        for client in self.clients:
-            client.stat_collector = self.stats
+        self.boundary = client_params.get('boundary', 'reflect')
+        ## history_size bounds the Stats histories, see Stats
+        self.stats = Stats(self.base_stations, None, (self.x_range, self.y_range), history_size=history_size)
+        ## Clients live in a struct of arrays, self.clients
+        ## only holds lightweight views over its columns
+        self.population = ClientPopulation(base_stations=self.base_stations, stat_collector=self.stats,
+                                           **columns)
+        self.association = AssociationIndex(self.base_stations)
+        self.population.association = self.association
+        self.stats.track(self.population)
+        ## Per-phase timers and counters, see enable_profiling()
+        self.profiler = StepProfiler(enabled=profile)
+        self.population.profiler = self.profiler
+        ## Event-driven requests, see use_scheduler()
+        self.scheduler = None
+        ## Precomputed requests, see use_workload()
+        self.workload = None
+        self.workload_step = 0
+        self.n_selected = 0
         
         
         self.action_list = [(0, 0, 0), (0.05, -0.025, -0.025), (-0.05, +0.025,
                             +0.025), (-0.025, +0.05, -0.025), (+0.025, -0.05, +0.025), (-0.025,
                             -0.025, +0.05), (+0.025, +0.025, -0.05)]
-        self.action_space = spaces.Discrete(7)
+        ## The same table as an array, rows are looked up by
+        ## action index, see step_agents()
+        self.action_table = np.array(self.action_list, dtype=np.float64)
         self.state = None
-        high = np.ones(shape=(9, ))
-        low = -high
-        self.observation_space = spaces.Box(low, high, dtype=np.float32)
+        self.observation_shape = (3*len(self.base_stations)*self.population.n_slices, )
+        ## gym spaces are built on first use, see action_space
+        self._action_space = None
+        self._observation_space = None
         self.steps_beyond_done = None
         self.user_thresold = 0.7
         self.seed()
+
+    @property
+    def clients(self):
+        return self.population.views
+
+    @property
+    def slice_table(self):
+        return self.base_stations[0].slices[0].table
+
+    @property
+    def action_space(self):
+        ## Importing gym is left to the callers of the gym
+        ## interface, the simulation itself only needs NumPy
+        if self._action_space is None:
+            from gym import spaces
+            self._action_space = spaces.Discrete(len(self.action_list))
+        return self._action_space
+
+    @property
+    def observation_space(self):
+        if self._observation_space is None:
+            from gym import spaces
+            high = np.ones(shape=self.observation_shape)
+            self._observation_space = spaces.Box(-high, high, dtype=np.float32)
+        return self._observation_space
         
     def seed(self, seed=None):
-        self.np_random, seed = seeding.np_random(seed)
+        self.np_random, seed = np_random(seed)
+        ## The request draws and every usage pattern get
+        ## their own stream derived from the env seed
+        patterns = ([slice.usage_pattern for slice in self.base_stations[0].slices]
+                    + self.population.mobility_patterns)
+        seeds = np.random.SeedSequence(seed).spawn(1 + len(patterns))
+        self.population.rng = np.random.default_rng(seeds[0])
+        for pattern, pattern_seed in zip(patterns, seeds[1:]):
+            pattern.seed(pattern_seed)
         return [seed]    
     
     def reset(self):
-        self.state = self.np_random.uniform(low=0, high=1, size=(9,))
+        self.state = self.np_random.uniform(low=0, high=1, size=self.observation_shape)
         self.steps_beyond_done = None
+        ## A workload is replayed from its first step
+        self.workload_step = 0
         return np.array(self.state)
+
+    def reset_agents(self):
+        """
+        reset() for step_agents(), the initial state split
+        into one observation per base station
+        """
+        return self.agent_observations(self.reset())
+
+    def agent_observations(self, state=None):
+        """
+        (n_bs, 3*n_slices) view of a state of build_state()
+        (the current one by default), row b holding the
+        features of every slice of base station b
+        """
+        state = self.state if state is None else state
+        n_base_stations = len(self.base_stations)
+        return (np.asarray(state).reshape(self.population.n_slices, n_base_stations, 3)
+                .transpose(1, 0, 2).reshape(n_base_stations, -1))
     
     def step(self, action: int):
         """
@@ -111,55 +185,217 @@ class Network(Env):
         """
         ### Initialise the stat collector which gives state information
         selected_action = self.SelectedAction(action)
+        reward, done, info = self._step(selected_action, self.reward)
+        return self.state, selected_action, float(reward), done, info
+
+    def step_agents(self, actions):
+        """
+        Multi-agent step, one agent per base station. actions
+        holds an index into action_list for every base station,
+        the rows of action_table are looked up and applied to
+        the (n_bs, n_slices) capacities in one go.
+
+        Returns the observation of every base station (see
+        agent_observations()), the selected action rows, the
+        reward of every base station (see base_station_rewards())
+        and done and info as in step(). The -10 / 0 rewards of
+        step() before and after done go to every agent
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        if actions.shape != (len(self.base_stations), ):
+            raise ValueError(f'step_agents() takes one action per base station, '
+                             f'got shape {actions.shape} for {len(self.base_stations)} base stations')
+        selected_actions = self.action_table[actions]
+        rewards, done, info = self._step(selected_actions, self.base_station_rewards)
+        return self.agent_observations(), selected_actions, rewards, done, info
+
+    def _step(self, selected_action, reward_function):
+        profiler = self.profiler
+        profiler.begin_step()
 
         ## Changing the slice ratios in all base stations as per the action provided
-        for bs in self.base_stations:
-            for itr, slice in enumerate(bs.slices):
-                new_s_cap = (1 + selected_action[itr])*slice.init_capacity
-                slice.init_capacity = new_s_cap
-                slice.capacity = Container(init=new_s_cap, capacity=new_s_cap)
+        start = profiler.start()
+        self.apply_action(selected_action)
+        profiler.stop('apply_action', start)
 
+        start = profiler.start()
+        self.move_clients()
+        profiler.stop('mobility', start)
         
         ## Connecting base stations to clients and initialising 
         ## clients attributes of stats
+        start = profiler.start()
         self.initialise_stats()
+        profiler.stop('association', start)
+        start = profiler.start()
         selected_clients = self.generate_user_requests()
-        slice_hash_table = defaultdict(list)
-        reward = self.reward(selected_clients)
+        profiler.stop('client_iteration', start)
+        start = profiler.start()
+        reward = reward_function(selected_clients)
+        profiler.stop('reward', start)
+
+        start = profiler.start()
+        self.state, total_connected_clients = self.build_state(self.n_selected)
+        profiler.stop('state', start)
+        done = bool(total_connected_clients == self.n_selected
+                or total_connected_clients/self.n_selected >= self.user_thresold)     ## TODO: done condition is too harsh! Should add used bandwidth condition
+
+        reward, steps_beyond_done = episode_rewards(
+            reward, done, -1 if self.steps_beyond_done is None else self.steps_beyond_done)
+        self.steps_beyond_done = None if steps_beyond_done < 0 else int(steps_beyond_done)
+
+        info = {}
+        profile = profiler.end_step()
+        if profile is not None:
+            info['profile'] = profile
+        return reward, done, info
+
+    def enable_profiling(self, enabled=True):
+        """
+        Turns the per-phase timers and counters of step() on
+        or off for this env. Cumulative histograms are read
+        with self.profiler.summary()
+        """
+        self.profiler.enabled = enabled
 
-        total_connected_clients, clients_in_coverage = 0, 0
+    def snapshot(self):
+        """
+        Mutable simulation state in array form: slice capacities
+        and users, client state columns, Stats, the scheduler and
+        every random state (the random and np.random module states
+        included). Static data such as slice parameters and the
+        positions of static clients is not copied
+        """
+        return {
+            'slices': self.slice_table.snapshot(),
+            'usage_patterns': [s.usage_pattern.get_state() for s in self.base_stations[0].slices],
+            'population': self.population.snapshot(),
+            'association': self.association.snapshot() if self._association_changes() else None,
+            'stats': self.stats.snapshot(),
+            'scheduler': None if self.scheduler is None else self.scheduler.snapshot(),
+            'state': None if self.state is None else np.array(self.state),
+            'steps_beyond_done': self.steps_beyond_done,
+            'n_selected': self.n_selected,
+            'workload_step': self.workload_step,
+            'np_random': self.np_random.bit_generator.state,
+            'random': random.getstate(),
+            'numpy_random': np.random.get_state(),
+        }
+
+    def restore(self, snapshot):
+        """
+        Puts the env back in the state of a snapshot(). Arrays
+        are copied into place, the snapshot stays reusable
+        """
+        self.slice_table.restore(snapshot['slices'])
+        for s, state in zip(self.base_stations[0].slices, snapshot['usage_patterns']):
+            s.usage_pattern.set_state(state)
+        if snapshot['scheduler'] is None:
+            self.scheduler = None
+        else:
+            if self.scheduler is None:
+                self.scheduler = RequestScheduler(self.population)
+            self.scheduler.restore(snapshot['scheduler'])
+        self.population.restore(snapshot['population'])
+        if snapshot['association'] is not None:
+            self.association.restore(snapshot['association'])
+        self.stats.restore(snapshot['stats'])
+        self.state = None if snapshot['state'] is None else np.array(snapshot['state'])
+        self.steps_beyond_done = snapshot['steps_beyond_done']
+        self.n_selected = snapshot['n_selected']
+        self.workload_step = snapshot['workload_step']
+        self.np_random.bit_generator.state = snapshot['np_random']
+        random.setstate(snapshot['random'])
+        np.random.set_state(snapshot['numpy_random'])
+
+    def fork(self, k=1):
+        """
+        k independent copies of the env in its current state,
+        e.g. to try every entry of action_list from the same
+        state. The copies share static data (slice parameters,
+        static client columns, the KD-tree and coverage grid)
+        and only own the state a snapshot() holds
+        """
+        snapshot = self.snapshot()
+        forks = []
+        for _ in range(k):
+            nw = copy.copy(self)
+            nw._fork_structure()
+            nw.restore(snapshot)
+            forks.append(nw)
+        return forks
+
+    def _fork_structure(self):
+        slice_types = {}
+        for s in self.base_stations[0].slices:
+            slice_type = copy.copy(s.slice_type)
+            slice_type.usage_pattern = s.usage_pattern.fork()
+            slice_types[id(s.slice_type)] = slice_type
+        table = self.slice_table.fork()
+        table.slice_types = [slice_types.get(id(t), t) for t in table.slice_types]
+        base_stations = []
         for bs in self.base_stations:
-            for slice in bs.slices:
-                total_connected_clients += slice.connected_users
-                
-                slice_hash_table[slice.name].append([slice.connected_users/len(selected_clients),
-                                                    (slice.capacity.capacity - slice.capacity.level)/slice.bandwidth_max,
-                                                    slice.capacity.capacity/slice.bandwidth_max])
-        state_array = []
-        for _, item in slice_hash_table.items():
-            state_array.append(item)
-
-        self.state = (np.array(state_array)).flatten()
-        done = bool(total_connected_clients == len(selected_clients)
-                or total_connected_clients/len(selected_clients) >= self.user_thresold)     ## TODO: done condition is too harsh! Should add used bandwidth condition
-
-        if not done:
-            reward = -10
-        elif self.steps_beyond_done is None:
-            self.steps_beyond_done = 0
-            reward = -10
+            slices = []
+            for s in bs.slices:
+                s = copy.copy(s)
+                s.table = table
+                s.slice_type = slice_types.get(id(s.slice_type), s.slice_type)
+                slices.append(s)
+            bs = copy.copy(bs)
+            bs.slices = slices
+            base_stations.append(bs)
+        self.base_stations = base_stations
+        self.stats = self.stats.fork(base_stations)
+        scheduler = self.scheduler
+        self.population = self.population.fork(base_stations, self.stats)
+        self.stats.population = self.population
+        if self._association_changes():
+            self.association = self.association.fork()
+        self.population.association = self.association
+        self.profiler = StepProfiler(enabled=self.profiler.enabled)
+        self.population.profiler = self.profiler
+        self.scheduler = None if scheduler is None else scheduler.fork(self.population)
+        self.np_random = copy.deepcopy(self.np_random)
+
+    def _association_changes(self):
+        ## The neighbour cache only changes while it is being
+        ## filled or when clients move
+        return bool(self.population.mobility_patterns) or len(self.association.x) != self.n_clients
+
+    def use_scheduler(self, enabled=True):
+        """
+        Switches generate_user_requests() to the event-driven
+        RequestScheduler, which only touches clients with a
+        due request or an open session, or back to sampling
+        """
+        if enabled:
+            self.scheduler = RequestScheduler(self.population)
         else:
-            if self.steps_beyond_done == 0:
-                logger.warn(
-                    "You are calling 'step()' even though this "
-                    "environment has already returned done = True. You "
-                    "should always call 'reset()' once you receive 'done = "
-                    "True' -- any further steps are undefined behavior.")
-                self.steps_beyond_done += 1
-                reward = 0.0
-                
+            self.scheduler = None
+            self.population.due = None
 
-        return self.state, selected_action, reward, done, {}
+    def use_workload(self, workload):
+        """
+        Replays a precomputed Workload (see Workload.generate()
+        and Workload.load()) in generate_user_requests(), one
+        workload step per env step from the last reset(), or
+        goes back to drawing the requests with None
+        """
+        if workload is not None and workload.n_clients != self.population.n_clients:
+            raise ValueError(f'the workload is for {workload.n_clients} clients, '
+                             f'the network has {self.population.n_clients}')
+        self.workload = workload
+        self.workload_step = 0
+        self.population.use_workload(workload is not None)
+
+    def use_fair_allocation(self, enabled=True, qos_weights=None):
+        """
+        Switches the consume phase to the max-min fair
+        FairAllocation, with clients weighted by the qos_class
+        of their slice through qos_weights, or back to the
+        client-order Container.get() of Client.start_consume()
+        """
+        self.population.allocation = FairAllocation(qos_weights) if enabled else None
 
 
                 
@@ -167,25 +403,56 @@ class Network(Env):
         action = self.action_list[action]
         return action
 
+    def apply_action(self, selected_action):
+        ## selected_action is one row of action_table for all
+        ## base stations, or an (n_bs, n_slices) array of rows.
+        ## Every slice Container is refilled to its new capacity
+        table = self.slice_table
+        table.init_capacity *= 1 + np.asarray(selected_action, dtype=np.float64)
+        table.capacity[:] = table.init_capacity
+        table.level[:] = table.init_capacity
+        self.stats.reset_capacity()
+
+    def build_state(self, n_selected_clients):
+        """
+        Per slice name and base station: connected users per
+        selected client, used bandwidth and allocated bandwidth
+        (both relative to bandwidth_max). Also returns the
+        total number of connected users
+        """
+        table = self.slice_table
+        features = np.stack((table.connected_users/n_selected_clients,
+                             (table.capacity - table.level)/table.bandwidth_max,
+                             table.capacity/table.bandwidth_max), axis=-1)
+        ## Grouped by slice name, then base station
+        return features.transpose(1, 0, 2).flatten(), int(table.connected_users.sum())
+
 
 
     def generate_user_requests(self):
         ## A subset of clients are selected at each step
         ## this follows a normal distribution
-        n_active_clients = max(int(random.random()*self.n_clients), int(0.1*self.n_clients))
+        if self.workload is not None:
+            client_ids, arrivals, usage = self.workload.step(self.workload_step)
+            self.workload_step += 1
+            self.n_selected = client_ids.size
+            self.population.iter(client_ids, arrivals, usage)
+            return client_ids
+
+        rng = self.population.rng
+        n_active_clients = max(int(rng.random()*self.n_clients), int(0.1*self.n_clients))
+        self.n_selected = n_active_clients
+        if self.scheduler is not None:
+            return self.scheduler.step(n_active_clients)
         
-        random_client_ids = np.random.randint(self.n_clients, size=n_active_clients)
-        all_clients = np.array(self.clients)
-        selected_clients = all_clients[random_client_ids]
+        random_client_ids = rng.integers(self.n_clients, size=n_active_clients)
+        self.population.iter(random_client_ids)
 
-        for selected_client in selected_clients:
-            selected_client.iter()
-
-        return selected_clients
+        return random_client_ids
 
       
     
-    def reward(self, clients: np.ndarray):
+    def reward(self, client_ids: np.ndarray):
         """
         The reward function is defined in the 
         base paper: https://ieeexplore.ieee.org/abstract/document/9235006/references#references
@@ -193,9 +460,53 @@ class Network(Env):
         slice, the blocked request counts for that slice and the total request counts for that
         slice. The net reward is the sum over all the slices. The request counts can be generated
         from the Stats.get_stats() method.
+
+        Every selected client of a (base station, slice) adds the same
+        term, so the term is computed once per slice and weighted by
+        the number of selected clients of that slice, see slice_rewards()
+        """
+        table = self.slice_table
+        reward = slice_rewards(self.selected_counts(client_ids)[None], table.connected_users[None],
+                               [self.stats.connect_attempt[-1]], table.delay_tolerance)
+        return reward[0].item()
+
+    def base_station_rewards(self, client_ids: np.ndarray):
+        """
+        reward() split by base station, the terms of the
+        slices of each base station are summed separately
+        """
+        table = self.slice_table
+        terms = slice_reward_terms(self.selected_counts(client_ids)[None], table.connected_users[None],
+                                   [self.stats.connect_attempt[-1]], table.delay_tolerance)
+        return terms[0].sum(axis=1)
+
+    def selected_counts(self, client_ids):
+        """
+        (n_bs, n_slices) number of selected clients
+        attached to each slice
+        """
+        population = self.population
+        n_base_stations = len(self.base_stations)
+        if self.scheduler is not None:
+            ## The scheduler skips idle clients, so the picks
+            ## of the sampled model are replaced by their mean
+            selected_counts = self.scheduler.expected_selections(self.n_selected)
+        else:
+            client_ids = client_ids[population.base_station_index[client_ids] >= 0]
+            selected_counts = np.bincount(population.slice_ids(client_ids),
+                                          minlength=n_base_stations*population.n_slices)
+        return selected_counts.reshape(n_base_stations, -1)
+
+    def reward_per_client(self, client_ids: np.ndarray):
+        """
+        Reference per-client form of reward(), one term per
+        selected client. Kept to cross-check the aggregated form.
+        Without connection requests the reward is 0
         """
         reward = 0
-        for client in clients:
+        if self.stats.connect_attempt[-1] == 0:
+            return reward
+        for client in [self.clients[i] for i in client_ids]:
             if client.base_station is not None:
                 slice: Slice = client.base_station.slices[client.subscribed_slice_index]
                 stats: Stats = client.stat_collector
@@ -217,41 +528,79 @@ class Network(Env):
 
     def connections_init(self):
         """
-        Initialise connections with  KDTree
+        Initialise connections with  KDTree. The tree and the
+        neighbour lists are cached, only clients that moved
+        since the last call are queried again
         """
-        # self.kdt.limit = 5
-        kdtree(self.clients, self.base_stations)
+        changed = self.association.update(self.population.x, self.population.y)
+        ## Same rule as utils.kdtree(): a client attaches to its
+        ## closest base station only if it is in its coverage
+        nearest = self.association.nearest_in_coverage(changed)
+        covered = nearest >= 0
+        old_index = self.population.base_station_index[changed[covered]]
+        self.population.base_station_index[changed[covered]] = nearest[covered]
+        self.population.record_coverage(changed[covered], old_index)
     
+    def move_clients(self):
+        """
+        Moves the mobile clients and re-associates the ones
+        that crossed a coverage boundary with the closest base
+        station now covering them (none if they left coverage)
+        """
+        population = self.population
+        if not population.mobility_patterns:
+            return
+        moved = population.move(self.x_range, self.y_range, self.boundary)
+        crossed = self.association.move(population.x, population.y, moved, population.base_station_index)
+        population.reassociate(crossed, self.association.coverage.nearest(population.x[crossed],
+                                                                         population.y[crossed]))
+
     def initialise_stats(self):
         """
         Assigns clients to the stats method
         only after initialising the KDTree i.e.,
         only after assigning closest base stations 
-        to all the clients
+        to all the clients. Stats reads them from
+        the population it tracks
         """
         self.connections_init()
-        self.stats.clients = self.clients
 
         
+    @staticmethod
+    def usage_pattern_init(name, params):
+        """
+        A parametric distribution {'distribution', 'params'}, or
+        a trace {'trace': path} with the optional keys 'field',
+        'dtype', 'offset' (None to draw it from the env seed)
+        and 'divide_scale' of TraceDistributor
+        """
+        if 'trace' in params:
+            options = {key: params[key] for key in ('field', 'dtype', 'offset', 'divide_scale') if key in params}
+            return TraceDistributor(name, params['trace'], **options)
+        return Distributor(name, get_dist(params['distribution']), *params['params'])
+
     @classmethod
     def base_stations_init(cls, bs_params, slice_params):
         base_stations = []
         i = 0
-        usage_patterns = {}
+        ## One flyweight of static parameters per slice name
+        slice_types = {}
         for name, s in slice_params.items():
-            usage_patterns[name] = Distributor(name, get_dist(s['usage_pattern']['distribution']), *s['usage_pattern']['params'])
+            usage_pattern = cls.usage_pattern_init(name, s['usage_pattern'])
+            slice_types[name] = SliceType(name, s['client_weight'], s['delay_tolerance'],
+                                          s['qos_class'], s['bandwidth_guaranteed'],
+                                          s['bandwidth_max'], usage_pattern)
         
+        ## The slices of the layout share one SliceTable
+        table = SliceTable(slice_types.values(), len(bs_params))
         for bs in bs_params:
             slices = []
             ratios = bs['ratios']
             capacity = bs['capacity_bandwidth']
-            for name, s in slice_params.items():
+            for itr, name in enumerate(slice_params):
                 s_cap = capacity * ratios[name]
             
-                s = Slice(name, ratios[name], 0, s['client_weight'],
-                    s['delay_tolerance'],
-                    s['qos_class'], s['bandwidth_guaranteed'],
-                    s['bandwidth_max'], s_cap, usage_patterns[name])
+                s = Slice(slice_types[name], ratios[name], 0, s_cap, table, (i, itr))
                 s.capacity = Container(init=s_cap, capacity=s_cap)
                 slices.append(s)
             base_station = BaseStation(i, Coverage((bs['x'], bs['y']), bs['coverage']), capacity, slices)
@@ -261,28 +610,147 @@ class Network(Env):
 
             
     @classmethod
-    def clients_init(cls, n_clients, client_params):
-        i = 0
-        clients = []
+    def clients_init(cls, n_clients, client_params, client_class=Client):
+        columns = cls.client_columns(n_clients, client_params)
+        patterns = columns['mobility_patterns']
+        return [client_class(i, x, y, usage_freq, slice_index, None, None,
+                       patterns[pattern] if pattern >= 0 else None)
+                for i, (x, y, usage_freq, slice_index, pattern) in enumerate(zip(
+                    columns['x'].tolist(), columns['y'].tolist(), columns['usage_freq'].tolist(),
+                    columns['subscribed_slice_index'].tolist(), columns['mobility_index'].tolist()))]
+
+    @classmethod
+    def client_columns(cls, n_clients, client_params, rng=None):
+        """
+        Draws the clients of clients_init() straight into the
+        ClientPopulation columns, without a Client object per
+        client. The draws are made in the same order. With a
+        numpy Generator every column is drawn in one batch
+        instead, for populations of millions of clients
+        """
         ufp = client_params['usage_frequency']
         usage_freq_pattern = Distributor(f'ufp', get_dist(ufp['distribution']),
                                         *ufp['params'], divide_scale=ufp['divide_scale'])
+        ## Optional, e.g. {'car': {'distribution': 'randint', 'params': (-10, 10),
+        ## 'client_weight': 0.2, 'divide_scale': 1}, ...}
+        mobility_params = client_params.get('mobility_patterns', {})
+        mobility_patterns, mobility_weights, collected = [], [], 0
+        for name, mp in mobility_params.items():
+            mobility_patterns.append(Distributor(name, get_dist(mp['distribution']), *mp['params'],
+                                                 divide_scale=mp.get('divide_scale', 1)))
+            collected += mp['client_weight']
+            mobility_weights.append(collected)
+        pattern_weights = [w/collected for w in mobility_weights[:-1]] + [1]
+
+        loc_x = client_params['location']['x']
+        loc_y = client_params['location']['y']
+        if rng is not None:
+            def draw(params, n):
+                return Distributor('', get_dist(params['distribution']), *params['params'],
+                                   rng=rng).generate_batch(n).astype(np.float64)
+            x = draw(loc_x, n_clients)
+            y = draw(loc_y, n_clients)
+            ## Same rule as get_random_slice_index()
+            subscribed_slice_index = np.searchsorted(cls.slice_weights, rng.random(n_clients))
+            mobility_index = np.full(n_clients, -1, dtype=np.int64)
+            if mobility_patterns:
+                mobile = np.flatnonzero(rng.random(n_clients) < collected)
+                mobility_index[mobile] = np.searchsorted(pattern_weights, rng.random(mobile.size))
+            usage_freq = draw(ufp, n_clients) / ufp['divide_scale']
+            return cls._number_patterns(x, y, usage_freq, subscribed_slice_index,
+                                        mobility_index, mobility_patterns)
+        draw_x = get_dist(loc_x['distribution'])
+        draw_y = get_dist(loc_y['distribution'])
+        x = np.empty(n_clients, dtype=np.float64)
+        y = np.empty(n_clients, dtype=np.float64)
+        usage_freq = np.empty(n_clients, dtype=np.float64)
+        subscribed_slice_index = np.empty(n_clients, dtype=np.int64)
+        mobility_index = np.full(n_clients, -1, dtype=np.int64)
+        for i in range(n_clients):
+            x[i] = draw_x(*loc_x['params'])
+            y[i] = draw_y(*loc_y['params'])
+            subscribed_slice_index[i] = get_random_slice_index(cls.slice_weights)
+            ## Clients left over by weights summing below 1 are static
+            if mobility_patterns and random.random() < collected:
+                mobility_index[i] = get_random_mobility_pattern(pattern_weights, range(len(mobility_patterns)))
+            usage_freq[i] = usage_freq_pattern.generate_scaled()
+        return cls._number_patterns(x, y, usage_freq, subscribed_slice_index,
+                                    mobility_index, mobility_patterns)
+
+    @staticmethod
+    def _number_patterns(x, y, usage_freq, subscribed_slice_index, mobility_index, mobility_patterns):
+        ## Patterns numbered by first use, as from_clients() numbers them
+        used, first = np.unique(mobility_index, return_index=True)
+        used = used[used >= 0][np.argsort(first[used >= 0])]
+        ## One spare slot so that static clients (-1) stay -1
+        renumber = np.full(len(mobility_patterns) + 1, -1, dtype=np.int64)
+        renumber[used] = np.arange(used.size)
+        return {'x': x, 'y': y, 'usage_freq': usage_freq,
+                'subscribed_slice_index': subscribed_slice_index,
+                'mobility_index': renumber[mobility_index],
+                'mobility_patterns': [mobility_patterns[i] for i in used.tolist()]}
+
+
+
+
+
+def np_random(seed=None):
+    """
+    Generator and seed as returned by gym.utils.seeding.np_random()
+    """
+    if seed is not None and not (isinstance(seed, int) and 0 <= seed):
+        raise ValueError(f"Seed must be a non-negative integer or omitted, not {seed}")
+    seed_seq = np.random.SeedSequence(seed)
+    return np.random.Generator(np.random.PCG64(seed_seq)), seed_seq.entropy
 
-        for _ in range(n_clients):
-            loc_x = client_params['location']['x']
-            loc_y = client_params['location']['y']
-            location_x = get_dist(loc_x['distribution'])(*loc_x['params'])
-            location_y = get_dist(loc_y['distribution'])(*loc_y['params'])
-            
-            connected_slice_index = get_random_slice_index(cls.slice_weights)
-            c = Client(i, location_x, location_y, usage_freq_pattern.generate_scaled(),
-                         connected_slice_index, None, None)
-            clients.append(c)
-            i += 1
-        return clients
 
+def slice_rewards(selected_counts, connected_users, connection_requests, delay_tolerance):
+    """
+    Reward of Network.reward() for a batch of environments.
+    selected_counts and connected_users are (n_envs, n_bs, n_slices),
+    connection_requests is (n_envs,) and delay_tolerance (n_slices,).
+    Environments without connection requests get 0
+    """
+    terms = slice_reward_terms(selected_counts, connected_users, connection_requests, delay_tolerance)
+    return terms.reshape(len(terms), -1).sum(axis=1)
 
 
+def episode_rewards(reward, done, steps_beyond_done):
+    """
+    Rewards of Network.step() around the end of an episode,
+    for one or a batch of environments: -10 until done, -10
+    on the first done step, 0 (with a warning) on the step
+    after it and the reward itself from then on.
+    steps_beyond_done is -1 before the first done, reward
+    broadcasts against done. Returns the rewards and the
+    updated steps_beyond_done
+    """
+    done = np.asarray(done, dtype=bool)
+    steps_beyond_done = np.asarray(steps_beyond_done, dtype=np.int64)
+    stepped_past_done = done & (steps_beyond_done == 0)
+    rewards = np.where(done & (steps_beyond_done > 0), reward, -10.0)
+    rewards = np.where(stepped_past_done, 0.0, rewards)
+    if stepped_past_done.any():
+        warnings.warn(
+            "You are calling 'step()' even though this "
+            "environment has already returned done = True. You "
+            "should always call 'reset()' once you receive 'done = "
+            "True' -- any further steps are undefined behavior.")
+    steps_beyond_done = np.where(done & (steps_beyond_done < 0), 0, steps_beyond_done + stepped_past_done)
+    return rewards, steps_beyond_done
+
+
+def slice_reward_terms(selected_counts, connected_users, connection_requests, delay_tolerance):
+    """
+    (n_envs, n_bs, n_slices) terms of slice_rewards(),
+    before the sum over the base stations and slices
+    """
+    connection_requests = np.asarray(connection_requests, dtype=np.float64)[:, None, None]
+    blocked_requests = connection_requests - connected_users
+    with np.errstate(divide='ignore', invalid='ignore'):
+        blocked_ratio = np.where(connection_requests > 0, blocked_requests/connection_requests, 0)
+    reward_slice = -(1/delay_tolerance)*blocked_ratio
+    return selected_counts*reward_slice
 
 
 def get_dist(d):
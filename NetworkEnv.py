@@ -0,0 +1,17 @@
+'''
+The gym side of Network. Network itself imports only
+NumPy so that worker processes start fast, code that
+needs a real gym.Env (wrappers, env checkers) uses
+NetworkEnv instead
+'''
+from gym import Env
+
+from Network import Network
+
+
+class NetworkEnv(Network, Env):
+    """
+    Network as a gym.Env. Steps, spaces and seeding are
+    those of Network
+    """
+    metadata = {'render_modes': []}
@@ -0,0 +1,83 @@
+'''
+Low-overhead instrumentation of the phases of
+Network.step(). Phase timers read the monotonic
+perf_counter_ns() clock, counters are plain integers,
+and every phase keeps a cumulative histogram of its
+latencies in power-of-two nanosecond buckets. A disabled
+profiler returns straight away from every call
+'''
+import time
+
+import numpy as np
+
+PHASES = ('apply_action', 'mobility', 'association', 'client_iteration', 'reward', 'state')
+COUNTERS = ('connect_attempts', 'blocks', 'handovers', 'get_failures')
+N_BUCKETS = 48
+
+
+class StepProfiler:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.histograms = {phase: np.zeros(N_BUCKETS, dtype=np.int64) for phase in PHASES}
+        self.total_ns = dict.fromkeys(PHASES, 0)
+        self.totals = dict.fromkeys(COUNTERS, 0)
+        self.n_steps = 0
+        self.begin_step()
+
+    def begin_step(self):
+        self.step_ns = dict.fromkeys(PHASES, 0)
+        self.step_counts = dict.fromkeys(COUNTERS, 0)
+
+    def start(self):
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def stop(self, phase, start):
+        if not self.enabled:
+            return
+        elapsed = time.perf_counter_ns() - start
+        self.step_ns[phase] += elapsed
+        self.total_ns[phase] += elapsed
+        self.histograms[phase][min(elapsed.bit_length(), N_BUCKETS - 1)] += 1
+
+    def count(self, name, n):
+        if not self.enabled:
+            return
+        self.step_counts[name] += n
+        self.totals[name] += n
+
+    def end_step(self):
+        '''
+        Timings (in seconds) and counters of the step that
+        just ran, as returned in the info dict of step()
+        '''
+        if not self.enabled:
+            return None
+        self.n_steps += 1
+        return {'phases': {phase: ns * 1e-9 for phase, ns in self.step_ns.items()},
+                'counters': dict(self.step_counts)}
+
+    @staticmethod
+    def bucket_edges():
+        '''
+        Upper latency bound of each histogram bucket in seconds,
+        bucket i holds latencies below 2**i nanoseconds
+        '''
+        return 2.0 ** np.arange(N_BUCKETS) * 1e-9
+
+    def summary(self):
+        '''
+        Cumulative per-phase mean latency and histogram, and
+        the counter totals since the last reset()
+        '''
+        steps = max(self.n_steps, 1)
+        return {
+            'steps': self.n_steps,
+            'phases': {phase: {'total': self.total_ns[phase] * 1e-9,
+                               'mean': self.total_ns[phase] * 1e-9 / steps,
+                               'histogram': self.histograms[phase].copy()}
+                       for phase in PHASES},
+            'counters': dict(self.totals),
+        }
@@ -0,0 +1,162 @@
+'''
+Replay buffer of (state, action, reward, next_state, done)
+transitions kept in np.memmap files, so that it can hold
+far more transitions than fit in RAM. Appends are O(1),
+uniform and prioritised sampling return whole index batches,
+and a buffer reopened on the same directory resumes from
+the last flush()
+'''
+import json
+import os
+
+import numpy as np
+
+
+class ReplayBuffer:
+    def __init__(self, directory, capacity, observation_dim, dtype=np.float32,
+                 alpha=0.6, flush_interval=10000, seed=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.capacity = capacity
+        self.observation_dim = observation_dim
+        self.dtype = np.dtype(dtype)
+        self.alpha = alpha
+        self.flush_interval = flush_interval
+        self.rng = np.random.default_rng(seed)
+        self.position = 0
+        self.size = 0
+        self.max_priority = 1.0
+
+        meta = self._read_meta()
+        if meta is not None:
+            if (meta['capacity'], meta['observation_dim'], meta['dtype']) != (capacity, observation_dim, self.dtype.str):
+                raise ValueError(f'{directory} holds a buffer with a different layout: {meta}')
+            self.position, self.size, self.max_priority = meta['position'], meta['size'], meta['max_priority']
+        mode = 'r+' if meta is not None else 'w+'
+        self.states = self._open('state', (capacity, observation_dim), self.dtype, mode)
+        self.next_states = self._open('next_state', (capacity, observation_dim), self.dtype, mode)
+        self.actions = self._open('action', (capacity,), np.int64, mode)
+        self.rewards = self._open('reward', (capacity,), np.float32, mode)
+        self.dones = self._open('done', (capacity,), bool, mode)
+        self.priorities = self._open('priority', (capacity,), np.float64, mode)
+        self.tree = SumTree(capacity)
+        if self.size:
+            self.tree.update(np.arange(self.size), self.priorities[:self.size] ** self.alpha)
+
+    @classmethod
+    def from_network(cls, network, directory, capacity, **kwargs):
+        '''
+        Observation width follows network.observation_shape, so
+        that gym is not needed. Observations are kept as float32,
+        the dtype of network.observation_space
+        '''
+        return cls(directory, capacity, network.observation_shape[0], **kwargs)
+
+    def _open(self, name, shape, dtype, mode):
+        return np.memmap(os.path.join(self.directory, f'{name}.dat'), dtype=dtype, mode=mode, shape=shape)
+
+    def _read_meta(self):
+        path = os.path.join(self.directory, 'meta.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def append(self, state, action, reward, next_state, done):
+        i = self.position
+        self.states[i] = state
+        self.next_states[i] = next_state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.dones[i] = done
+        ## New transitions get the highest priority seen so far
+        self.priorities[i] = self.max_priority
+        self.tree.update(np.array([i]), np.array([self.max_priority ** self.alpha]))
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        if self.position % self.flush_interval == 0:
+            self.flush()
+
+    def sample(self, batch_size):
+        '''
+        Uniformly drawn transition indices
+        '''
+        return self.rng.integers(self.size, size=batch_size)
+
+    def sample_prioritized(self, batch_size, beta=0.4):
+        '''
+        Indices drawn with probability priority^alpha and
+        their normalised importance sampling weights
+        '''
+        indices = self.tree.find(self.rng.random(batch_size) * self.tree.total())
+        indices = np.minimum(indices, self.size - 1)
+        probabilities = self.tree.leaves(indices) / self.tree.total()
+        weights = (self.size * probabilities) ** -beta
+        return indices, weights / weights.max()
+
+    def update_priorities(self, indices, priorities):
+        priorities = np.asarray(priorities, dtype=np.float64)
+        if priorities.size == 0:
+            return
+        self.priorities[indices] = priorities
+        self.tree.update(np.asarray(indices), priorities ** self.alpha)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+
+    def get(self, indices):
+        return (self.states[indices], self.actions[indices], self.rewards[indices],
+                self.next_states[indices], self.dones[indices])
+
+    def flush(self):
+        '''
+        Syncs the files and then records position and size, so a
+        restarted process never sees transitions that were not on disk
+        '''
+        for column in (self.states, self.next_states, self.actions, self.rewards, self.dones, self.priorities):
+            column.flush()
+        meta = {'capacity': self.capacity, 'observation_dim': self.observation_dim, 'dtype': self.dtype.str,
+                'position': self.position, 'size': self.size, 'max_priority': self.max_priority}
+        path = os.path.join(self.directory, 'meta.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path)
+
+    def __len__(self):
+        return self.size
+
+
+class SumTree:
+    '''
+    Binary tree of priority sums over the buffer slots,
+    updated and searched level by level for whole batches
+    '''
+    def __init__(self, capacity):
+        self.n_leaves = 1 << max(capacity - 1, 1).bit_length()
+        self.nodes = np.zeros(2 * self.n_leaves, dtype=np.float64)
+
+    def total(self):
+        return self.nodes[1]
+
+    def leaves(self, indices):
+        return self.nodes[self.n_leaves + indices]
+
+    def update(self, indices, values):
+        if indices.size == 0:
+            return
+        nodes = self.n_leaves + indices
+        self.nodes[nodes] = values
+        while nodes[0] > 1:
+            nodes = np.unique(nodes // 2)
+            self.nodes[nodes] = self.nodes[2 * nodes] + self.nodes[2 * nodes + 1]
+
+    def find(self, values):
+        '''
+        Leaf index at which the running sum of priorities
+        passes each value
+        '''
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.n_leaves:
+            left = 2 * nodes
+            go_right = values >= self.nodes[left]
+            values = values - np.where(go_right, self.nodes[left], 0)
+            nodes = left + go_right
+        return nodes - self.n_leaves
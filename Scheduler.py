@@ -0,0 +1,140 @@
+'''
+Event-driven alternative to the request sampling of
+Network.generate_user_requests(). Instead of drawing a
+random subset of the whole population every step, every
+idle client gets the step of its next request in a
+calendar queue, and a step only touches the clients whose
+request is due plus the clients with an open session
+'''
+import copy
+
+import numpy as np
+
+
+def request_probability(usage_freq, n_points=64):
+    '''
+    Probability that a client requests in a step of the sampled
+    model. generate_user_requests() picks it about Poisson(a)
+    times, a = max(u, 0.1) for u uniform in [0, 1), and every
+    pick of an idle client requests with probability 1 - usage_freq
+    '''
+    a = np.maximum((np.arange(n_points) + 0.5) / n_points, 0.1)
+    return 1 - np.exp(-np.multiply.outer(1 - usage_freq, a)).mean(axis=1)
+
+
+class CalendarQueue:
+    '''
+    One bucket of client indices per future step. Pushing a
+    batch groups it by step, popping returns the whole bucket
+    '''
+    def __init__(self):
+        self.buckets = {}
+
+    def push(self, indices, times):
+        order = np.argsort(times, kind='stable')
+        indices, times = indices[order], times[order]
+        starts = np.flatnonzero(np.r_[True, times[1:] != times[:-1]])
+        for time, chunk in zip(times[starts].tolist(), np.split(indices, starts[1:])):
+            self.buckets.setdefault(time, []).append(chunk)
+
+    def pop(self, time):
+        chunks = self.buckets.pop(time, None)
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return sum(len(chunk) for chunks in self.buckets.values() for chunk in chunks)
+
+
+class RequestScheduler:
+    '''
+    Drives ClientPopulation.iter() from events. The next request
+    of an idle client is a geometric number of steps away, with
+    the per-step probability of request_probability(). Clients
+    with an open session (usage left or connected) take part in
+    a Poisson(n_selected/n_clients) number of rounds per step, as
+    they would when picked n_selected times at random
+    '''
+    def __init__(self, population, rng=None):
+        self.population = population
+        self._rng = rng
+        self.time = 0
+        self.request_probability = request_probability(population.usage_freq)
+        self.queue = CalendarQueue()
+
+        population.due = np.zeros(population.n_clients, dtype=bool)
+        busy = (population.usage_remaining > 0) | population.connected
+        self.active = np.flatnonzero(busy)
+        self.schedule(np.flatnonzero(~busy))
+
+    @property
+    def rng(self):
+        ## Follows population.rng, which Network.seed() replaces
+        return self._rng if self._rng is not None else self.population.rng
+
+    def schedule(self, indices):
+        '''
+        Queues the next request of the given idle clients
+        '''
+        indices = indices[self.request_probability[indices] > 0]
+        if indices.size:
+            delays = self.rng.geometric(self.request_probability[indices])
+            self.queue.push(indices, self.time + delays)
+
+    def step(self, n_selected):
+        '''
+        Runs one step over the due and active clients and
+        returns the indices passed to ClientPopulation.iter()
+        '''
+        population = self.population
+        self.time += 1
+        due = self.queue.pop(self.time)
+        ## Like the sampled model, clients without a base
+        ## station skip their turn
+        attached = population.base_station_index[due] >= 0
+        self.schedule(due[~attached])
+        due = due[attached]
+        population.due[due] = True
+
+        ## A due client takes its request round plus as many
+        ## further rounds as an active one
+        sessions = np.concatenate((due, self.active))
+        rounds = self.rng.poisson(n_selected / population.n_clients, size=sessions.size)
+        rounds[:due.size] += 1
+        indices = np.repeat(sessions, rounds)
+        population.iter(indices)
+        population.due[due] = False
+
+        busy = (population.usage_remaining[sessions] > 0) | population.connected[sessions]
+        self.active = sessions[busy]
+        self.schedule(sessions[~busy])
+        return indices
+
+    def expected_selections(self, n_selected):
+        '''
+        Expected number of the n_selected random picks of
+        generate_user_requests() landing on every slice
+        '''
+        population = self.population
+        return population.slice_members * (n_selected / population.n_clients)
+
+    def snapshot(self):
+        return {'time': self.time, 'active': self.active.copy(),
+                'queue': {time: [chunk.copy() for chunk in chunks] for time, chunks in self.queue.buckets.items()},
+                'rng': None if self._rng is None else self._rng.bit_generator.state}
+
+    def restore(self, state):
+        self.time = state['time']
+        self.active = state['active'].copy()
+        self.queue.buckets = {time: [chunk.copy() for chunk in chunks] for time, chunks in state['queue'].items()}
+        if state['rng'] is not None:
+            self._rng.bit_generator.state = state['rng']
+
+    def fork(self, population):
+        '''
+        Copy driving another population, restore() fills its state
+        '''
+        scheduler = copy.copy(self)
+        scheduler.population = population
+        scheduler._rng = copy.deepcopy(self._rng)
+        scheduler.queue = CalendarQueue()
+        return scheduler
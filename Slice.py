@@ -1,19 +1,111 @@
-class Slice:
-    def __init__(self, name, ratio,
-                 connected_users, user_share, delay_tolerance, qos_class,
-                 bandwidth_guaranteed, bandwidth_max, init_capacity,
-                 usage_pattern):
+import copy
+
+import numpy as np
+
+from Container import ContainerView
+
+
+class SliceType:
+    '''
+    Static parameters of a slice, shared by the slice
+    of that name in every base station
+    '''
+    __slots__ = ('name', 'user_share', 'delay_tolerance', 'qos_class',
+                 'bandwidth_guaranteed', 'bandwidth_max', 'usage_pattern')
+
+    def __init__(self, name, user_share, delay_tolerance, qos_class,
+                 bandwidth_guaranteed, bandwidth_max, usage_pattern):
         self.name = name
-        self.connected_users = connected_users
         self.user_share = user_share
         self.delay_tolerance = delay_tolerance
         self.qos_class = qos_class
-        self.ratio = ratio
         self.bandwidth_guaranteed = bandwidth_guaranteed
         self.bandwidth_max = bandwidth_max
-        self.init_capacity = init_capacity
-        self.capacity = 0
         self.usage_pattern = usage_pattern
+
+
+class SliceTable:
+    '''
+    Mutable state of every slice of a base station layout,
+    one (n_base_stations, n_slices) array per field. The
+    Slice objects of the layout are views of one cell, so
+    the whole layout can be updated with array operations
+    '''
+    FIELDS = ('init_capacity', 'capacity', 'level', 'connected_users')
+
+    def __init__(self, slice_types, n_base_stations):
+        self.slice_types = list(slice_types)
+        self.shape = (n_base_stations, len(self.slice_types))
+        self.init_capacity = np.zeros(self.shape)
+        self.capacity = np.zeros(self.shape)
+        self.level = np.zeros(self.shape)
+        self.connected_users = np.zeros(self.shape, dtype=np.int64)
+        self.bandwidth_max = np.array([t.bandwidth_max for t in self.slice_types], dtype=np.float64)
+        self.bandwidth_guaranteed = np.array([t.bandwidth_guaranteed for t in self.slice_types], dtype=np.float64)
+        self.delay_tolerance = np.array([t.delay_tolerance for t in self.slice_types], dtype=np.float64)
+
+    def snapshot(self):
+        return {name: getattr(self, name).copy() for name in self.FIELDS}
+
+    def restore(self, state):
+        for name in self.FIELDS:
+            np.copyto(getattr(self, name), state[name])
+
+    def fork(self):
+        '''
+        Copy with arrays of its own, the static
+        parameters stay shared
+        '''
+        table = copy.copy(self)
+        for name, value in self.snapshot().items():
+            setattr(table, name, value)
+        return table
+
+
+class Slice:
+    __slots__ = ('slice_type', 'ratio', 'table', 'cell')
+
+    def __init__(self, slice_type, ratio, connected_users, init_capacity, table=None, cell=(0, 0)):
+        ## A slice built on its own gets a table of its own
+        self.table = table if table is not None else SliceTable([slice_type], 1)
+        self.cell = cell
+        self.slice_type = slice_type
+        self.connected_users = connected_users
+        self.ratio = ratio
+        self.init_capacity = init_capacity
+
+    def _static(name):
+        return property(lambda self: getattr(self.slice_type, name))
+
+    name = _static('name')
+    user_share = _static('user_share')
+    delay_tolerance = _static('delay_tolerance')
+    qos_class = _static('qos_class')
+    bandwidth_guaranteed = _static('bandwidth_guaranteed')
+    bandwidth_max = _static('bandwidth_max')
+    usage_pattern = _static('usage_pattern')
+    del _static
+
+    def _state(name):
+        def fget(self):
+            return getattr(self.table, name)[self.cell].item()
+
+        def fset(self, value):
+            getattr(self.table, name)[self.cell] = value
+        return property(fget, fset)
+
+    connected_users = _state('connected_users')
+    init_capacity = _state('init_capacity')
+    del _state
+
+    @property
+    def capacity(self):
+        return ContainerView(self.table, self.cell)
+
+    @capacity.setter
+    def capacity(self, container):
+        self.table.capacity[self.cell] = container.capacity
+        self.table.level[self.cell] = container.level
     
     def get_consumable_share(self):
         if self.connected_users <= 0:
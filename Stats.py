@@ -1,24 +1,97 @@
+import copy
+import math
+
 import numpy as np
 
+from Coverage import CoverageGrid
+from History import OnlineSummary, RingBuffer
+
+SERIES = ('total_connected_users_ratio', 'total_used_bw', 'avg_slice_load_ratio',
+          'avg_slice_client_count', 'coverage_ratio', 'connect_attempt',
+          'block_count', 'handover_count')
+HISTORIES = SERIES + ('user_in_each_slice',)
+AGGREGATES = ('tracking', 'in_area_count', 'connected_count', 'covered_count', 'slice_capacity',
+              'slice_used_bw', 'slice_users', 'used_bw', 'capacity_total', 'users_total')
+
 class Stats:
-    def __init__(self, base_stations, clients, area):
+    def __init__(self, base_stations, clients, area, debug=False, history_size=None):
         
         self.base_stations = base_stations
+        self.population = None
         self.clients = clients
         self.area = area
+        self.debug = debug
         #self.graph = graph
 
+        # Running aggregates, see track()
+        self.tracking = False
+        self.coverage = CoverageGrid.from_base_stations(base_stations)
+        self.in_area_count = 0
+        self.connected_count = 0
+        self.covered_count = 0
+        self.slice_capacity = None
+        self.slice_used_bw = None
+        self.slice_users = None
+        self.used_bw = 0
+        self.capacity_total = 0
+        self.users_total = 0
+
         # Stats
-        self.total_connected_users_ratio = [0]
-        self.total_used_bw = [0]
-        self.avg_slice_load_ratio = [0]
-        self.avg_slice_client_count = [0]
-        self.coverage_ratio = [0]
-        self.connect_attempt = [0]
-        self.block_count = [0]
-        self.handover_count = [0]
-        self.user_in_each_slice = [0]
+        # Histories are unbounded lists by default. With a
+        # history_size they are RingBuffers keeping only the
+        # newest history_size intervals
+        self.slice_names = [sl.name for sl in base_stations[0].slices] if base_stations else []
+        for name in SERIES:
+            setattr(self, name, self._new_history(history_size))
+        self.user_in_each_slice = self._new_history(
+            history_size, np.dtype([(name, np.float64) for name in self.slice_names]))
+        self.summaries = {name: OnlineSummary() for name in SERIES}
+        self.summaries['user_in_each_slice'] = OnlineSummary((len(self.slice_names),))
     
+    @property
+    def clients(self):
+        ## Views of the tracked population are only built
+        ## when a full scan (compute_*) needs them
+        if self._clients is None and self.population is not None:
+            return self.population.views
+        return self._clients
+
+    @clients.setter
+    def clients(self, clients):
+        self._clients = clients
+
+    def snapshot(self):
+        state = {name: copy.copy(getattr(self, name)) for name in AGGREGATES}
+        state['histories'] = {name: self._history_state(getattr(self, name)) for name in HISTORIES}
+        state['summaries'] = copy.deepcopy(self.summaries)
+        return state
+
+    def restore(self, state):
+        for name in AGGREGATES:
+            current, value = getattr(self, name), state[name]
+            if isinstance(current, np.ndarray) and current.shape == value.shape:
+                np.copyto(current, value)
+            else:
+                setattr(self, name, copy.copy(value))
+        for name, history in state['histories'].items():
+            setattr(self, name, self._restored_history(history))
+        self.summaries = copy.deepcopy(state['summaries'])
+
+    def fork(self, base_stations):
+        '''
+        Copy with its own counters and histories for the
+        forked base stations, sharing the coverage grid
+        '''
+        stats = copy.copy(self)
+        stats.base_stations = base_stations
+        state = self.snapshot()
+        for name in AGGREGATES:
+            setattr(stats, name, state[name])
+        for name, history in state['histories'].items():
+            setattr(stats, name, self._restored_history(history))
+        stats.summaries = state['summaries']
+        return stats
+
     def get_stats(self):
         return (
             self.total_connected_users_ratio,
@@ -31,28 +104,177 @@ class Stats:
             self.user_in_each_slice
         )
 
+    @staticmethod
+    def _history_state(history):
+        ## List histories only grow and only their last entry
+        ## changes, so a snapshot keeps the list and its length
+        ## and copies the last entry instead of the whole list
+        if isinstance(history, RingBuffer):
+            return history.copy()
+        return history, len(history), copy.copy(history[-1])
+
+    @staticmethod
+    def _restored_history(state):
+        if isinstance(state, RingBuffer):
+            return state.copy()
+        history, length, last = state
+        return history[:length - 1] + [copy.copy(last)]
+
+    @staticmethod
+    def _new_history(history_size, dtype=np.float64):
+        if history_size is None:
+            return [0]
+        history = RingBuffer(history_size, dtype)
+        history.append(np.zeros((), dtype=dtype))
+        return history
+
     def collect(self):
         
         self.connect_attempt.append(0)
         self.block_count.append(0)
         self.handover_count.append(0)
         while True:
-            self.block_count[-1] /= self.connect_attempt[-1] if self.connect_attempt[-1] != 0 else 1
-            self.handover_count[-1] /= self.connect_attempt[-1] if self.connect_attempt[-1] != 0 else 1
+            self.collect_step()
+
+    def collect_step(self):
+        '''
+        One interval of collect(): closes the counters of the
+        current interval, records every metric and opens the
+        next interval. Can be driven once per env step
+        '''
+        self.block_count[-1] /= self.connect_attempt[-1] if self.connect_attempt[-1] != 0 else 1
+        self.handover_count[-1] /= self.connect_attempt[-1] if self.connect_attempt[-1] != 0 else 1
+        for name in ('connect_attempt', 'block_count', 'handover_count'):
+            self.summaries[name].update(getattr(self, name)[-1])
+
+        self._record('total_connected_users_ratio', self.get_total_connected_users_ratio())
+        self._record('total_used_bw', self.get_total_used_bw())
+        self._record('avg_slice_load_ratio', self.get_avg_slice_load_ratio())
+        self._record('avg_slice_client_count', self.get_avg_slice_client_count())
+        self._record('coverage_ratio', self.get_coverage_ratio())
+        user_in_each_slice = self.used_bw_each_slice()
+        self.user_in_each_slice.append(user_in_each_slice)
+        self.summaries['user_in_each_slice'].update([user_in_each_slice[name] for name in self.slice_names])
+
+        self.connect_attempt.append(0)
+        self.block_count.append(0)
+        self.handover_count.append(0)
+
+    def _record(self, name, value):
+        getattr(self, name).append(value)
+        self.summaries[name].update(value)
+
+    def get_summary(self, name):
+        '''
+        Count, mean, variance, min and max of a series
+        over the whole run, including evicted intervals
+        '''
+        return self.summaries[name].as_dict()
+
+    @property
+    def slice_table(self):
+        return self.base_stations[0].slices[0].table
+
+    def track(self, population):
+        '''
+        Switches the metrics to running aggregates. The
+        population reports every connect, disconnect, consume,
+        release and association change through the update_*
+        methods, so each get_* call is O(1) instead of a scan
+        over all the clients or slices
+        '''
+        self.population = population
+        in_area = self.are_in_coverage(population.x, population.y)
+        self.in_area_count = int(np.count_nonzero(in_area))
+        self.connected_count = int(np.count_nonzero(in_area & population.connected))
+        self.covered_count = int(np.count_nonzero(
+            self.are_covered(population.x, population.y, population.base_station_index)))
+        self.slice_users = self.slice_table.connected_users.reshape(-1).copy()
+        self.users_total = int(self.slice_users.sum())
+        self.reset_capacity()
+        self.tracking = True
+
+    def reset_capacity(self):
+        '''
+        Re-reads the slice Containers after they are rebuilt
+        '''
+        table = self.slice_table
+        self.slice_capacity = table.capacity.reshape(-1).copy()
+        self.slice_used_bw = self.slice_capacity - table.level.reshape(-1)
+        self.capacity_total = float(self.slice_capacity.sum())
+        self.used_bw = float(self.slice_used_bw.sum())
 
-            self.total_connected_users_ratio.append(self.get_total_connected_users_ratio())
-            self.total_used_bw.append(self.get_total_used_bw())
-            self.avg_slice_load_ratio.append(self.get_avg_slice_load_ratio())
-            self.avg_slice_client_count.append(self.get_avg_slice_client_count())
-            self.coverage_ratio.append(self.get_coverage_ratio())
-            self.user_in_each_slice.append(self.used_bw_each_slice())
+    def update_connections(self, xs, ys, slice_ids, delta):
+        self.connected_count += delta * int(np.count_nonzero(self.are_in_coverage(xs, ys)))
+        self.slice_users += delta * np.bincount(slice_ids, minlength=self.slice_users.size)
+        self.users_total += delta * len(slice_ids)
 
-            self.connect_attempt.append(0)
-            self.block_count.append(0)
-            self.handover_count.append(0)
-            
+    def update_positions(self, old_xs, old_ys, xs, ys, base_station_index, connected):
+        '''
+        Clients that moved, before they are re-associated
+        '''
+        was_in_area = self.are_in_coverage(old_xs, old_ys)
+        in_area = self.are_in_coverage(xs, ys)
+        was_covered = was_in_area & self.coverage.covers(old_xs, old_ys, base_station_index)
+        covered = in_area & self.coverage.covers(xs, ys, base_station_index)
+        self.in_area_count += int(np.count_nonzero(in_area)) - int(np.count_nonzero(was_in_area))
+        self.connected_count += (int(np.count_nonzero(in_area & connected))
+                                 - int(np.count_nonzero(was_in_area & connected)))
+        self.covered_count += int(np.count_nonzero(covered)) - int(np.count_nonzero(was_covered))
+
+    def update_usage(self, slice_ids, amounts):
+        self.slice_used_bw += np.bincount(slice_ids, weights=amounts, minlength=self.slice_used_bw.size)
+        self.used_bw += float(amounts.sum())
+
+    def update_coverage(self, xs, ys, old_index, new_index):
+        self.covered_count += (int(np.count_nonzero(self.are_covered(xs, ys, new_index)))
+                               - int(np.count_nonzero(self.are_covered(xs, ys, old_index))))
+
+    def are_covered(self, xs, ys, base_station_index):
+        '''
+        Clients inside the area that lie in the coverage of
+        their base station (-1 stands for no base station)
+        '''
+        return self.are_in_coverage(xs, ys) & self.coverage.covers(xs, ys, base_station_index)
+
+    def _checked(self, name, value, compute, abs_tol=1e-9):
+        if self.debug:
+            expected = compute()
+            if not math.isclose(value, expected, rel_tol=1e-9, abs_tol=abs_tol):
+                raise AssertionError(f'{name}: running aggregate {value} != recomputed {expected}')
+        return value
 
     def get_total_connected_users_ratio(self):
+        if not self.tracking:
+            return self.compute_total_connected_users_ratio()
+        value = self.connected_count/self.in_area_count if self.in_area_count != 0 else 0
+        return self._checked('total_connected_users_ratio', value, self.compute_total_connected_users_ratio)
+
+    def get_total_used_bw(self):
+        if not self.tracking:
+            return self.compute_total_used_bw()
+        ## bandwidths are in bps, allow 1 bps of rounding drift
+        return self._checked('total_used_bw', self.used_bw, self.compute_total_used_bw, abs_tol=1)
+
+    def get_avg_slice_load_ratio(self):
+        if not self.tracking:
+            return self.compute_avg_slice_load_ratio()
+        value = self.used_bw/self.capacity_total if self.capacity_total != 0 else 0
+        return self._checked('avg_slice_load_ratio', value, self.compute_avg_slice_load_ratio)
+
+    def get_avg_slice_client_count(self):
+        if not self.tracking:
+            return self.compute_avg_slice_client_count()
+        value = self.users_total/self.slice_users.size if self.slice_users.size != 0 else 0
+        return self._checked('avg_slice_client_count', value, self.compute_avg_slice_client_count)
+
+    def get_coverage_ratio(self):
+        if not self.tracking:
+            return self.compute_coverage_ratio()
+        value = self.covered_count/self.in_area_count if self.in_area_count != 0 else 0
+        return self._checked('coverage_ratio', value, self.compute_coverage_ratio)
+
+    def compute_total_connected_users_ratio(self):
         t, cc = 0, 0
         for c in self.clients:
             if self.is_client_in_coverage(c):
@@ -63,14 +285,14 @@ class Stats:
         #         t += sl.connected_users
         return t/cc if cc != 0 else 0
 
-    def get_total_used_bw(self):
+    def compute_total_used_bw(self):
         t = 0
         for bs in self.base_stations:
             for sl in bs.slices:
                 t += sl.capacity.capacity - sl.capacity.level
         return t
 
-    def get_avg_slice_load_ratio(self):
+    def compute_avg_slice_load_ratio(self):
         t, c = 0, 0
         for bs in self.base_stations:
             for sl in bs.slices:
@@ -80,7 +302,7 @@ class Stats:
                 #t += (sl.capacity.capacity - sl.capacity.level) / sl.capacity.capacity
         return t/c if c !=0 else 0
 
-    def get_avg_slice_client_count(self):
+    def compute_avg_slice_client_count(self):
         t, c = 0, 0
         for bs in self.base_stations:
             for sl in bs.slices:
@@ -88,7 +310,7 @@ class Stats:
                 t += sl.connected_users
         return t/c if c !=0 else 0
     
-    def get_coverage_ratio(self):
+    def compute_coverage_ratio(self):
         t, cc = 0, 0
         for c in self.clients:
             if self.is_client_in_coverage(c):
@@ -109,11 +331,27 @@ class Stats:
         if self.is_client_in_coverage(client):
             self.handover_count[-1] += 1
 
+    def incr_connect_attempts(self, xs, ys):
+        self.connect_attempt[-1] += int(np.count_nonzero(self.are_in_coverage(xs, ys)))
+
+    def incr_block_counts(self, xs, ys):
+        self.block_count[-1] += int(np.count_nonzero(self.are_in_coverage(xs, ys)))
+
+    def incr_handover_counts(self, xs, ys):
+        self.handover_count[-1] += int(np.count_nonzero(self.are_in_coverage(xs, ys)))
+
+    def are_in_coverage(self, xs, ys):
+        xs_range, ys_range = self.area
+        return ((xs_range[0] <= xs) & (xs <= xs_range[1])
+                & (ys_range[0] <= ys) & (ys <= ys_range[1]))
+
     def is_client_in_coverage(self, client):
         xs, ys = self.area
         return True if xs[0] <= client.x <= xs[1] and ys[0] <= client.y <= ys[1] else False
     
     def get_users_in_each_slice(self):
+        if self.tracking and not self.debug:
+            return self._last_base_station_slices(self.slice_users)
         slice_hash_table = {}
         for bs in self.base_stations:
             for itr, slice in enumerate(bs.slices):
@@ -121,8 +359,16 @@ class Stats:
         return slice_hash_table
         
     def used_bw_each_slice(self):
+        if self.tracking and not self.debug:
+            return self._last_base_station_slices(self.slice_used_bw)
         slice_hash_table = {}
         for bs in self.base_stations:
             for slice in bs.slices:
                 slice_hash_table[slice.name] = slice.capacity.capacity - slice.capacity.level
-        return slice_hash_table
\ No newline at end of file
+        return slice_hash_table
+
+    def _last_base_station_slices(self, values):
+        ## The scans above keep the value of the last
+        ## base station for every slice name
+        slices = self.base_stations[-1].slices
+        return {sl.name: v for sl, v in zip(slices, values[-len(slices):].tolist())}
@@ -0,0 +1,209 @@
+'''
+Runs Network instances in worker processes. Every worker
+builds its own Network (own seed, own clients_init()
+population) and writes observations, rewards and done
+flags straight into multiprocessing.shared_memory arrays,
+so the only per-step traffic over the pipes is a one byte
+command and a one byte acknowledgement
+'''
+import multiprocessing as mp
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+STEP, RESET, CLOSE, ACK = b's', b'r', b'c', b'k'
+
+
+def _attach(name, shape, dtype):
+    ## Workers share the parent's resource tracker, the
+    ## parent unlinks the blocks in SubprocNetwork.close()
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _worker(index, conn, layout, bs_params, slice_params, client_params, n_clients, seed):
+    from Network import Network
+
+    blocks = {name: _attach(*spec) for name, spec in layout.items()}
+    arrays = {name: array for name, (_, array) in blocks.items()}
+    ## The population is drawn from the seed as well, so a
+    ## worker (or its restart) can be rebuilt from its seed
+    nw = Network(bs_params, slice_params, client_params, n_clients=n_clients,
+                 client_rng=np.random.default_rng(seed))
+    nw.seed(seed)
+    arrays['observations'][index] = nw.reset()
+    conn.send_bytes(ACK)
+    while True:
+        command = conn.recv_bytes()
+        if command == STEP:
+            state, _, reward, done, _ = nw.step(int(arrays['actions'][index]))
+            arrays['rewards'][index] = reward
+            arrays['dones'][index] = done
+            if done:
+                arrays['terminal_observations'][index] = state
+                state = nw.reset()
+            arrays['observations'][index] = state
+        elif command == RESET:
+            arrays['observations'][index] = nw.reset()
+        elif command == CLOSE:
+            break
+        conn.send_bytes(ACK)
+    for shm, _ in blocks.values():
+        shm.close()
+
+
+class SubprocNetwork:
+    """
+    Description:
+        n_envs Network instances, one per worker process, stepped
+        with step_async()/step_wait(). Finished environments are
+        reset inside their worker, the last state before the reset
+        is kept in terminal_observations. A worker that dies is
+        restarted with a fresh Network and reported in
+        info['restarted'], its environment is flagged done.
+    """
+
+    def __init__(self, n_envs, bs_params, slice_params, client_params, seed=0, timeout=60, n_clients=100):
+        self.n_envs = n_envs
+        self.params = (bs_params, slice_params, client_params, n_clients)
+        self.seed = seed
+        self.timeout = timeout
+        self.context = mp.get_context()
+        self.restarts = np.zeros(n_envs, dtype=np.int64)
+
+        from Network import Network
+        ## The observation size does not depend on the clients
+        probe = Network(bs_params, slice_params, client_params, n_clients=1,
+                        client_rng=np.random.default_rng(seed))
+        observation_dim = probe.observation_shape[0]
+        shapes = {
+            'observations': ((n_envs, observation_dim), np.float64),
+            'terminal_observations': ((n_envs, observation_dim), np.float64),
+            'rewards': ((n_envs,), np.float64),
+            'dones': ((n_envs,), bool),
+            'actions': ((n_envs,), np.int64),
+        }
+        self.blocks = {}
+        self.layout = {}
+        for name, (shape, dtype) in shapes.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+            self.blocks[name] = shm
+            self.layout[name] = (shm.name, shape, dtype)
+            setattr(self, name, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+        self.processes = [None] * n_envs
+        self.connections = [None] * n_envs
+        for index in range(n_envs):
+            self._start(index)
+        for index in range(n_envs):
+            if not self._wait(index):
+                self._restart(index)
+
+    def _start(self, index):
+        parent, child = self.context.Pipe()
+        seed = self.seed + index + int(self.restarts[index]) * self.n_envs
+        process = self.context.Process(target=_worker, daemon=True,
+                                       args=(index, child, self.layout, *self.params, seed))
+        process.start()
+        child.close()
+        self.processes[index] = process
+        self.connections[index] = parent
+
+    def _wait(self, index):
+        '''
+        Waits for the acknowledgement of one worker, False
+        if the worker died or timed out
+        '''
+        connection, process = self.connections[index], self.processes[index]
+        deadline = time.monotonic() + self.timeout
+        while not connection.poll(0.05):
+            if not process.is_alive() or time.monotonic() > deadline:
+                return False
+        try:
+            return connection.recv_bytes() == ACK
+        except (EOFError, OSError):
+            return False
+
+    def _restart(self, index):
+        process = self.processes[index]
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        self.connections[index].close()
+        self.restarts[index] += 1
+        self._start(index)
+        if not self._wait(index):
+            raise RuntimeError(f'worker {index} failed to restart')
+
+    def _send(self, index, command):
+        try:
+            self.connections[index].send_bytes(command)
+        except (BrokenPipeError, OSError):
+            pass  # picked up as a crash by _wait()
+
+    def reset(self):
+        for index in range(self.n_envs):
+            self._send(index, RESET)
+        for index in range(self.n_envs):
+            if not self._wait(index):
+                self._restart(index)
+        return np.array(self.observations)
+
+    def step_async(self, actions):
+        self.actions[:] = actions
+        for index in range(self.n_envs):
+            self._send(index, STEP)
+
+    def step_wait(self):
+        restarted = []
+        for index in range(self.n_envs):
+            if not self._wait(index):
+                self._restart(index)
+                self.rewards[index] = 0
+                self.dones[index] = True
+                restarted.append(index)
+        info = {'terminal_observations': np.array(self.terminal_observations), 'restarted': restarted}
+        return np.array(self.observations), np.array(self.rewards), np.array(self.dones), info
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        for index in range(self.n_envs):
+            self._send(index, CLOSE)
+        for process in self.processes:
+            process.join(timeout=self.timeout)
+            if process.is_alive():
+                process.terminate()
+        for name, shm in self.blocks.items():
+            setattr(self, name, None)
+            shm.close()
+            shm.unlink()
+
+
+def benchmark(bs_params, slice_params, client_params, max_workers=None, steps=200):
+    '''
+    Steps/sec of a SubprocNetwork with 1 .. max_workers workers
+    '''
+    max_workers = max_workers or mp.cpu_count()
+    results = {}
+    for n_workers in range(1, max_workers + 1):
+        runner = SubprocNetwork(n_workers, bs_params, slice_params, client_params)
+        rng = np.random.default_rng(0)
+        start = time.perf_counter()
+        for _ in range(steps):
+            runner.step(rng.integers(7, size=n_workers))
+        elapsed = time.perf_counter() - start
+        runner.close()
+        results[n_workers] = n_workers * steps / elapsed
+        print(f'{n_workers:>3} workers: {results[n_workers]:>10.1f} steps/sec')
+    return results
+
+
+if __name__ == "__main__":
+    from main import BS_PARAMS, SLICE_PARAMS, CLIENT_PARAMS
+    benchmark(BS_PARAMS, SLICE_PARAMS, CLIENT_PARAMS,
+              max_workers=int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,160 @@
+'''
+Base station layouts for large scenarios. A Topology keeps
+the layout as arrays (centers, coverage radii, capacities
+and per-cell slice ratios), generates hexagonal or random
+layouts of thousands of cells and writes them out in the
+BS_PARAMS format of main.py for Network.
+
+The relations between clients and base stations are kept
+as scipy.sparse matrices: which base station each client
+is attached to, which base stations a client could be
+handed over to and which coverage disks overlap. Slice
+loads per base station are sparse mat-vec products of the
+membership matrix with per-client values
+'''
+import math
+
+import numpy as np
+import scipy.sparse as sp
+
+from Coverage import CoverageGrid
+
+
+class Topology:
+    def __init__(self, x, y, coverage, capacity_bandwidth, ratios, slice_names):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.n_base_stations = len(self.x)
+        self.coverage = np.broadcast_to(np.asarray(coverage, dtype=np.float64), self.x.shape).copy()
+        self.capacity_bandwidth = np.broadcast_to(np.asarray(capacity_bandwidth, dtype=np.float64),
+                                                  self.x.shape).copy()
+        ## (n_base_stations, n_slices), rows sum to 1
+        self.ratios = np.asarray(ratios, dtype=np.float64).reshape(self.n_base_stations, -1)
+        self.slice_names = list(slice_names)
+
+    @classmethod
+    def hexagonal(cls, n_base_stations, ratios, area=((0, 1000), (0, 1000)),
+                  capacity_bandwidth=1e9, overlap=1.1, ratio_concentration=None, rng=None):
+        '''
+        Cells on a hexagonal grid over the area, odd rows shifted
+        by half a cell. The coverage radius reaches the farthest
+        point of a cell times overlap, so that neighbouring disks
+        overlap. A partly filled last row, or a single row, is
+        not shifted: its cells are spread evenly over the width
+        and reach the corners of their own, wider cells
+        '''
+        (x0, x1), (y0, y1) = area
+        width, height = x1 - x0, y1 - y0
+        n_cols = max(1, math.ceil(math.sqrt(n_base_stations * width * math.sqrt(3) / (2 * height))))
+        n_rows = math.ceil(n_base_stations / n_cols)
+        dx, dy = width / n_cols, height / n_rows
+        cell = np.arange(n_base_stations)
+        row, col = cell // n_cols, cell % n_cols
+        row_dx = width / np.minimum(n_cols, n_base_stations - row * n_cols)
+        shifted = (row_dx == dx) & (n_rows > 1)
+        x = x0 + (col + 0.5 + np.where(shifted, 0.5 * (row % 2) - 0.25, 0)) * row_dx
+        y = y0 + (row + 0.5) * dy
+        ## Circumradius of the triangle of neighbouring sites
+        corner = (dy*dy - dx*dx/4) / (2*dy)
+        radius = overlap * math.sqrt(dx*dx/4 + corner*corner)
+        radius = np.where(shifted, radius, np.maximum(radius, overlap * np.hypot(row_dx, dy) / 2))
+        return cls(x, y, radius, capacity_bandwidth,
+                   cell_ratios(ratios, n_base_stations, ratio_concentration, rng), ratios)
+
+    @classmethod
+    def random(cls, n_base_stations, ratios, area=((0, 1000), (0, 1000)), coverage=(50, 150),
+               capacity_bandwidth=1e9, ratio_concentration=None, rng=None):
+        '''
+        Cells at uniform random positions, with a coverage
+        radius drawn uniformly from the coverage range
+        '''
+        rng = rng if rng is not None else np.random.default_rng()
+        (x0, x1), (y0, y1) = area
+        x = rng.uniform(x0, x1, n_base_stations)
+        y = rng.uniform(y0, y1, n_base_stations)
+        radius = rng.uniform(*coverage, n_base_stations) if np.ndim(coverage) else coverage
+        return cls(x, y, radius, capacity_bandwidth,
+                   cell_ratios(ratios, n_base_stations, ratio_concentration, rng), ratios)
+
+    def bs_params(self):
+        '''
+        The layout in the BS_PARAMS format of main.py
+        '''
+        return [{'capacity_bandwidth': capacity, 'coverage': coverage,
+                 'ratios': dict(zip(self.slice_names, ratios)), 'x': x, 'y': y}
+                for x, y, coverage, capacity, ratios in zip(
+                    self.x.tolist(), self.y.tolist(), self.coverage.tolist(),
+                    self.capacity_bandwidth.tolist(), self.ratios.tolist())]
+
+    def coverage_grid(self):
+        return CoverageGrid(np.column_stack((self.x, self.y)), self.coverage)
+
+    def coverage_overlap(self):
+        '''
+        (n_base_stations, n_base_stations) boolean matrix of the
+        pairs of distinct cells whose coverage disks overlap
+        '''
+        ## Disks grown by the largest radius catch every center
+        ## whose disk can reach them
+        grid = CoverageGrid(np.column_stack((self.x, self.y)), self.coverage + self.coverage.max())
+        others, cells, distances = grid.pairs(self.x, self.y)
+        keep = (others != cells) & (distances < self.coverage[others] + self.coverage[cells])
+        return sp.csr_matrix((np.ones(np.count_nonzero(keep), dtype=bool), (cells[keep], others[keep])),
+                             shape=(self.n_base_stations, self.n_base_stations))
+
+
+def cell_ratios(ratios, n_base_stations, concentration=None, rng=None):
+    '''
+    Per-cell slice ratios. Every cell gets the ratios dict
+    as is, or with a concentration a Dirichlet draw around it
+    (larger concentrations stay closer to the dict)
+    '''
+    mean = np.array(list(ratios.values()), dtype=np.float64)
+    mean = mean / mean.sum()
+    if concentration is None:
+        return np.tile(mean, (n_base_stations, 1))
+    rng = rng if rng is not None else np.random.default_rng()
+    return rng.dirichlet(concentration * mean, size=n_base_stations)
+
+
+def membership_matrix(population):
+    '''
+    (n_clients, n_base_stations) matrix with a 1 where a
+    client is attached to a base station
+    '''
+    attached = np.flatnonzero(population.base_station_index >= 0)
+    return sp.csr_matrix((np.ones(attached.size), (attached, population.base_station_index[attached])),
+                         shape=(population.n_clients, len(population.base_stations)))
+
+
+def handover_matrix(population, association):
+    '''
+    (n_clients, n_base_stations) matrix of the distances to
+    every base station other than its own that covers each
+    client, the candidates of a handover
+    '''
+    clients = np.arange(population.n_clients)
+    rows, base_stations, distances = association.covering(clients)
+    keep = base_stations != population.base_station_index[rows]
+    ## Distances of 0 would vanish from a sparse matrix
+    return sp.csr_matrix((np.maximum(distances[keep], np.finfo(np.float64).tiny),
+                          (rows[keep], base_stations[keep])),
+                         shape=(population.n_clients, len(population.base_stations)))
+
+
+def slice_loads(population, values=None, membership=None):
+    '''
+    (n_base_stations, n_slices) totals of a per-client value
+    (connected clients by default) over the clients attached
+    to each base station, one sparse mat-vec per slice
+    '''
+    if membership is None:
+        membership = membership_matrix(population)
+    if values is None:
+        values = population.connected
+    values = np.asarray(values, dtype=np.float64)
+    by_base_station = membership.T.tocsr()
+    loads = np.empty((membership.shape[1], population.n_slices))
+    for itr in range(population.n_slices):
+        loads[:, itr] = by_base_station @ np.where(population.subscribed_slice_index == itr, values, 0)
+    return loads
@@ -0,0 +1,147 @@
+'''
+Usage patterns replayed from captured traffic traces. A
+trace file is memory-mapped read-only, so it can be far
+larger than RAM: only the block being consumed is copied
+out, and the kernel is asked to read the next block ahead
+while the current one is used.
+
+A trace is either a .npy file (see numpy.save) of a 1-d
+array, plain or structured with one field per quantity
+(e.g. 'size' and 'time'), or a raw binary file of values
+of a given dtype. Each TraceDistributor streams one field,
+e.g. the request sizes of a slice from a trace that also
+records arrival times.
+
+Only the order of the values is replayed, not the timing
+of the trace: as a usage pattern the trace gives the size
+of each request, while when a client requests still follows
+its usage_freq (or a RequestScheduler). A time field can be
+streamed like any other, but nothing steps by it
+'''
+import copy
+import mmap
+
+import numpy as np
+
+from Distributor import Distributor
+
+
+class TraceDistributor(Distributor):
+    '''
+    Distributor whose samples are the consecutive values of a
+    trace, wrapping around at its end. Every environment reads
+    the trace from its own position: offset fixes the start,
+    offset=None draws it from the seed given to seed(), so
+    environments seeded differently replay different parts of
+    the same mapping without copying it
+    '''
+    def __init__(self, name, path, field=None, dtype=np.float64, offset=0,
+                 divide_scale=1, block_size=65536):
+        super().__init__(name, None, divide_scale=divide_scale, block_size=block_size)
+        self.path = path
+        self.field = field
+        self.dtype = dtype
+        self.mapping, self.records, self.records_offset = open_trace(path, dtype)
+        self.values = self.records if field is None else self.records[field]
+        if len(self.values) == 0:
+            raise ValueError(f'{path} holds an empty trace')
+        self.offset = offset
+        self.cursor = 0 if offset is None else offset % len(self.values)
+
+    @property
+    def buffered(self):
+        return True
+
+    def seed(self, seed=None):
+        '''
+        Rewinds to the start offset, or to one drawn from seed
+        '''
+        if self.offset is None:
+            self.cursor = int(np.random.default_rng(seed).integers(len(self.values)))
+        else:
+            self.cursor = self.offset % len(self.values)
+        self.buffer = np.empty(0)
+        self.position = 0
+
+    def seek(self, offset):
+        '''
+        Sets the start offset, e.g. one per environment, and
+        rewinds to it
+        '''
+        self.offset = offset
+        self.seed()
+
+    def get_state(self):
+        return self.cursor, self.buffer[self.position:].copy()
+
+    def set_state(self, state):
+        self.cursor, buffer = state
+        self.buffer = buffer.copy()
+        self.position = 0
+
+    def fork(self):
+        ## The mapping is read-only and shared by the forks
+        distributor = copy.copy(self)
+        distributor.buffer = self.buffer.copy()
+        return distributor
+
+    def sample(self, rng, size):
+        '''
+        The next size values of the trace as float64, rng is
+        not used. Reading moves the cursor on and starts the
+        read-ahead of the following block
+        '''
+        n = len(self.values)
+        pieces = []
+        while size > 0:
+            stop = min(self.cursor + size, n)
+            pieces.append(self.values[self.cursor:stop])
+            size -= stop - self.cursor
+            self.cursor = stop % n
+        block = np.concatenate(pieces).astype(np.float64) if pieces else np.empty(0)
+        self.read_ahead(self.cursor, self.block_size)
+        return block
+
+    def read_ahead(self, start, count):
+        if not hasattr(mmap, 'MADV_WILLNEED'):
+            return
+        itemsize = self.records.itemsize
+        begin = self.records_offset + start * itemsize
+        end = self.records_offset + min(start + count, len(self.records)) * itemsize
+        page_start = begin - begin % mmap.PAGESIZE
+        if end > page_start:
+            self.mapping.madvise(mmap.MADV_WILLNEED, page_start, end - page_start)
+
+    def __getstate__(self):
+        ## A mapping cannot be pickled, it is opened again
+        state = self.__dict__.copy()
+        del state['mapping'], state['records'], state['values'], state['records_offset']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.mapping, self.records, self.records_offset = open_trace(self.path, self.dtype)
+        self.values = self.records if self.field is None else self.records[self.field]
+
+    def __str__(self):
+        field = '' if self.field is None else f'[{self.field!r}]'
+        return f'[{self.name}: trace {self.path}{field}: {len(self.values)} values]'
+
+
+def open_trace(path, dtype=np.float64):
+    '''
+    Memory-maps a trace file read-only. Returns the mapping,
+    the array of its records and their byte offset in the
+    file. A .npy file gives its own dtype, a raw file is
+    read as dtype
+    '''
+    offset = 0
+    if str(path).endswith('.npy'):
+        header = np.load(path, mmap_mode='r')
+        dtype, offset = header.dtype, header.offset
+        del header
+    dtype = np.dtype(dtype)
+    with open(path, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    count = (len(mapping) - offset) // dtype.itemsize
+    return mapping, np.frombuffer(mapping, dtype=dtype, count=count, offset=offset), offset
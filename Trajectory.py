@@ -0,0 +1,122 @@
+'''
+Columnar binary storage of (state, action, reward, done)
+trajectories. TrajectoryWriter fills preallocated column
+arrays and hands every full chunk to a background thread,
+which saves one .npy file per column and chunk. The
+TrajectoryReader streams the chunks back, memory-mapped,
+for offline analysis and replay
+'''
+import glob
+import os
+import threading
+from queue import Queue
+
+import numpy as np
+
+COLUMNS = ('state', 'action', 'reward', 'done')
+
+
+def chunk_path(directory, column, chunk):
+    return os.path.join(directory, f'{column}_{chunk:06d}.npy')
+
+
+class TrajectoryWriter:
+    def __init__(self, directory, chunk_size=65536, state_dtype=np.float32):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.state_dtype = state_dtype
+        self.buffers = None
+        self.position = 0
+        ## Appends after the chunks already in the directory
+        self.chunk = len(glob.glob(os.path.join(directory, 'done_*.npy')))
+        self.error = None
+        self.queue = Queue(maxsize=2)
+        self.thread = threading.Thread(target=self._flush_worker, daemon=True)
+        self.thread.start()
+
+    def _allocate(self, state, action):
+        ## Column widths come from the first record
+        return {
+            'state': np.empty((self.chunk_size, np.size(state)), dtype=self.state_dtype),
+            'action': np.empty((self.chunk_size, np.size(action)), dtype=np.float32),
+            'reward': np.empty(self.chunk_size, dtype=np.float64),
+            'done': np.empty(self.chunk_size, dtype=bool),
+        }
+
+    def write(self, state, action, reward, done):
+        if self.error is not None:
+            raise self.error
+        if self.buffers is None:
+            self.buffers = self._allocate(state, action)
+        i = self.position
+        self.buffers['state'][i] = np.ravel(state)
+        self.buffers['action'][i] = np.ravel(action)
+        self.buffers['reward'][i] = reward
+        self.buffers['done'][i] = done
+        self.position += 1
+        if self.position == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        Queues the buffered records for writing and
+        continues in a fresh set of buffers
+        '''
+        if self.position == 0:
+            return
+        filled = {column: buffer[:self.position] for column, buffer in self.buffers.items()}
+        self.queue.put((self.chunk, filled))
+        self.chunk += 1
+        self.buffers = {column: np.empty_like(buffer) for column, buffer in self.buffers.items()}
+        self.position = 0
+
+    def _flush_worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            chunk, filled = item
+            try:
+                for column in COLUMNS:
+                    np.save(chunk_path(self.directory, column, chunk), filled[column])
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TrajectoryReader:
+    def __init__(self, directory):
+        self.directory = directory
+        self.n_chunks = len(glob.glob(os.path.join(directory, 'done_*.npy')))
+
+    def chunks(self, mmap=True):
+        '''
+        Yields one dict of column arrays per chunk, memory-mapped
+        unless mmap is False
+        '''
+        for chunk in range(self.n_chunks):
+            yield {column: np.load(chunk_path(self.directory, column, chunk), mmap_mode='r' if mmap else None)
+                   for column in COLUMNS}
+
+    def load(self, column):
+        return np.concatenate([chunk[column] for chunk in self.chunks()])
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            yield from zip(chunk['state'], chunk['action'], chunk['reward'], chunk['done'])
+
+    def __len__(self):
+        return sum(len(chunk['done']) for chunk in self.chunks())
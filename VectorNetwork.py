@@ -0,0 +1,279 @@
+'''
+This module batches N independent copies of the
+Network environment. The slice state of every
+scenario is stacked into (n_envs, n_bs, n_slices)
+arrays and the clients of all the scenarios share
+one StackedPopulation of n_envs*n_clients rows, so
+a single step() advances every scenario with a
+fixed number of NumPy calls
+'''
+import copy
+
+import numpy as np
+
+from ClientPopulation import ClientPopulation, flat_slice_arrays
+from Network import Network, episode_rewards, slice_rewards
+
+
+class VectorNetwork:
+    """
+    Description:
+        Steps N Network scenarios at once. Each scenario keeps
+        its own random generators, so stepping a VectorNetwork
+        built from a list of networks gives the same observations,
+        rewards and done flags as stepping copies of those
+        networks one by one (and calling reset() when done).
+
+    States:
+        (n_envs, 3*n_slices*n_bs) array, each row laid out
+        as Network.step() lays out its state
+
+    Actions:
+        (n_envs,) array of indices into Network.action_list
+    """
+
+    def __init__(self, networks, auto_reset=True):
+        first = networks[0]
+        self.n_envs = len(networks)
+        self.n_clients = first.n_clients
+        self.n_base_stations = len(first.base_stations)
+        self.n_slices = first.population.n_slices
+        self.auto_reset = auto_reset
+        self.action_list = first.action_list
+        self.action_table = np.array(first.action_list, dtype=np.float64)
+        self.user_thresold = first.user_thresold
+        self.area = first.stats.area
+        self.observation_dim = first.observation_shape[0]
+        self.np_randoms = [copy.deepcopy(nw.np_random) for nw in networks]
+
+        tables = [nw.slice_table for nw in networks]
+        self.init_capacity = np.array([t.init_capacity for t in tables])
+        self.capacity = np.array([t.capacity for t in tables])
+        self.level = np.array([t.level for t in tables])
+        self.connected_users = np.array([t.connected_users for t in tables])
+
+        ## Static slice parameters are the same in every base station
+        self.bandwidth_max = tables[0].bandwidth_max
+        self.bandwidth_guaranteed = tables[0].bandwidth_guaranteed
+        self.delay_tolerance = tables[0].delay_tolerance
+
+        self.connect_attempt = np.array([nw.stats.connect_attempt[-1] for nw in networks], dtype=np.int64)
+        self.block_count = np.array([nw.stats.block_count[-1] for nw in networks], dtype=np.int64)
+        self.handover_count = np.array([nw.stats.handover_count[-1] for nw in networks], dtype=np.int64)
+        self.steps_beyond_done = np.array([-1 if nw.steps_beyond_done is None else nw.steps_beyond_done
+                                           for nw in networks], dtype=np.int64)
+        self.state = np.zeros((self.n_envs, self.observation_dim), dtype=np.float64)
+        for env, nw in enumerate(networks):
+            if nw.state is not None:
+                self.state[env] = nw.state
+
+        if any(nw.population.mobility_patterns for nw in networks):
+            raise ValueError('VectorNetwork only stacks scenarios without mobile clients')
+        ## generate_user_requests() always samples, a scheduler
+        ## or a workload would be dropped without notice
+        if any(nw.scheduler is not None for nw in networks):
+            raise ValueError('VectorNetwork only stacks networks without a RequestScheduler')
+        if any(nw.workload is not None for nw in networks):
+            raise ValueError('VectorNetwork only stacks networks without a Workload')
+        ## Base stations never move, so the association of
+        ## Network.initialise_stats() is computed once here
+        for nw in networks:
+            nw.connections_init()
+        self.population = StackedPopulation(self, [nw.population for nw in networks])
+        allocation = first.population.allocation
+        if allocation is not None and allocation.weights is not None:
+            raise ValueError('VectorNetwork only stacks allocations without per-client weights')
+        self.population.allocation = allocation
+        self.population.association = StackedAssociation([nw.association for nw in networks],
+                                                         self.n_base_stations)
+
+    @classmethod
+    def make(cls, n_envs, bs_params, slice_params, client_params, seed=None, auto_reset=True, n_clients=100):
+        networks = []
+        for env in range(n_envs):
+            nw = Network(bs_params, slice_params, client_params, n_clients=n_clients)
+            nw.seed(None if seed is None else seed + env)
+            networks.append(nw)
+        return cls(networks, auto_reset)
+
+    def reset(self):
+        for env in range(self.n_envs):
+            self.reset_env(env)
+        return np.array(self.state)
+
+    def reset_env(self, env):
+        self.state[env] = self.np_randoms[env].uniform(low=0, high=1, size=(self.observation_dim,))
+        self.steps_beyond_done[env] = -1
+
+    def step(self, actions, envs=None):
+        """
+        Batched Network.step(). Returns the states, the
+        selected action tuples, the rewards and the done
+        flags of all the environments. With auto_reset the
+        finished environments are reset straight away and
+        their last state is kept in info['terminal_observation']
+
+        envs, a sorted array of distinct environment indices,
+        steps only those environments with one action each and
+        returns their rows, the others are left as they are
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        selected_action = self.action_table[actions]
+        envs = np.arange(self.n_envs) if envs is None else np.asarray(envs, dtype=np.int64)
+
+        ## Changing the slice ratios in all base stations as per the actions provided
+        self.init_capacity[envs] *= (1 + selected_action)[:, None, :]
+        self.capacity[envs] = self.init_capacity[envs]
+        self.level[envs] = self.init_capacity[envs]
+
+        selected_clients, n_selected = self.generate_user_requests(envs)
+        reward = self.reward(selected_clients)[envs]
+
+        connected_users = self.connected_users[envs]
+        users = connected_users / n_selected[:, None, None]
+        used = (self.capacity[envs] - self.level[envs]) / self.bandwidth_max
+        allocated = self.capacity[envs] / self.bandwidth_max
+        ## Same (slice, base station, feature) order as the slice_hash_table of Network.step()
+        self.state[envs] = np.stack((users, used, allocated), axis=-1).transpose(0, 2, 1, 3).reshape(envs.size, self.observation_dim)
+        total_connected_clients = connected_users.sum(axis=(1, 2))
+        done = ((total_connected_clients == n_selected)
+                | (total_connected_clients / n_selected >= self.user_thresold))
+
+        rewards, self.steps_beyond_done[envs] = episode_rewards(reward, done, self.steps_beyond_done[envs])
+
+        info = {}
+        if self.auto_reset and done.any():
+            info['terminal_observation'] = self.state[envs]
+            for env in envs[done]:
+                self.reset_env(env)
+
+        return self.state[envs], selected_action, rewards, done, info
+
+    def generate_user_requests(self, envs):
+        ## Every environment draws its own subset, exactly
+        ## as Network.generate_user_requests() does
+        client_ids = []
+        for env in envs.tolist():
+            rng = self.population.rngs[env]
+            n_active_clients = max(int(rng.random()*self.n_clients), int(0.1*self.n_clients))
+            client_ids.append(env*self.n_clients + rng.integers(self.n_clients, size=n_active_clients))
+        n_selected = np.array([ids.size for ids in client_ids], dtype=np.int64)
+        selected_clients = np.concatenate(client_ids) if client_ids else np.empty(0, dtype=np.int64)
+        self.population.iter(selected_clients)
+        return selected_clients, n_selected
+
+    def reward(self, clients):
+        """
+        Network.reward() of every environment, from the
+        per-slice counts of the selected clients
+        """
+        population = self.population
+        clients = clients[population.base_station_index[clients] >= 0]
+        selected_counts = np.bincount(population.slice_ids(clients), minlength=self.connected_users.size)
+        return slice_rewards(selected_counts.reshape(self.connected_users.shape), self.connected_users,
+                             self.connect_attempt, self.delay_tolerance)
+
+
+class StackedPopulation(ClientPopulation):
+    '''
+    The client populations of all the environments laid out
+    env-major in one set of columns. Base station indices are
+    offset by env*n_bs so that slice_ids() addresses the flat
+    (n_envs, n_bs, n_slices) arrays of the VectorNetwork
+    '''
+    def __init__(self, vector_network, populations):
+        self.vector_network = vector_network
+        self.n_envs = len(populations)
+        self.clients_per_env = populations[0].n_clients
+        self.rngs = [copy.deepcopy(p.rng) for p in populations]
+        self.usage_patterns = [copy.deepcopy([s.usage_pattern for s in p.base_stations[0].slices])
+                               for p in populations]
+        super().__init__(np.concatenate([p.x for p in populations]),
+                         np.concatenate([p.y for p in populations]),
+                         np.concatenate([p.usage_freq for p in populations]),
+                         np.concatenate([p.subscribed_slice_index for p in populations]),
+                         populations[0].base_stations)
+
+        n_bs = vector_network.n_base_stations
+        self.base_station_index[:] = np.concatenate([
+            np.where(p.base_station_index >= 0, p.base_station_index + env*n_bs, -1)
+            for env, p in enumerate(populations)])
+        for name in ('usage_remaining', 'last_usage', 'connected', 'total_connected_time',
+                     'total_unconnected_time', 'total_request_count', 'total_consume_time', 'total_usage'):
+            getattr(self, name)[:] = np.concatenate([getattr(p, name) for p in populations])
+
+    def env_segments(self, indices):
+        '''
+        Splits sorted client indices at the environment boundaries
+        '''
+        bounds = np.searchsorted(indices, np.arange(1, self.n_envs)*self.clients_per_env)
+        return np.split(indices, bounds)
+
+    def draw_random(self, indices):
+        return np.concatenate([rng.random(segment.size)
+                               for rng, segment in zip(self.rngs, self.env_segments(indices))])
+
+    def draw_usage(self, indices, slice_index):
+        return np.concatenate([usage_patterns[slice_index].generate_batch(segment.size)
+                               for usage_patterns, segment in zip(self.usage_patterns, self.env_segments(indices))])
+
+    def count_connect_attempts(self, indices):
+        self.vector_network.connect_attempt += self._count_in_area(indices)
+
+    def count_blocks(self, indices):
+        self.vector_network.block_count += self._count_in_area(indices)
+
+    def count_handovers(self, indices):
+        self.vector_network.handover_count += self._count_in_area(indices)
+
+    def _count_in_area(self, indices):
+        (x0, x1), (y0, y1) = self.vector_network.area
+        xs, ys = self.x[indices], self.y[indices]
+        in_area = (x0 <= xs) & (xs <= x1) & (y0 <= ys) & (ys <= y1)
+        return np.bincount(indices[in_area] // self.clients_per_env, minlength=self.n_envs)
+
+    def gather_slices(self):
+        ## connected_users and level are views, so the vector
+        ## updates land directly in the VectorNetwork arrays
+        return flat_slice_arrays(self.vector_network)
+
+
+
+class StackedAssociation:
+    '''
+    Neighbour lists of the AssociationIndex of every
+    environment, with base station indices offset the
+    same way as in StackedPopulation
+    '''
+    def __init__(self, associations, n_base_stations):
+        self.k = associations[0].k
+        self.neighbors = np.concatenate([a.neighbors + env*n_base_stations
+                                         for env, a in enumerate(associations)])
+        self.distances = np.concatenate([a.distances for a in associations])
+        self.radius = np.concatenate([a.radius for a in associations])
+        self.max_radius = max(a.max_radius for a in associations)
+        self.associations = associations
+        self.n_base_stations = n_base_stations
+        self.clients_per_env = len(associations[0].x)
+
+    def neighbor_distances(self, indices):
+        return self.distances[indices]
+
+    def covering(self, indices):
+        '''
+        AssociationIndex.covering() of each environment,
+        with rows and base stations in stacked numbering
+        '''
+        env = indices // self.clients_per_env
+        rows, base_stations, distances = [], [], []
+        for e in np.unique(env):
+            positions = np.flatnonzero(env == e)
+            r, b, d = self.associations[e].covering(indices[positions] - e*self.clients_per_env)
+            rows.append(positions[r])
+            base_stations.append(b + e*self.n_base_stations)
+            distances.append(d)
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+        rows, base_stations, distances = map(np.concatenate, (rows, base_stations, distances))
+        order = np.lexsort((distances, rows))
+        return rows[order], base_stations[order], distances[order]
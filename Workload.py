@@ -0,0 +1,74 @@
+'''
+Precomputed request schedule of a whole episode. Instead of
+drawing the active clients, their request decisions and
+the request sizes while stepping, a Workload draws them for
+every step up front in a few batched calls and keeps them
+in flat arrays, one entry per picked client:
+    client_ids  the clients picked in each step, the picks
+                of step t are client_ids[offsets[t]:offsets[t+1]]
+    arrivals    whether the pick starts a request when the
+                client is idle (usage_freq < uniform draw)
+    usage       the size of that request, drawn from the
+                usage_pattern of the client's slice (0 when
+                there is no arrival)
+Saved as .npz, the same workload can be replayed against
+different policies, see Network.use_workload()
+'''
+import numpy as np
+
+
+class Workload:
+    def __init__(self, n_clients, offsets, client_ids, arrivals, usage):
+        self.n_clients = int(n_clients)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.client_ids = np.asarray(client_ids)
+        self.arrivals = np.asarray(arrivals, dtype=bool)
+        self.usage = np.asarray(usage, dtype=np.float64)
+
+    @classmethod
+    def generate(cls, population, n_steps, seed=None):
+        '''
+        Draws n_steps steps of the sampled request model of
+        Network.generate_user_requests() for the population,
+        leaving the state of its usage patterns untouched
+        '''
+        rng = np.random.default_rng(seed)
+        n_clients = population.n_clients
+        n_active = np.maximum((rng.random(n_steps)*n_clients).astype(np.int64), int(0.1*n_clients))
+        offsets = np.zeros(n_steps + 1, dtype=np.int64)
+        np.cumsum(n_active, out=offsets[1:])
+        id_type = np.int32 if n_clients <= np.iinfo(np.int32).max else np.int64
+        client_ids = rng.integers(n_clients, size=offsets[-1], dtype=id_type)
+        arrivals = population.usage_freq[client_ids] < rng.random(client_ids.size)
+        usage = np.zeros(client_ids.size)
+        slice_index = population.subscribed_slice_index[client_ids]
+        for itr, s in enumerate(population.base_stations[0].slices):
+            selected = np.flatnonzero(arrivals & (slice_index == itr))
+            ## A fork, so that a trace read here does not move
+            ## the cursor of the pattern the network steps with
+            usage[selected] = s.usage_pattern.fork().sample(rng, selected.size)
+        return cls(n_clients, offsets, client_ids, arrivals, usage)
+
+    @property
+    def n_steps(self):
+        return len(self.offsets) - 1
+
+    def step(self, t):
+        '''
+        Picked client ids, arrivals and usage of step t,
+        as views of the workload arrays
+        '''
+        if not 0 <= t < self.n_steps:
+            raise IndexError(f'step {t} out of a workload of {self.n_steps} steps')
+        start, stop = self.offsets[t], self.offsets[t + 1]
+        return self.client_ids[start:stop], self.arrivals[start:stop], self.usage[start:stop]
+
+    def save(self, path):
+        np.savez_compressed(path, n_clients=self.n_clients, offsets=self.offsets,
+                            client_ids=self.client_ids, arrivals=self.arrivals, usage=self.usage)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['n_clients'], data['offsets'], data['client_ids'],
+                       data['arrivals'], data['usage'])
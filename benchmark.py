@@ -0,0 +1,322 @@
+'''
+Benchmark harness for Network.step(). Builds scenarios
+from the BS_PARAMS/SLICE_PARAMS/CLIENT_PARAMS schema of
+main.py, sweeping the number of clients and base stations,
+and reports steps/sec, per-phase latency percentiles and
+peak RSS. Every scenario runs in a fresh process so that
+peak RSS is measured per scenario.
+
+    python benchmark.py --clients 100,10000 --base-stations 1,100 \
+        --output results.json --baseline baseline.json --threshold 0.2
+
+exits with status 1 when a scenario is slower than the
+baseline by more than the threshold. With --memory it
+reports the bytes per client of the Client objects of
+Network.clients_init(), with __slots__ and dict-backed as
+before them, against the ClientPopulation columns a
+Network keeps, measured with tracemalloc.
+With --startup it times fresh processes that import and
+build a Network, on the NumPy-only path and on the path
+through NetworkEnv (gym) and sklearn's KDTree
+'''
+import argparse
+import contextlib
+import copy
+import io
+import json
+import math
+import multiprocessing as mp
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+PHASES = ('reset', 'step', 'association_build', 'association', 'client_iteration', 'reward', 'state')
+PERCENTILES = (50, 90, 99)
+
+
+def make_scenario(n_base_stations):
+    '''
+    Base stations on a square grid over the 1000x1000 area,
+    with radii that let neighbouring cells overlap
+    '''
+    from main import BS_PARAMS, SLICE_PARAMS, CLIENT_PARAMS
+
+    per_row = math.ceil(math.sqrt(n_base_stations))
+    spacing = 1000 / per_row
+    bs_params = []
+    for i in range(n_base_stations):
+        bs = copy.deepcopy(BS_PARAMS[0])
+        bs['x'] = (i % per_row + 0.5) * spacing
+        bs['y'] = (i // per_row + 0.5) * spacing
+        bs['coverage'] = 0.75 * spacing if n_base_stations > 1 else bs['coverage']
+        bs_params.append(bs)
+    return bs_params, copy.deepcopy(SLICE_PARAMS), copy.deepcopy(CLIENT_PARAMS)
+
+
+def summarise(latencies):
+    latencies = np.asarray(latencies) * 1000
+    summary = {f'p{p}_ms': float(np.percentile(latencies, p)) for p in PERCENTILES}
+    summary['mean_ms'] = float(latencies.mean())
+    return summary
+
+
+def run_scenario(n_clients, n_base_stations, steps, seed=0):
+    from Network import Network
+    from utils import AssociationIndex
+
+    bs_params, slice_params, client_params = make_scenario(n_base_stations)
+    with contextlib.redirect_stdout(io.StringIO()):
+        build_start = time.perf_counter()
+        nw = Network(bs_params, slice_params, client_params, n_clients=n_clients)
+        build_time = time.perf_counter() - build_start
+    nw.seed(seed)
+    rng = np.random.default_rng(seed)
+    timings = {phase: [] for phase in PHASES}
+
+    start = time.perf_counter()
+    nw.reset()
+    timings['reset'].append(time.perf_counter() - start)
+
+    ## Full step, as an agent sees it
+    step_start = time.perf_counter()
+    for action in rng.integers(7, size=steps):
+        start = time.perf_counter()
+        _, _, _, done, _ = nw.step(action)
+        timings['step'].append(time.perf_counter() - start)
+        if done:
+            start = time.perf_counter()
+            nw.reset()
+            timings['reset'].append(time.perf_counter() - start)
+    steps_per_sec = steps / (time.perf_counter() - step_start)
+
+    ## The same phases one by one, in the order step() runs them
+    for action in rng.integers(7, size=steps):
+        nw.apply_action(nw.SelectedAction(action))
+        start = time.perf_counter()
+        nw.initialise_stats()
+        timings['association'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        selected_clients = nw.generate_user_requests()
+        timings['client_iteration'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        nw.reward(selected_clients)
+        timings['reward'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        nw.build_state(nw.n_selected)
+        timings['state'].append(time.perf_counter() - start)
+
+    ## Association from scratch, what every step paid before it was cached
+    for _ in range(min(steps, 5)):
+        start = time.perf_counter()
+        AssociationIndex(nw.base_stations).update(nw.population.x, nw.population.y)
+        timings['association_build'].append(time.perf_counter() - start)
+
+    return {
+        'n_clients': n_clients,
+        'n_base_stations': n_base_stations,
+        'steps': steps,
+        'build_sec': build_time,
+        'steps_per_sec': steps_per_sec,
+        'phases': {phase: summarise(latencies) for phase, latencies in timings.items()},
+        ## ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def dict_backed(cls):
+    '''
+    cls without its __slots__: the same methods, with the
+    attributes in a per-instance __dict__
+    '''
+    namespace = {name: value for name, value in vars(cls).items()
+                 if name != '__slots__' and name not in cls.__slots__}
+    return type(cls.__name__, cls.__bases__, namespace)
+
+
+def measure_client_objects(n_clients, client_params, client_class):
+    from Network import Network
+
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        clients = Network.clients_init(n_clients, client_params, client_class)
+    objects = tracemalloc.get_traced_memory()[0]
+    del clients
+    tracemalloc.stop()
+    return objects / n_clients
+
+
+def measure_memory(n_clients, n_base_stations):
+    from Client import Client
+    from Network import Network
+
+    bs_params, slice_params, client_params = make_scenario(n_base_stations)
+    dict_objects = measure_client_objects(n_clients, client_params, dict_backed(Client))
+    objects = measure_client_objects(n_clients, client_params, Client)
+
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    with contextlib.redirect_stdout(io.StringIO()):
+        nw = Network(bs_params, slice_params, client_params, n_clients=n_clients)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    population = nw.population
+    columns = sum(v.nbytes for v in vars(population).values() if isinstance(v, np.ndarray))
+    return {
+        'n_clients': n_clients,
+        'n_base_stations': n_base_stations,
+        'dict_client_objects_bytes_per_client': dict_objects,
+        'client_objects_bytes_per_client': objects,
+        'population_bytes_per_client': columns / n_clients,
+        'network_bytes_per_client': (retained - start) / n_clients,
+        'network_peak_bytes_per_client': (peak - start) / n_clients,
+    }
+
+
+STARTUP_PATHS = {
+    'numpy': 'from Network import Network',
+    'gym_sklearn': ('import utils; utils.BRUTE_FORCE_LIMIT = 0\n'
+                    'from NetworkEnv import NetworkEnv as Network'),
+}
+STARTUP_SCRIPT = '''
+import time
+start = time.perf_counter()
+{imports}
+imported = time.perf_counter()
+import contextlib, io
+with contextlib.redirect_stdout(io.StringIO()):
+    Network(*{scenario!r}, n_clients={n_clients})
+print(imported - start, time.perf_counter() - imported)
+'''
+
+
+def measure_startup(path, n_clients, n_base_stations, runs):
+    '''
+    Median wall time of a fresh interpreter that imports
+    Network along the given path and builds one Network
+    '''
+    ## The scenario is passed as literals, importing main would load gym
+    script = STARTUP_SCRIPT.format(imports=STARTUP_PATHS[path], n_clients=n_clients,
+                                   scenario=make_scenario(n_base_stations))
+    directory = os.path.dirname(os.path.abspath(__file__))
+    total, imports, builds = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-W', 'ignore', '-c', script], cwd=directory,
+                                capture_output=True, text=True, check=True).stdout
+        total.append(time.perf_counter() - start)
+        import_time, build_time = map(float, output.split()[-2:])
+        imports.append(import_time)
+        builds.append(build_time)
+    return {
+        'path': path,
+        'n_clients': n_clients,
+        'n_base_stations': n_base_stations,
+        'process_sec': float(np.median(total)),
+        'import_sec': float(np.median(imports)),
+        'build_sec': float(np.median(builds)),
+    }
+
+
+def _run_in_process(queue, function, *args):
+    import warnings
+    warnings.filterwarnings('ignore')
+    queue.put(function(*args))
+
+
+def run_isolated(*args, function=run_scenario):
+    context = mp.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run_in_process, args=(queue, function, *args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def compare(results, baseline, threshold):
+    '''
+    Scenarios whose steps/sec dropped by more than threshold
+    (a fraction) relative to the baseline results
+    '''
+    reference = {(r['n_clients'], r['n_base_stations']): r['steps_per_sec'] for r in baseline['scenarios']}
+    regressions = []
+    for r in results['scenarios']:
+        expected = reference.get((r['n_clients'], r['n_base_stations']))
+        if expected is not None and r['steps_per_sec'] < (1 - threshold) * expected:
+            regressions.append({'n_clients': r['n_clients'], 'n_base_stations': r['n_base_stations'],
+                                'steps_per_sec': r['steps_per_sec'], 'baseline_steps_per_sec': expected})
+    return regressions
+
+
+def parse_counts(value):
+    return [int(float(v)) for v in value.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=parse_counts, default=[100, 1000, 10000, 100000, 1000000])
+    parser.add_argument('--base-stations', type=parse_counts, default=[1, 10, 100, 1000])
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    parser.add_argument('--memory', action='store_true')
+    parser.add_argument('--startup', action='store_true')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        results = {'startup': []}
+        for path in STARTUP_PATHS:
+            result = measure_startup(path, args.clients[0], args.base_stations[0], args.runs)
+            results['startup'].append(result)
+            print(f"{path:>12}: process {result['process_sec']*1000:.0f}ms "
+                  f"import {result['import_sec']*1000:.0f}ms build {result['build_sec']*1000:.0f}ms")
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        return 0
+
+    if args.memory:
+        results = {'memory': []}
+        for n_clients in args.clients:
+            result = run_isolated(n_clients, args.base_stations[0], function=measure_memory)
+            results['memory'].append(result)
+            print(f"{n_clients:>8} clients: Client objects {result['dict_client_objects_bytes_per_client']:.0f}"
+                  f" -> {result['client_objects_bytes_per_client']:.0f} B/client with __slots__, "
+                  f"population {result['population_bytes_per_client']:.0f} B/client, "
+                  f"Network {result['network_bytes_per_client']:.0f} B/client "
+                  f"(peak {result['network_peak_bytes_per_client']:.0f})")
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        return 0
+
+    results = {'scenarios': []}
+    for n_clients in args.clients:
+        for n_base_stations in args.base_stations:
+            result = run_isolated(n_clients, n_base_stations, args.steps)
+            results['scenarios'].append(result)
+            step = result['phases']['step']
+            print(f"{n_clients:>8} clients {n_base_stations:>5} bs: {result['steps_per_sec']:>9.1f} steps/sec "
+                  f"p50={step['p50_ms']:.2f}ms p99={step['p99_ms']:.2f}ms rss={result['peak_rss_mb']:.0f}MB")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['n_clients']} clients {r['n_base_stations']} bs: "
+                  f"{r['steps_per_sec']:.1f} < {r['baseline_steps_per_sec']:.1f} steps/sec")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,5 @@
-import numpy as np
-import gym
-from Network import Network
+from Trajectory import TrajectoryWriter
+from ReplayBuffer import ReplayBuffer
 
 BS_PARAMS = [{'capacity_bandwidth': 20000000000, 'coverage': 500,
                 'ratios': {'emBB': 0.5, 'mMTC': 0.4, 'URLLC': 0.1},
@@ -39,19 +38,22 @@ CLIENT_PARAMS = {'location':{'x': {'distribution': 'randint', 'params': (0, 1000
                 , 'usage_frequency': {'distribution': 'randint', 'params': (0, 100000), 'divide_scale': 1000000}}
 NUM_CLIENTS = 1000
 
-def log_all_info(file_name: str, *state_action):
-    f = open(file_name, "a")
-    msg = "State: {}, Action: {}, Reward: {}, Done: {}".format((*state_action))
-    f.write(msg)
-    f.close()
-
-
 if __name__ == "__main__":
-    nw = Network(bs_params=BS_PARAMS, slice_params=SLICE_PARAMS, client_params=CLIENT_PARAMS)
-    nw.reset()
-    file_name = "Output.txt"
-    for episode in range(100):
-        state, action, reward, done, info = nw.step(nw.action_space.sample())
-        log_all_info(file_name, state, action, reward, done)
+    ## Imported here so that reading the scenario above
+    ## (e.g. benchmark.make_scenario()) does not load gym
+    from NetworkEnv import NetworkEnv
+
+    nw = NetworkEnv(bs_params=BS_PARAMS, slice_params=SLICE_PARAMS, client_params=CLIENT_PARAMS)
+    state = nw.reset()
+    replay_buffer = ReplayBuffer.from_network(nw, "replay", capacity=100000)
+    ## Read back with Trajectory.TrajectoryReader("trajectory")
+    with TrajectoryWriter("trajectory") as writer:
+        for episode in range(100):
+            action_index = nw.action_space.sample()
+            next_state, action, reward, done, info = nw.step(action_index)
+            writer.write(next_state, action, reward, done)
+            replay_buffer.append(state, action_index, reward, next_state, done)
+            state = nw.reset() if done else next_state
+    replay_buffer.flush()
         
                
@@ -0,0 +1,86 @@
+'''
+water_fill() against a per-group bisection of the water
+level, with capped groups, zero weights and groups where
+every entry is saturated
+'''
+import numpy as np
+import pytest
+
+from Allocation import water_fill
+
+
+def fill_level(low, high, weights, capacity):
+    ## Level at which sum(clip(w*level, low, high)) reaches capacity
+    lo, hi = 0.0, float(np.max(high / weights)) + 1
+    for _ in range(200):
+        level = (lo + hi) / 2
+        if np.clip(weights * level, low, high).sum() < capacity:
+            lo = level
+        else:
+            hi = level
+    return np.clip(weights * hi, low, high)
+
+
+def reference(groups, demand, capacity, lower, upper, weights):
+    allocation = np.zeros(groups.size)
+    for g in range(capacity.size):
+        entries = np.flatnonzero(groups == g)
+        high = np.minimum(np.maximum(demand[entries], 0), upper[entries])
+        low = np.minimum(lower[entries], high)
+        w = weights[entries]
+        weighted = w > 0
+        if high.sum() <= capacity[g]:
+            result = high
+        elif low.sum() >= capacity[g]:
+            result = low * (capacity[g] / low.sum()) if low.sum() > 0 else low
+        elif high[weighted].sum() + low[~weighted].sum() >= capacity[g]:
+            result = low.copy()
+            result[weighted] = fill_level(low[weighted], high[weighted], w[weighted],
+                                          capacity[g] - low[~weighted].sum())
+        else:
+            result = high.copy()
+            result[~weighted] = fill_level(low[~weighted], high[~weighted], np.ones(np.count_nonzero(~weighted)),
+                                           capacity[g] - high[weighted].sum())
+        allocation[entries] = result
+    return allocation
+
+
+def random_case(rng, n_groups, zero_weights):
+    groups = np.sort(rng.integers(n_groups, size=40 * n_groups))
+    demand = rng.uniform(0, 10, groups.size)
+    lower = rng.uniform(0, 2, groups.size) * (rng.random(groups.size) < 0.5)
+    upper = np.where(rng.random(groups.size) < 0.3, rng.uniform(0, 5, groups.size), np.inf)
+    weights = rng.choice([0.5, 1, 2, 5], groups.size)
+    if zero_weights:
+        weights[rng.random(groups.size) < 0.3] = 0
+    totals = np.bincount(groups, weights=demand, minlength=n_groups)
+    ## From starved (below the lower bounds) to saturated groups
+    capacity = totals * rng.choice([0, 0.01, 0.3, 0.7, 1.0, 2.0], n_groups)
+    return groups, demand, capacity, lower, upper, weights
+
+
+@pytest.mark.filterwarnings('error')
+@pytest.mark.parametrize('zero_weights', [False, True])
+def test_water_fill_matches_reference(zero_weights):
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        case = random_case(rng, 12, zero_weights)
+        allocation = water_fill(case[0], case[1], case[2], lower=case[3], upper=case[4], weights=case[5])
+        np.testing.assert_allclose(allocation, reference(*case), rtol=1e-7, atol=1e-7)
+        used = np.bincount(case[0], weights=allocation, minlength=case[2].size)
+        assert np.all(used <= case[2] * (1 + 1e-12))
+
+
+@pytest.mark.filterwarnings('error')
+def test_water_fill_edge_groups():
+    groups = np.array([0, 0, 1, 1, 2, 2, 3])
+    demand = np.array([4.0, 6.0, 1.0, 2.0, 3.0, 3.0, 5.0])
+    capacity = np.array([5.0, 100.0, 0.0, 2.0])
+    lower = np.array([1.0, 1.0, 0.0, 0.0, 1.0, 1.0, 3.0])
+    upper = np.array([2.0, np.inf, np.inf, np.inf, np.inf, np.inf, np.inf])
+    weights = np.array([1.0, 1.0, 1.0, 1.0, 0.0, 0.0, 1.0])
+    allocation = water_fill(groups, demand, capacity, lower=lower, upper=upper, weights=weights)
+    ## Group 0 is capped at 2 for its first entry, group 1 is
+    ## saturated, group 2 has nothing and group 3 cannot even
+    ## cover its lower bound
+    np.testing.assert_allclose(allocation, [2.0, 3.0, 1.0, 2.0, 0.0, 0.0, 2.0])
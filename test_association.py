@@ -0,0 +1,65 @@
+'''
+AssociationIndex keeps the k nearest base stations of clients
+that move inside the coverage of their base station, and
+find_handover_targets() picks the closest covering one
+'''
+import contextlib
+import copy
+import io
+import random
+
+import numpy as np
+
+from main import BS_PARAMS, SLICE_PARAMS, CLIENT_PARAMS
+from Network import Network
+from utils import AssociationIndex, NearestCenters
+
+
+def make_network(n_clients=50, limit=2):
+    ## A row of base stations that all cover the whole area
+    bs_params = []
+    for x in range(100, 700, 100):
+        bs = copy.deepcopy(BS_PARAMS[0])
+        bs.update(coverage=2000, x=x, y=500)
+        bs_params.append(bs)
+    random.seed(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        nw = Network(bs_params, SLICE_PARAMS, CLIENT_PARAMS, n_clients=n_clients,
+                     client_rng=np.random.default_rng(0))
+    nw.association = AssociationIndex(nw.base_stations, limit=limit)
+    nw.population.association = nw.association
+    return nw
+
+
+def test_handover_target_outside_cached_neighbors():
+    nw = make_network()
+    population, association = nw.population, nw.association
+    population.x[0], population.y[0] = 100, 500
+    population.base_station_index[0] = 0
+    association.update(population.x, population.y)
+    assert set(association.neighbors[0]) == {0, 1}
+
+    ## Still covered by base station 0, but next to base station 5
+    population.x[0] = 590
+    crossed = association.move(population.x, population.y, np.array([0]), population.base_station_index)
+    assert crossed.size == 0
+    target = population.find_handover_targets(np.array([0]), population.gather_slices())
+    assert target.tolist() == [5]
+
+
+def test_neighbors_follow_moving_clients():
+    nw = make_network(n_clients=500, limit=3)
+    population, association = nw.population, nw.association
+    rng = np.random.default_rng(1)
+    population.base_station_index[:] = 0
+    association.update(population.x, population.y)
+    reference = NearestCenters(association.centers)
+    for _ in range(20):
+        moved = np.flatnonzero(rng.random(population.n_clients) < 0.5)
+        population.x[moved] = np.clip(population.x[moved] + rng.uniform(-60, 60, moved.size), 0, 1000)
+        population.y[moved] = np.clip(population.y[moved] + rng.uniform(-60, 60, moved.size), 0, 1000)
+        association.move(population.x, population.y, moved, population.base_station_index)
+        indices = np.arange(population.n_clients)
+        distances = association.neighbor_distances(indices)
+        expected, _ = reference.query(np.column_stack((population.x, population.y)), k=association.k)
+        np.testing.assert_allclose(distances, expected)
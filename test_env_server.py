@@ -0,0 +1,118 @@
+'''
+EnvServer and EnvClient over TCP on localhost: transitions
+match a VectorNetwork stepped directly, errors come back as
+ERROR replies, and released environments are reset
+'''
+import asyncio
+import contextlib
+import io
+import random
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from benchmark import make_scenario
+from EnvServer import EnvClient, EnvServer
+from VectorNetwork import VectorNetwork
+
+N_ENVS = 2
+
+
+def make_vector_network():
+    random.seed(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        vector_network = VectorNetwork.make(N_ENVS, *make_scenario(1), seed=0, auto_reset=False, n_clients=50)
+    vector_network.reset()
+    return vector_network
+
+
+@pytest.fixture
+def server():
+    env_server = EnvServer(make_vector_network())
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(env_server.start(port=0))
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    assert started.wait(10)
+    yield env_server
+    asyncio.run_coroutine_threadsafe(env_server.close(), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(10)
+
+
+def test_transitions_match_vector_network(server):
+    reference = make_vector_network()
+    with EnvClient(server.address) as client:
+        env = client.env
+        assert client.observation_shape == (reference.observation_dim, )
+        assert client.n_actions == len(reference.action_list)
+        reference.reset_env(env)
+        np.testing.assert_array_equal(client.reset(), reference.state[env].astype(np.float32))
+        for t in range(30):
+            action = (3*t) % client.n_actions
+            observation, reward, done, info = client.step(action)
+            states, _, rewards, dones, _ = reference.step([action], [env])
+            np.testing.assert_array_equal(observation, states[0].astype(np.float32))
+            assert (reward, done, info) == (rewards[0], dones[0], {})
+            if done:
+                reference.reset_env(env)
+                np.testing.assert_array_equal(client.reset(), reference.state[env].astype(np.float32))
+        metrics = client.metrics()
+    assert metrics['batch_size']['count'] == 30
+    assert metrics['latency']['count'] == 30
+
+
+def test_errors_keep_the_connection(server):
+    with EnvClient(server.address) as client:
+        client.reset()
+        with pytest.raises(RuntimeError, match='out of range'):
+            client.step(client.n_actions)
+        observation, _, _, _ = client.step(0)
+        assert observation.shape == client.observation_shape
+
+
+def test_released_environment_is_reset(server):
+    clients = [EnvClient(server.address) for _ in range(N_ENVS)]
+    with pytest.raises(RuntimeError, match='no free environment'):
+        EnvClient(server.address)
+    closed = clients.pop(0)
+    closed.reset()
+    closed.step(1)
+    before = server.vector_network.state[closed.env].copy()
+    closed.close()
+    for _ in range(1000):
+        if closed.env in server.free_envs:
+            break
+        time.sleep(0.01)
+    assert closed.env in server.free_envs
+    assert server.vector_network.steps_beyond_done[closed.env] == -1
+    assert not np.array_equal(server.vector_network.state[closed.env], before)
+    with EnvClient(server.address) as client:
+        assert client.env == closed.env
+    for client in clients:
+        client.close()
+
+
+def test_batch_skips_requests_of_agents_gone_away():
+    env_server = EnvServer(make_vector_network())
+    vector_network = env_server.vector_network
+    loop = asyncio.new_event_loop()
+    try:
+        gone, waiting = loop.create_future(), loop.create_future()
+        gone.cancel()
+        before = vector_network.state.copy()
+        env_server._run_batch([(0, 1, gone, time.perf_counter()), (1, 1, waiting, time.perf_counter())])
+        np.testing.assert_array_equal(vector_network.state[0], before[0])
+        reward, done, state = waiting.result()
+        np.testing.assert_array_equal(state, vector_network.state[1])
+    finally:
+        loop.close()
@@ -0,0 +1,42 @@
+'''
+StepProfiler counters against the event counts of Stats on
+a mobile scenario, where handovers also come from clients
+leaving the coverage of their base station
+'''
+import contextlib
+import copy
+import io
+import random
+
+import numpy as np
+
+from main import BS_PARAMS, SLICE_PARAMS, CLIENT_PARAMS
+from Network import Network
+
+
+def test_counters_match_stats():
+    bs_params = []
+    for x, y in ((250, 250), (750, 250), (250, 750), (750, 750)):
+        bs = copy.deepcopy(BS_PARAMS[0])
+        bs.update(capacity_bandwidth=2e8, coverage=400, x=x, y=y)
+        bs_params.append(bs)
+    client_params = copy.deepcopy(CLIENT_PARAMS)
+    client_params['mobility_patterns'] = {
+        'car': {'distribution': 'randint', 'params': (-60, 60), 'client_weight': 1}}
+    random.seed(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        nw = Network(bs_params, SLICE_PARAMS, client_params, n_clients=1000,
+                     client_rng=np.random.default_rng(0))
+    nw.seed(0)
+    nw.enable_profiling()
+    nw.reset()
+    for t in range(30):
+        _, _, _, done, _ = nw.step(t % len(nw.action_list))
+        if done:
+            nw.reset()
+    totals = nw.profiler.summary()['counters']
+    ## Every client stays in the area, so Stats counts them all
+    assert totals['connect_attempts'] == nw.stats.connect_attempt[-1]
+    assert totals['blocks'] == nw.stats.block_count[-1]
+    assert totals['handovers'] == nw.stats.handover_count[-1]
+    assert totals['handovers'] > 0
@@ -0,0 +1,77 @@
+'''
+ReplayBuffer: resuming from the memmap files and meta.json
+of a directory, and prioritised sampling through the SumTree
+'''
+import numpy as np
+import pytest
+
+from ReplayBuffer import ReplayBuffer, SumTree
+
+
+def transitions(n, observation_dim, seed=0):
+    rng = np.random.default_rng(seed)
+    states = rng.random((n + 1, observation_dim)).astype(np.float32)
+    return [(states[i], i % 7, float(i) / 2, states[i + 1], i % 5 == 0) for i in range(n)]
+
+
+def test_reopened_buffer_resumes(tmp_path):
+    capacity, observation_dim = 50, 9
+    data = transitions(120, observation_dim)
+    buffer = ReplayBuffer(tmp_path, capacity, observation_dim, flush_interval=1000)
+    for transition in data[:80]:
+        buffer.append(*transition)
+    buffer.update_priorities(np.array([3, 4]), np.array([5.0, 0.5]))
+    buffer.flush()
+
+    reopened = ReplayBuffer(tmp_path, capacity, observation_dim, flush_interval=1000)
+    assert (reopened.position, reopened.size, reopened.max_priority) == (80 % capacity, capacity, 5.0)
+    slots = np.arange(capacity)
+    ## Slot i holds the last of the transitions i, i + capacity, ... written before the flush
+    latest = [data[i + capacity] if i + capacity < 80 else data[i] for i in slots]
+    states, actions, rewards, next_states, dones = reopened.get(slots)
+    np.testing.assert_array_equal(states, np.array([t[0] for t in latest]))
+    np.testing.assert_array_equal(actions, [t[1] for t in latest])
+    np.testing.assert_array_equal(rewards, np.array([t[2] for t in latest], dtype=np.float32))
+    np.testing.assert_array_equal(next_states, np.array([t[3] for t in latest]))
+    np.testing.assert_array_equal(dones, [t[4] for t in latest])
+    assert reopened.tree.total() == pytest.approx(np.sum(reopened.priorities ** reopened.alpha))
+
+    ## Appends carry on from the flushed position
+    reopened.append(*data[100])
+    np.testing.assert_array_equal(reopened.states[80 % capacity], data[100][0])
+    assert reopened.position == 80 % capacity + 1
+    ## but only count once flushed
+    assert ReplayBuffer(tmp_path, capacity, observation_dim).position == 80 % capacity
+    reopened.flush()
+    assert ReplayBuffer(tmp_path, capacity, observation_dim).position == 80 % capacity + 1
+
+
+def test_reopening_with_another_layout_fails(tmp_path):
+    ReplayBuffer(tmp_path, 10, 4).flush()
+    with pytest.raises(ValueError):
+        ReplayBuffer(tmp_path, 10, 5)
+
+
+def test_prioritized_sampling_follows_priorities(tmp_path):
+    capacity = 8
+    buffer = ReplayBuffer(tmp_path, capacity, 2, alpha=0.6, seed=0)
+    for transition in transitions(6, 2):
+        buffer.append(*transition)
+    priorities = np.array([1.0, 2.0, 4.0, 0.5, 8.0, 0.0])
+    buffer.update_priorities(np.arange(6), priorities)
+    n = 200000
+    indices, weights = buffer.sample_prioritized(n, beta=0.4)
+    expected = priorities ** 0.6 / np.sum(priorities ** 0.6)
+    frequency = np.bincount(indices, minlength=6) / n
+    np.testing.assert_allclose(frequency, expected, atol=0.005)
+    assert frequency[5] == 0
+    expected_weights = (6 * expected[indices]) ** -0.4
+    np.testing.assert_allclose(weights, expected_weights / expected_weights.max())
+
+
+def test_sum_tree_ignores_empty_updates():
+    tree = SumTree(5)
+    tree.update(np.arange(5), np.arange(5, dtype=np.float64))
+    tree.update(np.empty(0, dtype=np.int64), np.empty(0))
+    assert tree.total() == 10
+    assert tree.find(np.array([0.0, 1.5, 9.5])).tolist() == [1, 2, 4]
@@ -0,0 +1,59 @@
+'''
+Network.reward() against the per-client reference form
+reward_per_client() on a seeded multi-cell scenario with
+blocked requests and handovers
+'''
+import contextlib
+import copy
+import io
+import random
+
+import numpy as np
+import pytest
+
+from main import BS_PARAMS, SLICE_PARAMS, CLIENT_PARAMS
+from Network import Network
+
+
+def make_network(n_clients=2000):
+    ## Small overlapping cells so that requests get blocked,
+    ## and mobile clients so that they get handed over
+    bs_params = []
+    for x, y in ((250, 250), (750, 250), (250, 750), (750, 750)):
+        bs = copy.deepcopy(BS_PARAMS[0])
+        bs.update(capacity_bandwidth=2e8, coverage=400, x=x, y=y)
+        bs_params.append(bs)
+    client_params = copy.deepcopy(CLIENT_PARAMS)
+    client_params['mobility_patterns'] = {
+        'car': {'distribution': 'randint', 'params': (-40, 40), 'client_weight': 0.5}}
+    random.seed(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        nw = Network(bs_params, SLICE_PARAMS, client_params, n_clients=n_clients,
+                     client_rng=np.random.default_rng(0))
+    nw.seed(0)
+    nw.reset()
+    return nw
+
+
+def test_reward_matches_per_client_form():
+    nw = make_network()
+    rewards = []
+    for t in range(30):
+        _, _, _, done, _ = nw.step(t % len(nw.action_list))
+        ids = np.random.default_rng(t).integers(nw.n_clients, size=nw.n_selected)
+        rewards.append(nw.reward(ids))
+        assert rewards[-1] == pytest.approx(nw.reward_per_client(ids), rel=1e-12, abs=1e-12)
+        if done:
+            nw.reset()
+    assert any(reward != 0 for reward in rewards)
+    assert sum(nw.stats.block_count) > 0
+    assert sum(nw.stats.handover_count) > 0
+
+
+def test_reward_without_connect_attempts_is_zero():
+    nw = make_network(n_clients=200)
+    nw.step(0)
+    nw.stats.connect_attempt[-1] = 0
+    ids = np.arange(nw.n_clients)
+    assert nw.reward(ids) == 0
+    assert nw.reward_per_client(ids) == 0
@@ -0,0 +1,76 @@
+'''
+RequestScheduler against the sampled request model of
+Network.generate_user_requests(): per-client request
+frequencies and per-slice selection counts
+'''
+import contextlib
+import io
+import random
+
+import numpy as np
+
+from main import BS_PARAMS, SLICE_PARAMS, CLIENT_PARAMS
+from Network import Network
+from Scheduler import request_probability
+
+
+def make_network(n_clients):
+    random.seed(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        nw = Network(BS_PARAMS, SLICE_PARAMS, CLIENT_PARAMS, n_clients=n_clients,
+                     client_rng=np.random.default_rng(0))
+    nw.seed(0)
+    nw.initialise_stats()
+    return nw
+
+
+def test_request_probability_matches_sampled_model():
+    ## Idle clients picked as in generate_user_requests()
+    n_clients, n_steps = 200, 4000
+    usage_freq = np.repeat([0.0, 0.03, 0.06, 0.1], n_clients // 4)
+    rng = np.random.default_rng(0)
+    requests = np.zeros(n_clients)
+    for _ in range(n_steps):
+        n_active = max(int(rng.random()*n_clients), int(0.1*n_clients))
+        picks = rng.integers(n_clients, size=n_active)
+        picks = picks[usage_freq[picks] < rng.random(n_active)]
+        requests += np.bincount(picks, minlength=n_clients) > 0
+    frequency = (requests / n_steps).reshape(4, -1).mean(axis=1)
+    expected = request_probability(usage_freq).reshape(4, -1).mean(axis=1)
+    np.testing.assert_allclose(frequency, expected, atol=0.01)
+
+
+def test_scheduled_requests_follow_request_probability():
+    nw = make_network(500)
+    population = nw.population
+    population.base_station_index[:] = 0
+    nw.use_scheduler()
+    scheduler = nw.scheduler
+    ## Clients stay idle, so every request is a due one
+    requests = np.zeros(population.n_clients)
+
+    def record(indices, arrivals=None, usage=None):
+        requests[population.due] += 1
+
+    population.iter = record
+    n_steps = 4000
+    for _ in range(n_steps):
+        scheduler.step(population.n_clients // 2)
+    frequency = requests / n_steps
+    expected = scheduler.request_probability
+    assert abs(frequency.mean() - expected.mean()) < 0.005
+    np.testing.assert_allclose(frequency, expected, atol=0.05)
+
+
+def test_expected_selections_match_random_picks():
+    nw = make_network(1000)
+    population = nw.population
+    nw.use_scheduler()
+    rng = np.random.default_rng(0)
+    n_selected, n_steps = 300, 2000
+    counts = np.zeros(population.slice_members.size)
+    for _ in range(n_steps):
+        picks = rng.integers(population.n_clients, size=n_selected)
+        picks = picks[population.base_station_index[picks] >= 0]
+        counts += np.bincount(population.slice_ids(picks), minlength=counts.size)
+    np.testing.assert_allclose(counts / n_steps, nw.scheduler.expected_selections(n_selected), rtol=0.02)
@@ -0,0 +1,78 @@
+'''
+Network.snapshot()/restore()/fork(): a restored or forked
+env replays the same trajectory as the original
+'''
+import contextlib
+import copy
+import io
+import random
+
+import numpy as np
+import pytest
+
+from main import BS_PARAMS, SLICE_PARAMS, CLIENT_PARAMS
+from Network import Network
+from Stats import HISTORIES
+
+
+def make_network(history_size=None, scheduler=False):
+    bs_params = copy.deepcopy(BS_PARAMS)
+    bs_params.append({'capacity_bandwidth': 1e9, 'coverage': 400,
+                      'ratios': {'emBB': 0.5, 'mMTC': 0.4, 'URLLC': 0.1}, 'x': 250, 'y': 250})
+    client_params = copy.deepcopy(CLIENT_PARAMS)
+    client_params['mobility_patterns'] = {
+        'car': {'distribution': 'randint', 'params': (-40, 40), 'client_weight': 0.5}}
+    random.seed(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        nw = Network(bs_params, SLICE_PARAMS, client_params, n_clients=300,
+                     client_rng=np.random.default_rng(0), history_size=history_size)
+    nw.seed(0)
+    nw.use_scheduler(scheduler)
+    nw.reset()
+    run(nw, 5)
+    return nw
+
+
+def run(nw, n_steps):
+    trajectory = []
+    for t in range(n_steps):
+        state, _, reward, done, _ = nw.step((3*t) % len(nw.action_list))
+        trajectory.append((state.copy(), reward, done))
+        ## Closes the Stats interval, so the histories grow
+        nw.stats.collect_step()
+        if done:
+            nw.reset()
+    histories = {}
+    for name in HISTORIES:
+        history = getattr(nw.stats, name)
+        histories[name] = list(history) if isinstance(history, list) else history.values().tolist()
+    return trajectory, histories
+
+
+def assert_same(a, b):
+    for (state_a, reward_a, done_a), (state_b, reward_b, done_b) in zip(a[0], b[0]):
+        np.testing.assert_array_equal(state_a, state_b)
+        assert reward_a == reward_b and done_a == done_b
+    assert a[1] == b[1]
+
+
+@pytest.mark.parametrize('history_size, scheduler', [(None, False), (8, False), (None, True)])
+def test_restore_replays_trajectory(history_size, scheduler):
+    nw = make_network(history_size, scheduler)
+    snapshot = nw.snapshot()
+    first = run(nw, 20)
+    nw.restore(snapshot)
+    assert_same(run(nw, 20), first)
+    ## The snapshot stays reusable
+    nw.restore(snapshot)
+    assert_same(run(nw, 20), first)
+
+
+@pytest.mark.parametrize('history_size, scheduler', [(None, False), (8, False), (None, True)])
+def test_fork_replays_trajectory(history_size, scheduler):
+    nw = make_network(history_size, scheduler)
+    snapshot = nw.snapshot()
+    fork = nw.fork()[0]
+    forked = run(fork, 20)
+    nw.restore(snapshot)
+    assert_same(run(nw, 20), forked)
@@ -0,0 +1,56 @@
+'''
+Running aggregates of Stats against the full recount of its
+debug mode, on a mobile scenario with blocks and handovers
+'''
+import contextlib
+import copy
+import io
+import random
+
+import numpy as np
+import pytest
+
+from main import BS_PARAMS, SLICE_PARAMS, CLIENT_PARAMS
+from Network import Network
+
+
+def make_network(fair=False):
+    bs_params = []
+    for x, y in ((250, 250), (750, 250), (250, 750), (750, 750)):
+        bs = copy.deepcopy(BS_PARAMS[0])
+        bs.update(capacity_bandwidth=2e8, coverage=400, x=x, y=y)
+        bs_params.append(bs)
+    client_params = copy.deepcopy(CLIENT_PARAMS)
+    client_params['mobility_patterns'] = {
+        'car': {'distribution': 'randint', 'params': (-40, 40), 'client_weight': 0.5},
+        'walk': {'distribution': 'randint', 'params': (-5, 5), 'client_weight': 0.5}}
+    random.seed(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        nw = Network(bs_params, SLICE_PARAMS, client_params, n_clients=500,
+                     client_rng=np.random.default_rng(0))
+    nw.seed(0)
+    nw.use_fair_allocation(fair)
+    nw.stats.debug = True
+    nw.reset()
+    return nw
+
+
+@pytest.mark.parametrize('fair', [False, True])
+def test_running_aggregates_match_recount(fair):
+    nw = make_network(fair)
+    for t in range(40):
+        _, _, _, done, _ = nw.step(t % len(nw.action_list))
+        ## Every getter recounts and raises on a mismatch
+        nw.stats.collect_step()
+        if done:
+            nw.reset()
+    assert sum(nw.stats.handover_count) > 0
+    assert sum(nw.stats.block_count) > 0
+
+
+def test_debug_mode_catches_a_drift():
+    nw = make_network()
+    nw.step(0)
+    nw.stats.connected_count += 1
+    with pytest.raises(AssertionError, match='total_connected_users_ratio'):
+        nw.stats.get_total_connected_users_ratio()
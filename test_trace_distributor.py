@@ -0,0 +1,77 @@
+'''
+TraceDistributor: wrap-around at the end of the trace, start
+offsets, seek() and seeded offsets, forks and pickling
+'''
+import pickle
+
+import numpy as np
+import pytest
+
+from TraceDistributor import TraceDistributor
+
+
+@pytest.fixture
+def trace(tmp_path):
+    records = np.zeros(1000, dtype=[('time', 'f4'), ('size', 'i8')])
+    records['time'] = np.arange(1000) * 0.5
+    records['size'] = np.arange(1000) * 1000
+    path = tmp_path / 'trace.npy'
+    np.save(path, records)
+    return str(path)
+
+
+def test_wraps_around_from_offset(trace):
+    d = TraceDistributor('emBB', trace, field='size', offset=995, block_size=4)
+    assert d.generate_batch(8).tolist() == [1000.0 * i for i in (995, 996, 997, 998, 999, 0, 1, 2)]
+    assert d.generate() == 3000.0
+
+
+def test_raw_trace_wraps_across_blocks(tmp_path):
+    path = tmp_path / 'trace.raw'
+    np.arange(10, dtype=np.int32).tofile(path)
+    d = TraceDistributor('mMTC', str(path), dtype=np.int32, block_size=3)
+    assert [d.generate() for _ in range(23)] == [float(i % 10) for i in range(23)]
+
+
+def test_seek_and_seed_rewind(trace):
+    d = TraceDistributor('emBB', trace, field='size', offset=10)
+    d.generate_batch(5)
+    d.seek(500)
+    assert d.generate_batch(2).tolist() == [500000.0, 501000.0]
+    d.seed()
+    assert d.generate() == 500000.0
+    ## Offsets past the end wrap
+    d.seek(1003)
+    assert d.generate() == 3000.0
+
+
+def test_seeded_offsets(trace):
+    starts = []
+    for seed in (1, 2, 1):
+        d = TraceDistributor('emBB', trace, field='size', offset=None)
+        d.seed(seed)
+        starts.append(d.generate())
+    assert starts[0] == starts[2]
+    assert starts[0] != starts[1]
+
+
+def test_fork_and_pickle_keep_their_own_position(trace):
+    d = TraceDistributor('emBB', trace, field='size', offset=20, block_size=4)
+    d.generate_batch(3)
+    fork = d.fork()
+    assert fork.generate_batch(6).tolist() == [1000.0 * i for i in range(23, 29)]
+    assert d.generate() == 23000.0
+    copy = pickle.loads(pickle.dumps(d))
+    assert copy.generate() == d.generate() == 24000.0
+
+
+def test_time_field_is_streamed_as_values(trace):
+    d = TraceDistributor('emBB', trace, field='time', offset=998)
+    assert d.generate_batch(3).tolist() == [499.0, 499.5, 0.0]
+
+
+def test_empty_trace_is_rejected(tmp_path):
+    path = tmp_path / 'empty.npy'
+    np.save(path, np.zeros(0))
+    with pytest.raises(ValueError):
+        TraceDistributor('emBB', str(path))
@@ -0,0 +1,48 @@
+'''
+TrajectoryWriter/TrajectoryReader round trip over several
+chunks, and appending to an existing directory
+'''
+import numpy as np
+
+from Trajectory import TrajectoryReader, TrajectoryWriter
+
+
+def records(n, seed):
+    rng = np.random.default_rng(seed)
+    return [(rng.random(6), (0.05, -0.025, -0.025), float(rng.normal()), bool(rng.random() < 0.2))
+            for _ in range(n)]
+
+
+def write(directory, data):
+    with TrajectoryWriter(directory, chunk_size=10) as writer:
+        for record in data:
+            writer.write(*record)
+
+
+def check(reader, data):
+    assert len(reader) == len(data)
+    np.testing.assert_array_equal(reader.load('state'), np.array([r[0] for r in data], dtype=np.float32))
+    np.testing.assert_array_equal(reader.load('action'), np.array([r[1] for r in data], dtype=np.float32))
+    np.testing.assert_array_equal(reader.load('reward'), [r[2] for r in data])
+    np.testing.assert_array_equal(reader.load('done'), [r[3] for r in data])
+    for (state, action, reward, done), record in zip(reader, data):
+        np.testing.assert_array_equal(state, np.float32(record[0]))
+        assert reward == record[2] and done == record[3]
+
+
+def test_round_trip_over_chunks(tmp_path):
+    data = records(25, 0)
+    write(tmp_path, data)
+    reader = TrajectoryReader(tmp_path)
+    assert reader.n_chunks == 3
+    assert [len(chunk['done']) for chunk in reader.chunks(mmap=False)] == [10, 10, 5]
+    check(reader, data)
+
+
+def test_append_to_existing_directory(tmp_path):
+    first, second = records(25, 0), records(7, 1)
+    write(tmp_path, first)
+    write(tmp_path, second)
+    reader = TrajectoryReader(tmp_path)
+    assert reader.n_chunks == 4
+    check(reader, first + second)
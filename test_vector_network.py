@@ -0,0 +1,65 @@
+'''
+VectorNetwork against the same environments stepped as
+separate Networks: rewards, dones, states and terminal
+observations must be identical
+'''
+import contextlib
+import copy
+import io
+import random
+
+import numpy as np
+
+from main import BS_PARAMS, SLICE_PARAMS, CLIENT_PARAMS
+from Network import Network
+from VectorNetwork import VectorNetwork
+
+
+def make_networks(n_envs):
+    bs_params = copy.deepcopy(BS_PARAMS)
+    bs_params.append({'capacity_bandwidth': 1e9, 'coverage': 600,
+                      'ratios': {'emBB': 0.5, 'mMTC': 0.4, 'URLLC': 0.1}, 'x': 200, 'y': 200})
+    random.seed(0)
+    networks = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for env in range(n_envs):
+            nw = Network(bs_params, SLICE_PARAMS, CLIENT_PARAMS, client_rng=np.random.default_rng(env))
+            nw.seed(env)
+            nw.reset()
+            networks.append(nw)
+    return networks
+
+
+def check_step(networks, states, rewards, dones, info, actions, envs):
+    for row, env in enumerate(envs):
+        state, _, reward, done, _ = networks[env].step(int(actions[row]))
+        observation = info['terminal_observation'][row] if done else states[row]
+        np.testing.assert_array_equal(state, observation)
+        assert reward == rewards[row]
+        assert done == dones[row]
+        if done:
+            np.testing.assert_array_equal(networks[env].reset(), states[row])
+
+
+def test_vector_network_matches_networks():
+    networks = make_networks(4)
+    vector_network = VectorNetwork(copy.deepcopy(networks))
+    rng = np.random.default_rng(0)
+    n_done = 0
+    for _ in range(150):
+        actions = rng.integers(len(vector_network.action_list), size=len(networks))
+        states, _, rewards, dones, info = vector_network.step(actions)
+        check_step(networks, states, rewards, dones, info, actions, range(len(networks)))
+        n_done += int(dones.sum())
+    assert n_done > 0
+
+
+def test_vector_network_steps_a_subset():
+    networks = make_networks(4)
+    vector_network = VectorNetwork(copy.deepcopy(networks))
+    rng = np.random.default_rng(1)
+    for _ in range(100):
+        envs = np.flatnonzero(rng.random(len(networks)) < 0.5)
+        actions = rng.integers(len(vector_network.action_list), size=envs.size)
+        states, _, rewards, dones, info = vector_network.step(actions, envs)
+        check_step(networks, states, rewards, dones, info, actions, envs.tolist())
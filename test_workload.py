@@ -0,0 +1,65 @@
+'''
+A Workload saved as .npz replays the same requests after
+Workload.load()
+'''
+import contextlib
+import io
+import random
+
+import numpy as np
+import pytest
+
+from main import BS_PARAMS, SLICE_PARAMS, CLIENT_PARAMS
+from Network import Network
+from Workload import Workload
+
+
+def make_network():
+    random.seed(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        nw = Network(BS_PARAMS, SLICE_PARAMS, CLIENT_PARAMS, n_clients=300,
+                     client_rng=np.random.default_rng(0))
+    return nw
+
+
+def run(nw, workload, seed, n_steps):
+    nw.use_workload(workload)
+    nw.seed(seed)
+    nw.reset()
+    trajectory = []
+    for t in range(n_steps):
+        state, _, reward, done, _ = nw.step(t % len(nw.action_list))
+        trajectory.append((state.copy(), reward, done))
+        ## reset() replays the workload from its first step
+        if done:
+            nw.reset()
+    population = nw.population
+    return trajectory, population.total_request_count.copy(), population.total_usage.copy()
+
+
+def test_saved_workload_replays_after_load(tmp_path):
+    nw = make_network()
+    workload = Workload.generate(nw.population, 30, seed=1)
+    workload.save(tmp_path / 'workload.npz')
+    loaded = Workload.load(tmp_path / 'workload.npz')
+    assert loaded.n_clients == workload.n_clients
+    for name in ('offsets', 'client_ids', 'arrivals', 'usage'):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(workload, name))
+
+    ## The env seed does not change the replayed requests
+    original = run(nw, workload, 0, 30)
+    replayed = run(make_network(), loaded, 7, 30)
+    for (state_a, reward_a, done_a), (state_b, reward_b, done_b) in zip(original[0], replayed[0]):
+        np.testing.assert_array_equal(state_a, state_b)
+        assert reward_a == reward_b and done_a == done_b
+    np.testing.assert_array_equal(original[1], replayed[1])
+    np.testing.assert_array_equal(original[2], replayed[2])
+    assert original[1].sum() > 0
+
+
+def test_workload_for_other_population_is_rejected():
+    nw = make_network()
+    workload = Workload.generate(nw.population, 3, seed=1)
+    workload.n_clients += 1
+    with pytest.raises(ValueError):
+        nw.use_workload(workload)
@@ -1,6 +1,12 @@
+import copy
 import math
 import numpy as np
-from sklearn.neighbors import KDTree as kdt
+
+from Coverage import CoverageGrid, distance_matrix
+
+## Layouts up to this many base stations are searched by
+## brute force, larger ones load sklearn's KDTree
+BRUTE_FORCE_LIMIT = 32
 
 def distance(a, b):
     return math.sqrt(sum((i-j)**2 for i,j in zip(a, b)))
@@ -11,36 +17,216 @@ def kdtree(clients, base_stations):
     c_coor = np.array([(c.x,c.y) for c in clients])
     bs_coor = np.array([p.coverage.center for p in base_stations])
 
-    tree = kdt(bs_coor, leaf_size=2)
+    tree = build_tree(bs_coor)
     res = tree.query(c_coor, k=min(5, len(base_stations)))
 
     for c, d, p in zip(clients, res[0], res[1]):
         if d[0] <= base_stations[p[0]].coverage.radius:
             c.base_station = base_stations[p[0]]
+        c.closest_base_stations = [(a, base_stations[b]) for a, b in zip(d, p)]
+
+class NearestCenters:
+    '''
+    Pure NumPy stand-in for a KDTree over a few base station
+    centers. query() returns the same (distances, indices)
+    arrays, sorted by distance, by measuring every point
+    against every center in chunks of rows
+    '''
+    chunk_size = 16384
+
+    def __init__(self, centers):
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+
+    def query(self, points, k=1):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        distances = np.empty((len(points), k))
+        indices = np.empty((len(points), k), dtype=np.int64)
+        for start in range(0, len(points), self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            d = distance_matrix(points[chunk, 0], points[chunk, 1], self.centers)
+            if k < d.shape[1]:
+                p = np.argpartition(d, k - 1, axis=1)[:, :k]
+                d = np.take_along_axis(d, p, axis=1)
+            else:
+                p = np.broadcast_to(np.arange(d.shape[1]), d.shape)
+            order = np.argsort(d, axis=1, kind='stable')
+            distances[chunk] = np.take_along_axis(d, order, axis=1)
+            indices[chunk] = np.take_along_axis(p, order, axis=1)
+        return distances, indices
+
+
+def build_tree(centers):
+    '''
+    Nearest-center search over a base station layout
+    '''
+    if len(centers) <= BRUTE_FORCE_LIMIT:
+        return NearestCenters(centers)
+    from sklearn.neighbors import KDTree
+    return KDTree(centers, leaf_size=2)
+
+
+class AssociationIndex:
+    '''
+    Caches the k nearest base stations of every client.
+    The KD-tree is built once per base station layout and
+    update() only re-queries the clients whose position
+    changed since the previous call. Base stations beyond
+    the k nearest are reached through the coverage grid.
+    Clients that move without crossing a coverage boundary
+    keep their neighbours as long as no other base station
+    can have come closer than the k-th one, see move()
+    '''
+    def __init__(self, base_stations, limit=5):
+        self.base_stations = base_stations
+        self.n_base_stations = len(base_stations)
+        self.centers = np.array([bs.coverage.center for bs in base_stations], dtype=np.float64)
+        self.radius = np.array([bs.coverage.radius for bs in base_stations], dtype=np.float64)
+        self.coverage = CoverageGrid(self.centers, self.radius)
+        self.k = min(limit, len(base_stations))
+        self.tree = build_tree(self.centers)
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.distances = np.empty((0, self.k))
+        self.neighbors = np.empty((0, self.k), dtype=np.int64)
+        self.stale = np.zeros(0, dtype=bool)
+        ## Position of the last tree query and half the gap
+        ## between the k-th and (k+1)-th distances found there
+        self.query_x = np.empty(0)
+        self.query_y = np.empty(0)
+        self.margin = np.empty(0)
+        self.max_radius = self.radius.max() if len(self.radius) else 0.0
+
+    def update(self, x, y):
+        '''
+        Refreshes the neighbour lists of the clients that moved
+        and returns their indices
+        '''
+        if len(x) != len(self.x):
+            self.x = np.full(len(x), np.nan)
+            self.y = np.full(len(y), np.nan)
+            self.distances = np.empty((len(x), self.k))
+            self.neighbors = np.empty((len(x), self.k), dtype=np.int64)
+            self.stale = np.zeros(len(x), dtype=bool)
+            self.query_x = np.full(len(x), np.nan)
+            self.query_y = np.full(len(y), np.nan)
+            self.margin = np.zeros(len(x))
+        changed = np.flatnonzero((x != self.x) | (y != self.y))
+        if changed.size:
+            self.x[changed] = x[changed]
+            self.y[changed] = y[changed]
+            self.query(changed)
+        return changed
+
+    def query(self, indices):
+        '''
+        Looks up the k nearest base stations of the clients at
+        their current position. One more is asked for to know
+        how far the clients can move before it may overtake
+        the k-th one
+        '''
+        if indices.size == 0:
+            return
+        k = min(self.k + 1, self.n_base_stations)
+        d, p = self.tree.query(np.column_stack((self.x[indices], self.y[indices])), k=k)
+        self.distances[indices] = d[:, :self.k]
+        self.neighbors[indices] = p[:, :self.k]
+        self.margin[indices] = (d[:, self.k] - d[:, self.k - 1]) / 2 if k > self.k else np.inf
+        self.query_x[indices] = self.x[indices]
+        self.query_y[indices] = self.y[indices]
+        self.stale[indices] = False
+
+    def move(self, x, y, moved, base_station_index):
+        '''
+        Follows clients that moved. The clients that crossed a
+        coverage boundary (left the coverage of their base
+        station, or entered one while unattached) are queried
+        again and returned. So are the clients that moved
+        farther than their margin from the last query, where a
+        base station outside the cached k may have become one
+        of the k nearest. For the rest the distances to their
+        cached neighbours are refreshed and re-sorted
+        '''
+        if len(x) != len(self.x):
+            ## Nothing cached yet, update() queries every client
+            return np.empty(0, dtype=np.int64)
+        self.x[moved] = x[moved]
+        self.y[moved] = y[moved]
+        attached = base_station_index[moved] >= 0
+        crossed = np.zeros(moved.size, dtype=bool)
+        crossed[attached] = ~self.coverage.covers(x[moved[attached]], y[moved[attached]],
+                                                  base_station_index[moved[attached]])
+        crossed[~attached] = self.coverage.nearest(x[moved[~attached]], y[moved[~attached]]) >= 0
+
+        kept = moved[~crossed]
+        drift = np.hypot(x[kept] - self.query_x[kept], y[kept] - self.query_y[kept])
+        far = drift > self.margin[kept]
+        self.query(np.concatenate((moved[crossed], kept[far])))
+        self.stale[kept[~far]] = True
+        return moved[crossed]
+
+    def neighbor_distances(self, indices):
+        '''
+        Distances to the cached neighbours of the given clients.
+        Rows left stale by move() are recomputed and re-sorted
+        here, so only the clients that need them pay for it
+        '''
+        stale = indices[self.stale[indices]]
+        if stale.size:
+            stale = np.unique(stale)
+            neighbors = self.neighbors[stale]
+            dx = self.x[stale][:, None] - self.coverage.center_x[neighbors]
+            dy = self.y[stale][:, None] - self.coverage.center_y[neighbors]
+            d = np.sqrt(dx*dx + dy*dy)
+            order = np.argsort(d, axis=1)
+            self.distances[stale] = np.take_along_axis(d, order, axis=1)
+            self.neighbors[stale] = np.take_along_axis(self.neighbors[stale], order, axis=1)
+            self.stale[stale] = False
+        return self.distances[indices]
+
+    def nearest_in_coverage(self, indices):
+        '''
+        Closest base station of each client, -1 when
+        it does not cover the client
+        '''
+        nearest = self.neighbors[indices, 0]
+        covered = self.distances[indices, 0] <= self.radius[nearest]
+        return np.where(covered, nearest, -1)
+
+    def snapshot(self):
+        return {name: getattr(self, name).copy() for name in
+                ('x', 'y', 'distances', 'neighbors', 'stale', 'query_x', 'query_y', 'margin')}
+
+    def restore(self, state):
+        for name, value in state.items():
+            current = getattr(self, name)
+            if current.shape == value.shape:
+                np.copyto(current, value)
+            else:
+                setattr(self, name, value.copy())
+
+    def fork(self):
+        '''
+        Copy with its own neighbour cache, sharing the
+        tree and the coverage grid
+        '''
+        association = copy.copy(self)
+        for name, value in self.snapshot().items():
+            setattr(association, name, value)
+        return association
+
+    def covering(self, indices):
+        '''
+        Every base station covering each of the given clients,
+        see CoverageGrid.pairs(). Rows index into indices
+        '''
+        return self.coverage.pairs(self.x[indices], self.y[indices])
 
-# class KDTree:
-#     last_run_time = 0
-#     limit = 5
-
-#     # Initial connections using k-d tree
-#     @staticmethod
-#     def run(clients, base_stations, run_at, assign=True):
-#         print(f'KDTREE CALL [{run_at}] - limit: {KDTree.limit}')
-#         if run_at == KDTree.last_run_time:
-#             return
-#         KDTree.last_run_time = run_at
-        
-#         c_coor = [(c.x,c.y) for c in clients]
-#         bs_coor = [p.coverage.center for p in base_stations]
-
-#         tree = kdt(bs_coor, leaf_size=2)
-#         res = tree.query(c_coor,k=min(KDTree.limit,len(base_stations)))
-
-#         # print(res[0])
-#         for c, d, p in zip(clients, res[0], res[1]):
-#             if assign and d[0] <= base_stations[p[0]].coverage.radius:
-#                 c.base_station = base_stations[p[0]]    
-#             c.closest_base_stations = [(a, base_stations[b]) for a,b in zip(d,p)]
+    def closest_base_stations(self, index):
+        if index >= len(self.neighbors):
+            return []
+        self.neighbor_distances(np.array([index]))
+        return [(d, self.base_stations[p]) for d, p in
+                zip(self.distances[index].tolist(), self.neighbors[index].tolist())]
 
 
 def format_bps(size, pos=None, return_float=False):